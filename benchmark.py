@@ -5,6 +5,7 @@ import time
 import argparse
 import platform
 import json
+import subprocess
 from cryptography.hazmat.primitives.asymmetric import ed25519
 from cryptography.hazmat.primitives import serialization
 import hashlib
@@ -32,12 +33,260 @@ def create_test_file(file_path):
         f.write(content)
 
 def compute_file_hash(file_path):
+    sha256 = hashlib.sha256()
+    buf = bytearray(1024 * 1024)
+    view = memoryview(buf)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            sha256.update(view[:n])
+    return sha256.hexdigest()
+
+def legacy_compute_file_hash(file_path):
+    # The original 16 KiB read loop, kept as the hashing benchmark baseline.
     sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
         for chunk in iter(lambda: f.read(16384), b""):
             sha256.update(chunk)
     return sha256.hexdigest()
 
+def parse_size(text):
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    text = text.strip().upper()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def hash_benchmark(sizes, work_dir, algorithms=("sha256", "blake2b")):
+    # Compare the legacy loop against the size-aware strategies in core.hashing.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+    from core.hashing import compute_file_digest
+
+    os.makedirs(work_dir, exist_ok=True)
+    print(f"\n{'Size':>8} {'Method':<18} {'Seconds':>9} {'MiB/s':>10}")
+    for size_text in sizes:
+        size = parse_size(size_text)
+        file_path = os.path.join(work_dir, f"hash_bench_{size_text}.bin")
+        with open(file_path, "wb") as f:
+            remaining = size
+            block = os.urandom(min(size, 1024 * 1024)) or b""
+            while remaining > 0:
+                f.write(block[:remaining])
+                remaining -= len(block)
+
+        methods = [("legacy-16k-sha256", legacy_compute_file_hash)]
+        for algorithm in algorithms:
+            methods.append((f"auto-{algorithm}", lambda p, a=algorithm: compute_file_digest(p, a)))
+        for name, fn in methods:
+            start = time.perf_counter()
+            fn(file_path)
+            elapsed = time.perf_counter() - start
+            rate = size / (1024 * 1024) / elapsed if elapsed > 0 else float("inf")
+            print(f"{size_text:>8} {name:<18} {elapsed:>9.4f} {rate:>10.1f}")
+        os.remove(file_path)
+
+def pdf_benchmark(sizes, work_dir):
+    # Compare a full pikepdf rewrite against an incremental update when
+    # embedding into PDFs of increasing size, plus metadata extraction.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+    import pikepdf
+    from adapters.pdf import PDFAdapter
+
+    os.makedirs(work_dir, exist_ok=True)
+    metadata = {"compliance_tag": "GDPR", "file_hash": "0" * 64}
+    print(f"\n{'Size':>8} {'Mode':<12} {'Embed s':>9} {'Extract s':>10} {'Growth B':>9}")
+    for size_text in sizes:
+        size = parse_size(size_text)
+        source_path = os.path.join(work_dir, f"pdf_bench_{size_text}.pdf")
+        pdf = pikepdf.new()
+        pdf.add_blank_page()
+        # An opaque payload stands in for scanned page images.
+        pdf.pages[0].Resources = pikepdf.Dictionary(
+            XObject=pikepdf.Dictionary(Im0=pikepdf.Stream(pdf, os.urandom(size))))
+        pdf.save(source_path)
+        pdf.close()
+
+        for mode, adapter in (("rewrite", PDFAdapter(incremental=False)), ("incremental", PDFAdapter())):
+            file_path = os.path.join(work_dir, f"pdf_bench_{size_text}_{mode}.pdf")
+            with open(source_path, "rb") as src, open(file_path, "wb") as dst:
+                while True:
+                    block = src.read(1024 * 1024)
+                    if not block:
+                        break
+                    dst.write(block)
+            before = os.path.getsize(file_path)
+            start = time.perf_counter()
+            adapter.embed_metadata(file_path, metadata)
+            embed_elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            assert adapter.extract_metadata(file_path) == metadata
+            extract_elapsed = time.perf_counter() - start
+            growth = os.path.getsize(file_path) - before
+            print(f"{size_text:>8} {mode:<12} {embed_elapsed:>9.4f} {extract_elapsed:>10.4f} {growth:>9}")
+            os.remove(file_path)
+        os.remove(source_path)
+
+def image_benchmark(dimensions, work_dir):
+    # Compare a PIL decode and re-encode against the byte-level segment
+    # writer when embedding into JPEG and PNG images.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+    from PIL import Image, PngImagePlugin
+    from adapters.image import ImageAdapter
+
+    os.makedirs(work_dir, exist_ok=True)
+    adapter = ImageAdapter()
+    metadata = {"compliance_tag": "GDPR", "file_hash": "0" * 64}
+    metadata_str = json.dumps(metadata)
+    print(f"\n{'Size':>11} {'Format':<6} {'Re-encode s':>12} {'Segment s':>10} {'Extract s':>10}")
+    for dimension in dimensions:
+        width, height = (int(part) for part in dimension.lower().split("x"))
+        img = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+        for fmt, suffix in (("JPEG", "jpg"), ("PNG", "png")):
+            file_path = os.path.join(work_dir, f"image_bench_{dimension}.{suffix}")
+            img.save(file_path, fmt)
+
+            start = time.perf_counter()
+            decoded = Image.open(file_path)
+            if fmt == "PNG":
+                info = PngImagePlugin.PngInfo()
+                info.add_text("METL_METADATA", metadata_str)
+                decoded.save(file_path, pnginfo=info)
+            else:
+                decoded.info["comment"] = metadata_str
+                decoded.save(file_path, "JPEG", quality=95)
+            reencode_elapsed = time.perf_counter() - start
+
+            start = time.perf_counter()
+            adapter.embed_metadata(file_path, metadata)
+            segment_elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            assert adapter.extract_metadata(file_path) == metadata
+            extract_elapsed = time.perf_counter() - start
+            print(f"{dimension:>11} {fmt:<6} {reencode_elapsed:>12.4f} {segment_elapsed:>10.4f} {extract_elapsed:>10.4f}")
+            os.remove(file_path)
+
+def docx_benchmark(sizes, work_dir):
+    # Compare a python-docx load and save against the direct zip patch
+    # when embedding into documents carrying large media parts.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+    from docx import Document
+    from docx.opc.constants import RELATIONSHIP_TYPE as RT
+    from docx.opc.packuri import PackURI
+    from docx.opc.part import Part
+    from adapters.docx import DOCXAdapter
+
+    os.makedirs(work_dir, exist_ok=True)
+    metadata = {"compliance_tag": "GDPR", "file_hash": "0" * 64}
+    print(f"\n{'Size':>8} {'Mode':<11} {'Embed s':>9} {'Extract s':>10}")
+    for size_text in sizes:
+        size = parse_size(size_text)
+        source_path = os.path.join(work_dir, f"docx_bench_{size_text}.docx")
+        doc = Document()
+        doc.add_paragraph("METL benchmark document")
+        # A related binary part stands in for embedded photos and video.
+        payload = Part(PackURI("/word/media/payload.bin"), "application/octet-stream",
+                       os.urandom(size), doc.part.package)
+        doc.part.relate_to(payload, RT.IMAGE)
+        doc.save(source_path)
+
+        for mode, adapter in (("python-docx", DOCXAdapter(direct=False)), ("direct", DOCXAdapter())):
+            file_path = os.path.join(work_dir, f"docx_bench_{size_text}_{mode}.docx")
+            with open(source_path, "rb") as src, open(file_path, "wb") as dst:
+                while True:
+                    block = src.read(1024 * 1024)
+                    if not block:
+                        break
+                    dst.write(block)
+            start = time.perf_counter()
+            adapter.embed_metadata(file_path, metadata)
+            embed_elapsed = time.perf_counter() - start
+            start = time.perf_counter()
+            assert adapter.extract_metadata(file_path) == metadata
+            extract_elapsed = time.perf_counter() - start
+            print(f"{size_text:>8} {mode:<11} {embed_elapsed:>9.4f} {extract_elapsed:>10.4f}")
+            os.remove(file_path)
+        os.remove(source_path)
+
+def async_benchmark(count, work_dir, workers=4):
+    # Embed count files from inside an event loop, blocking vs through the
+    # async API, while a probe task measures how late its 5 ms sleeps wake.
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "src"))
+    import asyncio
+    from core.aio import AsyncExecutor
+    from core.cryptography import generate_key_pair as engine_key_pair
+    from core.metadata import MetadataEngine
+
+    os.makedirs(work_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(work_dir, f"async_bench_{i}.bin")
+        with open(path, "wb") as f:
+            f.write(os.urandom(256 * 1024))
+        paths.append(path)
+    private_key, _ = engine_key_pair()
+    engine = MetadataEngine(ai_config={"enabled": False}, async_executor=AsyncExecutor({"max_workers": workers}))
+
+    async def probe(stop, lags):
+        while not stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lags.append(time.perf_counter() - start - 0.005)
+
+    async def run(mode):
+        stop, lags = asyncio.Event(), []
+        probe_task = asyncio.create_task(probe(stop, lags))
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        if mode == "blocking":
+            for path in paths:
+                engine.embed_metadata(path, {"compliance_tag": "GDPR"}, private_key)
+        else:
+            await asyncio.gather(*(engine.aembed_metadata(path, {"compliance_tag": "GDPR"}, private_key)
+                                   for path in paths))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await probe_task
+        lags.sort()
+        print(f"{mode:<9} {elapsed:>9.3f} {len(lags):>7} {lags[len(lags) // 2] * 1000:>13.1f} "
+              f"{lags[-1] * 1000:>12.1f}")
+
+    print(f"\n{count} files of 256 KiB, {workers} workers")
+    print(f"{'Mode':<9} {'Total s':>9} {'Probes':>7} {'Median lag ms':>13} {'Max lag ms':>12}")
+    for mode in ("blocking", "async"):
+        asyncio.run(run(mode))
+    engine.async_executor.shutdown()
+    for path in paths:
+        os.remove(path)
+        os.remove(f"{path}.metl.json")
+
+def import_time_benchmark(runs=7):
+    # Median wall time of CLI start-up, plus the cumulative import time of
+    # interfaces.cli as reported by -X importtime.
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
+    env = dict(os.environ, PYTHONPATH=src_dir)
+    commands = [
+        ("python -c pass", [sys.executable, "-c", "pass"]),
+        ("metl --help", [sys.executable, "-m", "interfaces.cli", "--help"]),
+    ]
+    print(f"\n{'Command':<16} {'Median ms':>10}")
+    for name, command in commands:
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(command, env=env, capture_output=True, check=True)
+            times.append(time.perf_counter() - start)
+        print(f"{name:<16} {sorted(times)[runs // 2] * 1000:>10.1f}")
+
+    totals = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import interfaces.cli"],
+                                env=env, capture_output=True, text=True, check=True)
+        last = result.stderr.strip().splitlines()[-1]
+        totals.append(int(last.split("|")[1]))
+    print(f"{'import cli':<16} {sorted(totals)[runs // 2] / 1000:>10.1f}")
+
 def embed_metadata(file_path, metadata_dict, private_key):
     # Compute file hash
     file_hash = compute_file_hash(file_path)
@@ -162,8 +411,49 @@ def main():
     parser.add_argument("--verify-iterations", type=int, default=5)
     parser.add_argument("--embed-batch", type=int, default=1)
     parser.add_argument("--verify-batch", type=int, default=1)
+    parser.add_argument("--hash-sizes", default=None,
+                        help="Comma-separated file sizes to hash-benchmark instead, e.g. 1K,1M,100M,1G,10G")
+    parser.add_argument("--pdf-sizes", default=None,
+                        help="Comma-separated PDF sizes to benchmark rewrite vs incremental embedding, e.g. 1M,100M,500M")
+    parser.add_argument("--image-sizes", default=None,
+                        help="Comma-separated image dimensions to benchmark re-encoding vs segment embedding, e.g. 1000x1000,6000x4000")
+    parser.add_argument("--docx-sizes", default=None,
+                        help="Comma-separated media sizes to benchmark python-docx vs direct DOCX embedding, e.g. 1M,100M")
+    parser.add_argument("--async-files", type=int, default=None,
+                        help="Number of files to embed from an event loop, blocking vs the async API")
+    parser.add_argument("--import-time", action="store_true",
+                        help="Measure CLI start-up and import time instead")
     args = parser.parse_args()
 
+    if args.import_time:
+        import_time_benchmark()
+        return
+
+    if args.async_files:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        async_benchmark(args.async_files, os.path.join(script_dir, "examples", "sample_files"))
+        return
+
+    if args.pdf_sizes:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        pdf_benchmark(args.pdf_sizes.split(","), os.path.join(script_dir, "examples", "sample_files"))
+        return
+
+    if args.image_sizes:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        image_benchmark(args.image_sizes.split(","), os.path.join(script_dir, "examples", "sample_files"))
+        return
+
+    if args.docx_sizes:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        docx_benchmark(args.docx_sizes.split(","), os.path.join(script_dir, "examples", "sample_files"))
+        return
+
+    if args.hash_sizes:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        hash_benchmark(args.hash_sizes.split(","), os.path.join(script_dir, "examples", "sample_files"))
+        return
+
     # Generate keys and test sign/verify in-memory
     private_key, public_key = generate_key_pair()
 
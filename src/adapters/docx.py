@@ -1,16 +1,53 @@
-from docx import Document
 import json
+import os
+import struct
+import zipfile
+import zlib
+from core.hashing import compute_file_digest
+from adapters.splice import hash_pieces, splice_file
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+CORE_PROPERTIES_PART = "docProps/core.xml"
+DC_NAMESPACE = "http://purl.org/dc/elements/1.1/"
+# python-docx's core_properties.comments is dc:description.
+_DESCRIPTION_TAG = f"{{{DC_NAMESPACE}}}description"
+
+_EOCD = struct.Struct("<4s4H2LH")
+_CENTRAL_HEADER = struct.Struct("<4s6H3L5H2L")
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_EOCD_SIGNATURE = b"PK\x05\x06"
+_ZIP64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+_CENTRAL_SIGNATURE = b"PK\x01\x02"
+_LOCAL_SIGNATURE = b"PK\x03\x04"
+# Flag bit 3: sizes and CRC follow the data in a data descriptor.
+_FLAG_DATA_DESCRIPTOR = 0x08
+_MAX_COMMENT = 65535
+
+
 class DOCXAdapter:
+    """
+    Stores METL metadata in the DOCX core properties (the comments field).
+
+    By default only docProps/core.xml is rewritten. Every other zip member
+    is copied as raw compressed bytes and the central directory is patched
+    with the new offsets, so nothing else is parsed, decompressed or
+    recompressed. Zip64 and multi-disk archives, and documents without a
+    core properties part, fall back to python-docx, as does direct=False.
+    """
+
+    def __init__(self, direct=True):
+        self.direct = direct
+
     def embed_metadata(self, file_path, metadata):
         try:
-            doc = Document(file_path)
             meta_json = json.dumps(metadata)
-            doc.core_properties.comments = meta_json
-            doc.save(file_path)
+            if not (self.direct and self._patch_core_properties(file_path, meta_json)):
+                from docx import Document
+                doc = Document(file_path)
+                doc.core_properties.comments = meta_json
+                doc.save(file_path)
             logger.info(f"Metadata embedded into DOCX: {file_path}")
             return True
         except Exception as e:
@@ -19,11 +56,164 @@ class DOCXAdapter:
 
     def extract_metadata(self, file_path):
         try:
-            doc = Document(file_path)
-            meta_json = doc.core_properties.comments
-            if meta_json:
-                return json.loads(meta_json)
+            # Only the central directory and the core properties member
+            # are read.
+            with zipfile.ZipFile(file_path) as archive:
+                core_xml = archive.read(CORE_PROPERTIES_PART)
+            from lxml import etree
+            description = etree.fromstring(core_xml).find(_DESCRIPTION_TAG)
+            if description is not None and description.text:
+                return json.loads(description.text)
             return {}
         except Exception as e:
             logger.error(f"Failed to extract metadata from DOCX: {e}")
             return {}
+
+    def content_digest(self, file_path, algorithm):
+        """
+        Digest over every member's name and stored bytes, with the core
+        properties hashed without the metadata, so it stays the same when
+        metadata is embedded or replaced. Archives the direct patch cannot
+        handle are hashed whole.
+        """
+        directory = _read_central_directory(file_path)
+        if directory is None:
+            return compute_file_digest(file_path, algorithm)
+        entries, cd_offset, _ = directory
+        ranges = _member_ranges(entries, cd_offset)
+        pieces = []
+        for entry in entries:
+            pieces.append(entry["raw_name"] + b"\x00")
+            if entry["name"] == CORE_PROPERTIES_PART:
+                with zipfile.ZipFile(file_path) as archive:
+                    pieces.append(_set_description(archive.read(CORE_PROPERTIES_PART), None))
+            else:
+                pieces.append(ranges[id(entry)])
+        return hash_pieces(file_path, pieces, algorithm)
+
+    def can_update_in_place(self, file_path):
+        directory = _read_central_directory(file_path)
+        return self.direct and directory is not None and any(
+            entry["name"] == CORE_PROPERTIES_PART for entry in directory[0])
+
+    def _patch_core_properties(self, file_path, meta_json):
+        # Returns False if the archive cannot be patched directly.
+        directory = _read_central_directory(file_path)
+        if directory is None:
+            return False
+        entries, cd_offset, comment = directory
+        core = next((entry for entry in entries if entry["name"] == CORE_PROPERTIES_PART), None)
+        if core is None:
+            return False
+
+        with zipfile.ZipFile(file_path) as archive:
+            core_xml = archive.read(CORE_PROPERTIES_PART)
+        data = _set_description(core_xml, meta_json)
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        name = core["raw_name"]
+        fields = list(core["fields"])
+        # Flags, method, CRC and sizes change; times, attributes and the
+        # extra and comment fields are kept.
+        fields[3] = fields[3] & ~_FLAG_DATA_DESCRIPTOR
+        fields[4] = zipfile.ZIP_DEFLATED
+        fields[7:10] = [zlib.crc32(data), len(compressed), len(data)]
+        core["fields"] = tuple(fields)
+        local_header = _LOCAL_HEADER.pack(_LOCAL_SIGNATURE, 20, fields[3], fields[4], fields[5], fields[6],
+                                          fields[7], fields[8], fields[9], len(name), 0) + name + compressed
+
+        ranges = _member_ranges(entries, cd_offset)
+        pieces = []
+        written = min(start for start, _ in ranges.values())
+        if written:
+            pieces.append((0, written))
+        for entry in sorted(entries, key=lambda entry: entry["fields"][16]):
+            start, end = ranges[id(entry)]
+            entry["new_offset"] = written
+            if entry is core:
+                pieces.append(local_header)
+                written += len(local_header)
+            else:
+                pieces.append((start, end))
+                written += end - start
+
+        central = []
+        for entry in entries:
+            fields = list(entry["fields"])
+            fields[16] = entry["new_offset"]
+            central.append(_CENTRAL_HEADER.pack(*fields) + entry["raw_name"] + entry["extra"] + entry["comment"])
+        central = b"".join(central)
+        pieces.append(central + _EOCD.pack(_EOCD_SIGNATURE, 0, 0, len(entries), len(entries),
+                                           len(central), written, len(comment)) + comment)
+        splice_file(file_path, pieces)
+        return True
+
+
+def _read_central_directory(file_path):
+    """
+    Return (entries, central directory offset, archive comment), or None
+    if the archive uses features the direct patch does not handle. Each
+    entry holds the unpacked central header fields and its raw name,
+    extra field and comment.
+    """
+    with open(file_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        tail_size = min(size, _EOCD.size + _MAX_COMMENT)
+        f.seek(size - tail_size)
+        tail = f.read()
+        position = tail.rfind(_EOCD_SIGNATURE)
+        if position == -1 or position + _EOCD.size > len(tail):
+            return None
+        _, disk, cd_disk, disk_entries, total_entries, cd_size, cd_offset, comment_length = \
+            _EOCD.unpack_from(tail, position)
+        if disk or cd_disk or disk_entries != total_entries or 0xFFFFFFFF in (cd_size, cd_offset) \
+                or total_entries == 0xFFFF or tail[max(0, position - 20):position].startswith(_ZIP64_LOCATOR_SIGNATURE):
+            return None
+        comment = tail[position + _EOCD.size:position + _EOCD.size + comment_length]
+
+        f.seek(cd_offset)
+        central = f.read(cd_size)
+    if len(central) != cd_size:
+        return None
+
+    entries = []
+    offset = 0
+    for _ in range(total_entries):
+        fields = _CENTRAL_HEADER.unpack_from(central, offset)
+        if fields[0] != _CENTRAL_SIGNATURE or 0xFFFFFFFF in fields[8:10] + fields[16:17]:
+            return None
+        name_end = offset + _CENTRAL_HEADER.size + fields[10]
+        extra_end = name_end + fields[11]
+        raw_name = central[offset + _CENTRAL_HEADER.size:name_end]
+        entries.append({
+            "fields": fields,
+            "raw_name": raw_name,
+            "name": raw_name.decode("utf-8" if fields[3] & 0x800 else "cp437"),
+            "extra": central[name_end:extra_end],
+            "comment": central[extra_end:extra_end + fields[12]],
+        })
+        offset = extra_end + fields[12]
+    return (entries, cd_offset, comment) if entries else None
+
+
+def _member_ranges(entries, cd_offset):
+    # Maps id(entry) to the (start, end) byte range holding the member's
+    # local header, data and any data descriptor.
+    by_offset = sorted(entries, key=lambda entry: entry["fields"][16])
+    ends = [entry["fields"][16] for entry in by_offset[1:]] + [cd_offset]
+    return {id(entry): (entry["fields"][16], end) for entry, end in zip(by_offset, ends)}
+
+
+def _set_description(core_xml, text):
+    # With text=None the description is removed.
+    from lxml import etree
+    root = etree.fromstring(core_xml)
+    description = root.find(_DESCRIPTION_TAG)
+    if text is None:
+        if description is not None:
+            root.remove(description)
+    else:
+        if description is None:
+            description = etree.SubElement(root, _DESCRIPTION_TAG)
+        description.text = text
+    return etree.tostring(root, xml_declaration=True, encoding="UTF-8", standalone=True)
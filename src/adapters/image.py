@@ -1,24 +1,51 @@
-from PIL import Image, PngImagePlugin
 import json
+import os
+import struct
+import zlib
+from adapters.splice import hash_pieces, splice_file
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+JPEG_SIGNATURE = b"\xff\xd8"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# JPEG comments written by METL start with this tag so they are never
+# confused with other COM segments.
+JPEG_COMMENT_TAG = b"METL\x00"
+PNG_TEXT_KEYWORD = b"METL_METADATA"
+# A JPEG segment length is 16 bits and counts itself.
+MAX_JPEG_SEGMENT = 65535 - 2
+
+_SOS = 0xDA
+_EOI = 0xD9
+_COM = 0xFE
+# Markers that stand alone without a length field.
+_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD9))
+_PNG_TEXT_CHUNKS = (b"tEXt", b"zTXt", b"iTXt")
+
+
 class ImageAdapter:
+    """
+    Stores METL metadata in JPEG and PNG files without decoding pixels.
+
+    JPEG metadata goes into a COM segment after the leading APPn segments
+    and PNG metadata into an iTXt chunk before the first IDAT. Only the
+    header segments are parsed; the compressed image data is copied byte
+    for byte, so it stays identical and the cost is one sequential copy.
+    """
+
     def embed_metadata(self, file_path, metadata):
         try:
-            img = Image.open(file_path)
-            metadata_str = json.dumps(metadata)
-            if file_path.lower().endswith(".png"):
-                meta = PngImagePlugin.PngInfo()
-                meta.add_text("METL_METADATA", metadata_str)
-                img.save(file_path, pnginfo=meta)
-            elif file_path.lower().endswith(".jpg") or file_path.lower().endswith(".jpeg"):
-                img.info["comment"] = metadata_str
-                img.save(file_path, "JPEG", quality=95)
+            payload = json.dumps(metadata).encode("utf-8")
+            kind = _image_kind(file_path)
+            if kind == "jpeg":
+                pieces = _jpeg_pieces(file_path, _jpeg_comment_segment(payload))
+            elif kind == "png":
+                pieces = _png_pieces(file_path, _png_text_chunk(payload))
             else:
                 logger.error("Unsupported image format")
                 return False
+            splice_file(file_path, pieces)
             logger.info(f"Metadata embedded into image: {file_path}")
             return True
         except Exception as e:
@@ -27,16 +54,200 @@ class ImageAdapter:
 
     def extract_metadata(self, file_path):
         try:
-            img = Image.open(file_path)
-            if file_path.lower().endswith(".png"):
-                meta = img.info.get("METL_METADATA")
-                return json.loads(meta) if meta else {}
-            elif file_path.lower().endswith(".jpg") or file_path.lower().endswith(".jpeg"):
-                meta = img.info.get("comment")
-                return json.loads(meta) if meta else {}
+            kind = _image_kind(file_path)
+            if kind == "jpeg":
+                meta = _read_jpeg_comment(file_path)
+            elif kind == "png":
+                meta = _read_png_text(file_path)
             else:
                 logger.error("Unsupported image format")
                 return {}
+            return json.loads(meta) if meta else {}
         except Exception as e:
             logger.error(f"Failed to extract metadata from image: {e}")
             return {}
+
+    def content_digest(self, file_path, algorithm):
+        """
+        Digest of the image without its METL segment or chunk, which stays
+        the same when metadata is embedded or replaced.
+        """
+        kind = _image_kind(file_path)
+        if kind == "jpeg":
+            return hash_pieces(file_path, _jpeg_pieces(file_path), algorithm)
+        if kind == "png":
+            return hash_pieces(file_path, _png_pieces(file_path), algorithm)
+        raise ValueError("Unsupported image format")
+
+    def can_update_in_place(self, file_path):
+        return _image_kind(file_path) is not None
+
+
+def _image_kind(file_path):
+    with open(file_path, "rb") as f:
+        head = f.read(len(PNG_SIGNATURE))
+    if head.startswith(JPEG_SIGNATURE):
+        return "jpeg"
+    if head == PNG_SIGNATURE:
+        return "png"
+    return None
+
+
+def _read_exact(f, size):
+    data = f.read(size)
+    if len(data) < size:
+        raise ValueError("Image header is truncated.")
+    return data
+
+
+def _jpeg_segments(f):
+    """
+    Yield (marker, start, end, comment payload or None) for each segment
+    between SOI and the start of scan, then (SOS or EOI, start, None, None).
+    Only COM payloads are read; every other segment is skipped by seeking.
+    """
+    f.seek(len(JPEG_SIGNATURE))
+    while True:
+        byte = _read_exact(f, 1)
+        if byte != b"\xff":
+            raise ValueError("Invalid JPEG segment marker.")
+        start = f.tell() - 1
+        marker = 0xFF
+        while marker == 0xFF:
+            marker = _read_exact(f, 1)[0]
+        if marker in (_SOS, _EOI):
+            yield marker, start, None, None
+            return
+        if marker in _STANDALONE_MARKERS:
+            yield marker, start, f.tell(), None
+            continue
+        length = struct.unpack("!H", _read_exact(f, 2))[0]
+        if length < 2:
+            raise ValueError("Invalid JPEG segment length.")
+        comment = None
+        if marker == _COM:
+            comment = _read_exact(f, length - 2)
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+        yield marker, start, f.tell(), comment
+
+
+def _metl_comment(comment):
+    # Returns the metadata JSON from a COM payload, or None if the segment
+    # is not METL's. Older releases stored bare signed JSON in the comment;
+    # other JSON comments belong to other tools and are left alone.
+    if comment.startswith(JPEG_COMMENT_TAG):
+        return comment[len(JPEG_COMMENT_TAG):]
+    if comment.startswith(b"{"):
+        try:
+            meta = json.loads(comment)
+        except ValueError:
+            return None
+        if isinstance(meta, dict) and "signature" in meta:
+            return comment
+    return None
+
+
+def _jpeg_comment_segment(payload):
+    body = JPEG_COMMENT_TAG + payload
+    if len(body) > MAX_JPEG_SEGMENT:
+        raise ValueError(f"Metadata exceeds the JPEG comment limit of {MAX_JPEG_SEGMENT} bytes.")
+    return b"\xff\xfe" + struct.pack("!H", len(body) + 2) + body
+
+
+def _jpeg_pieces(file_path, segment=None):
+    # The file's pieces without any METL comment, plus segment if given.
+    pieces = [JPEG_SIGNATURE]
+    inserted = segment is None
+    with open(file_path, "rb") as f:
+        for marker, start, end, comment in _jpeg_segments(f):
+            # JFIF and Exif require their APPn segment to come first.
+            if not inserted and not 0xE0 <= marker <= 0xEF:
+                pieces.append(segment)
+                inserted = True
+            if end is None:
+                pieces.append((start, None))
+            elif comment is None or _metl_comment(comment) is None:
+                pieces.append((start, end))
+    return pieces
+
+
+def _read_jpeg_comment(file_path):
+    with open(file_path, "rb") as f:
+        for _, _, _, comment in _jpeg_segments(f):
+            if comment is not None:
+                meta = _metl_comment(comment)
+                if meta is not None:
+                    return meta
+    return None
+
+
+def _png_chunks(f):
+    """
+    Yield (chunk type, start, end, data or None) for each chunk before the
+    first IDAT, then (b"IDAT", start, None, None). Only text chunk data is
+    read.
+    """
+    f.seek(len(PNG_SIGNATURE))
+    while True:
+        start = f.tell()
+        length, chunk_type = struct.unpack("!I4s", _read_exact(f, 8))
+        if chunk_type in (b"IDAT", b"IEND"):
+            yield chunk_type, start, None, None
+            return
+        data = None
+        if chunk_type in _PNG_TEXT_CHUNKS:
+            data = _read_exact(f, length)
+            f.seek(4, os.SEEK_CUR)
+        else:
+            f.seek(length + 4, os.SEEK_CUR)
+        yield chunk_type, start, f.tell(), data
+
+
+def _png_text(chunk_type, data):
+    # Returns the text of a METL text chunk, or None for any other chunk.
+    keyword, sep, rest = data.partition(b"\x00")
+    if keyword != PNG_TEXT_KEYWORD or not sep:
+        return None
+    if chunk_type == b"tEXt":
+        return rest.decode("latin-1")
+    if chunk_type == b"zTXt":
+        return zlib.decompress(rest[1:]).decode("latin-1")
+    compressed = rest[0]
+    _, _, translated = rest[2:].partition(b"\x00")
+    _, _, text = translated.partition(b"\x00")
+    return (zlib.decompress(text) if compressed else text).decode("utf-8")
+
+
+def _png_text_chunk(payload):
+    # iTXt: keyword, NUL, uncompressed flag and method, then empty
+    # language tag and translated keyword, each NUL-terminated.
+    data = PNG_TEXT_KEYWORD + b"\x00\x00\x00\x00\x00" + payload
+    return struct.pack("!I", len(data)) + b"iTXt" + data + struct.pack("!I", zlib.crc32(b"iTXt" + data))
+
+
+def _png_pieces(file_path, chunk=None):
+    # The file's pieces without any METL text chunk, plus chunk if given.
+    pieces = [PNG_SIGNATURE]
+    with open(file_path, "rb") as f:
+        for chunk_type, start, end, text_data in _png_chunks(f):
+            if end is None:
+                if chunk_type != b"IDAT":
+                    raise ValueError("PNG has no image data.")
+                if chunk is not None:
+                    pieces.append(chunk)
+                pieces.append((start, None))
+            elif text_data is None or _png_text(chunk_type, text_data) is None:
+                pieces.append((start, end))
+    return pieces
+
+
+def _read_png_text(file_path):
+    with open(file_path, "rb") as f:
+        for chunk_type, _, _, data in _png_chunks(f):
+            if data is not None:
+                text = _png_text(chunk_type, data)
+                if text is not None:
+                    return text
+    return None
+
@@ -1,16 +1,53 @@
+import io
+import os
+import re
 import pikepdf
 import json
+from core.hashing import compute_file_digest
+from adapters.splice import hash_pieces
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+METADATA_KEY = "/METADATA_JSON"
+# How far from the end of the file to look for startxref.
+TAIL_SIZE = 4096
+
+# The cross-reference sections _append_metadata writes, from the section
+# offset to the end of the file.
+_XREF_TABLE_UPDATE = re.compile(
+    rb"xref\n(\d+) 1\n(\d{10}) (\d{5}) n \ntrailer\n<< (.*) >>\nstartxref\n(\d+)\n%%EOF\n\Z", re.DOTALL)
+_XREF_STREAM_UPDATE = re.compile(
+    rb"(\d+) 0 obj\n<< /Type /XRef /Size \d+ /Index \[(\d+) 1 (\d+) 1\] /W \[1 8 2\] (.*) /Length 22 >>\n"
+    rb"stream\n(.{22})\nendstream\nendobj\nstartxref\n(\d+)\n%%EOF\n\Z", re.DOTALL)
+# The trailer entries _append_metadata writes, and nothing else.
+_TRAILER_FIELDS = re.compile(
+    rb"(?:/Size \d+ )?/Root (\d+) (\d+) R /Info (\d+) (\d+) R /Prev (\d+)"
+    rb"(?: /ID \[ ?<[0-9a-fA-F]*> ?<[0-9a-fA-F]*> ?\])?")
+
+
 class PDFAdapter:
+    """
+    Stores METL metadata in the PDF document information dictionary.
+
+    By default embedding appends an incremental update (the changed Info
+    object, a cross-reference section and a trailer pointing back at the
+    previous one with /Prev) instead of rewriting the whole document, so
+    its cost does not grow with the file size. An update METL appended
+    earlier is replaced rather than stacked. Encrypted or damaged files
+    fall back to a full rewrite, as does incremental=False.
+    """
+
+    def __init__(self, incremental=True):
+        self.incremental = incremental
+
     def embed_metadata(self, file_path, metadata):
         try:
-            with pikepdf.Pdf.open(file_path, allow_overwriting_input=True) as pdf:
-                info = pdf.docinfo
-                info["/METADATA_JSON"] = json.dumps(metadata)
-                pdf.save(file_path)
+            if not (self.incremental and self._append_metadata(file_path, metadata)):
+                with pikepdf.Pdf.open(file_path, allow_overwriting_input=True) as pdf:
+                    info = pdf.docinfo
+                    info[METADATA_KEY] = json.dumps(metadata)
+                    pdf.save(file_path)
             logger.info(f"Metadata embedded into PDF: {file_path}")
             return True
         except Exception as e:
@@ -19,12 +56,254 @@ class PDFAdapter:
 
     def extract_metadata(self, file_path):
         try:
-            with pikepdf.Pdf.open(file_path) as pdf:
-                info = pdf.docinfo
-                meta_json = info.get("/METADATA_JSON")
+            # pikepdf only reads the cross-reference data when opening; the
+            # page tree is never touched and the file is mapped, not read.
+            with pikepdf.Pdf.open(file_path, access_mode=pikepdf.AccessMode.mmap) as pdf:
+                meta_json = pdf.trailer.get("/Info", {}).get(METADATA_KEY)
                 if meta_json:
-                    return json.loads(meta_json)
+                    return json.loads(str(meta_json))
             return {}
         except Exception as e:
             logger.error(f"Failed to extract metadata from PDF: {e}")
             return {}
+
+    def content_digest(self, file_path, algorithm):
+        """
+        Digest of the document without METL's trailing incremental update,
+        which stays the same when metadata is embedded or replaced. The
+        update is only left out when it provably changes nothing but the
+        metadata entry of the document information dictionary (see
+        _metl_update); otherwise the whole file is hashed.
+        """
+        update = _metl_update(file_path)
+        if update is None:
+            return compute_file_digest(file_path, algorithm)
+        return hash_pieces(file_path, [(0, update[0])], algorithm)
+
+    def can_update_in_place(self, file_path):
+        if not self.incremental or _last_xref(file_path)[0] is None:
+            return False
+        with pikepdf.Pdf.open(file_path, access_mode=pikepdf.AccessMode.mmap) as pdf:
+            return "/Encrypt" not in pdf.trailer and "/Root" in pdf.trailer
+
+    def _append_metadata(self, file_path, metadata):
+        # Returns False if the file cannot take an incremental update.
+        prev_offset, uses_xref_stream = _last_xref(file_path)
+        if prev_offset is None:
+            return False
+        # Replace METL's own last update instead of stacking another one.
+        update = _metl_update(file_path)
+        if update is not None:
+            prev_offset = update[1]
+
+        with pikepdf.Pdf.open(file_path, access_mode=pikepdf.AccessMode.mmap) as pdf:
+            trailer = pdf.trailer
+            if "/Encrypt" in trailer or "/Root" not in trailer:
+                return False
+            size = int(trailer.Size)
+            info = pdf.docinfo
+            if info.is_indirect:
+                info_num, info_gen = info.objgen
+            else:
+                info_num, info_gen = size, 0
+            size = max(size, info_num + 1)
+            info[METADATA_KEY] = pikepdf.String(json.dumps(metadata))
+            info_bytes = info.unparse(resolved=True)
+            root_num, root_gen = trailer.Root.objgen
+            file_id = b" /ID " + trailer.ID.unparse() if "/ID" in trailer else b""
+
+        with open(file_path, "r+b") as f:
+            if update is None:
+                f.seek(0, os.SEEK_END)
+            else:
+                f.seek(update[0])
+            f.write(b"\n")
+            info_offset = f.tell()
+            f.write(f"{info_num} {info_gen} obj\n".encode() + info_bytes + b"\nendobj\n")
+            xref_offset = f.tell()
+            fields = (f"/Root {root_num} {root_gen} R /Info {info_num} {info_gen} R "
+                      f"/Prev {prev_offset}").encode() + file_id
+            if uses_xref_stream:
+                # Files indexed by a cross-reference stream are updated with one.
+                xref_num = size
+                entries = sorted([(info_num, info_offset, info_gen), (xref_num, xref_offset, 0)])
+                data = b"".join(b"\x01" + offset.to_bytes(8, "big") + gen.to_bytes(2, "big")
+                                for _, offset, gen in entries)
+                index = " ".join(f"{num} 1" for num, _, _ in entries)
+                f.write(f"{xref_num} 0 obj\n<< /Type /XRef /Size {size + 1} /Index [{index}] /W [1 8 2] ".encode()
+                        + fields + f" /Length {len(data)} >>\nstream\n".encode() + data
+                        + f"\nendstream\nendobj\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+            else:
+                f.write(f"xref\n{info_num} 1\n{info_offset:010d} {info_gen:05d} n \n"
+                        f"trailer\n<< /Size {size} ".encode() + fields
+                        + f" >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+            f.truncate()
+        return True
+
+
+def _last_xref(file_path):
+    """
+    Return (offset of the last cross-reference section, whether it is a
+    cross-reference stream), or (None, False) if the file has no usable
+    startxref.
+    """
+    with open(file_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        f.seek(max(0, size - TAIL_SIZE))
+        tail = f.read()
+        marker = tail.rfind(b"startxref")
+        if marker == -1:
+            return None, False
+        try:
+            offset = int(tail[marker + len(b"startxref"):].split()[0])
+        except (IndexError, ValueError):
+            return None, False
+        if not 0 < offset < size:
+            return None, False
+        f.seek(offset)
+        return offset, not f.read(4).startswith(b"xref")
+
+
+def _metl_update(file_path):
+    """
+    If the file ends with an incremental update written by _append_metadata,
+    return (offset where it starts, offset of the section before it);
+    otherwise None. Only an update holding nothing but the METL Info object
+    and its own cross-reference section is recognised, and only if it
+    changes nothing but METADATA_KEY compared with the revision before it.
+    """
+    offset, uses_xref_stream = _last_xref(file_path)
+    if offset is None:
+        return None
+    with open(file_path, "rb") as f:
+        f.seek(offset)
+        section = f.read()
+        if uses_xref_stream:
+            match = _XREF_STREAM_UPDATE.match(section)
+            if not match:
+                return None
+            fields = match.group(4)
+            entries = {int(match.group(2)): match.group(5)[:11], int(match.group(3)): match.group(5)[11:]}
+            xref_entry = entries.get(int(match.group(1)))
+            if xref_entry is None or int.from_bytes(xref_entry[1:9], "big") != offset:
+                return None
+        else:
+            match = _XREF_TABLE_UPDATE.match(section)
+            if not match:
+                return None
+            fields = match.group(4)
+            entries = {int(match.group(1)): b"\x01" + int(match.group(2)).to_bytes(8, "big")
+                       + int(match.group(3)).to_bytes(2, "big")}
+        trailer = _TRAILER_FIELDS.fullmatch(fields)
+        if trailer is None or int(match.group(match.lastindex)) != offset:
+            return None
+        root_num, root_gen, info_num, info_gen, prev_offset = (int(value) for value in trailer.groups())
+        info_entry = entries.get(info_num)
+        if info_entry is None or info_entry[0] != 1 or int.from_bytes(info_entry[9:11], "big") != info_gen:
+            return None
+        info_offset = int.from_bytes(info_entry[1:9], "big")
+        if not 0 < prev_offset < info_offset < offset:
+            return None
+        f.seek(info_offset - 1)
+        info = f.read(offset - info_offset + 1)
+    if not (info.startswith(f"\n{info_num} {info_gen} obj\n".encode()) and info.endswith(b"\nendobj\n")
+            and METADATA_KEY.encode() in info):
+        return None
+    if not _sets_only_metadata(file_path, info_offset - 1, (root_num, root_gen), (info_num, info_gen)):
+        return None
+    return info_offset - 1, prev_offset
+
+
+def _sets_only_metadata(file_path, start, root, info):
+    """
+    Whether the update starting at start leaves the document as it was
+    before the update apart from METADATA_KEY in the information
+    dictionary: same /Root and /ID, an Info object that is the previous
+    revision's Info (or a new object number) and not reachable from the
+    catalog, and Info entries equal to the previous ones.
+    """
+    with open(file_path, "rb") as f, \
+            pikepdf.Pdf.open(io.BufferedReader(_PrefixReader(f, start))) as before, \
+            pikepdf.Pdf.open(file_path, access_mode=pikepdf.AccessMode.mmap) as after:
+        trailer = before.trailer
+        if "/Encrypt" in trailer or "/Root" not in trailer or trailer.Root.objgen != root:
+            return False
+        if _unparse(trailer.get("/ID")) != _unparse(after.trailer.get("/ID")):
+            return False
+        old_info = trailer.get("/Info")
+        if old_info is not None and old_info.is_indirect:
+            if old_info.objgen != info:
+                return False
+        elif info[0] < int(trailer.Size):
+            return False
+        if info == root or _reachable(trailer.Root, info):
+            return False
+        new_info = after.trailer.get("/Info")
+        if new_info is None or not new_info.is_indirect or new_info.objgen != info \
+                or not isinstance(new_info.get(METADATA_KEY), pikepdf.String):
+            return False
+        return _entries_without_metadata(old_info) == _entries_without_metadata(new_info)
+
+
+def _unparse(obj):
+    return None if obj is None else obj.unparse()
+
+
+def _entries_without_metadata(info):
+    if info is None:
+        return {}
+    return {key: value.unparse() for key, value in info.items() if key != METADATA_KEY}
+
+
+def _reachable(root, objgen):
+    # Walks every object reachable from the catalog, visiting each
+    # indirect object once.
+    seen = set()
+    stack = [root]
+    while stack:
+        obj = stack.pop()
+        if not isinstance(obj, (pikepdf.Dictionary, pikepdf.Array, pikepdf.Stream)):
+            continue
+        if obj.is_indirect:
+            if obj.objgen == objgen:
+                return True
+            if obj.objgen in seen:
+                continue
+            seen.add(obj.objgen)
+        stack.extend(obj if isinstance(obj, pikepdf.Array) else obj.values())
+    return False
+
+
+class _PrefixReader(io.RawIOBase):
+    """
+    The first size bytes of an open file, so pikepdf can open the revision
+    that precedes an incremental update without copying it.
+    """
+
+    def __init__(self, f, size):
+        self._f = f
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: self._size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self._size - self._position)
+        if count <= 0:
+            return 0
+        self._f.seek(self._position)
+        count = self._f.readinto(memoryview(buffer)[:count])
+        self._position += count
+        return count
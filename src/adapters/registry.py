@@ -0,0 +1,136 @@
+import importlib
+import threading
+import zipfile
+from core.pipeline import sniff_mime
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+ENTRY_POINT_GROUP = "metl.adapters"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# Bytes read from the start of a file to detect its format.
+SNIFF_SIZE = 16
+
+# Built-in adapters by MIME type, as "module:Class" so a format's
+# dependencies are only imported once a file of that format shows up.
+BUILTIN_ADAPTERS = {
+    "application/pdf": "adapters.pdf:PDFAdapter",
+    "image/jpeg": "adapters.image:ImageAdapter",
+    "image/png": "adapters.image:ImageAdapter",
+    DOCX_MIME: "adapters.docx:DOCXAdapter",
+}
+
+_default_registry = None
+_default_lock = threading.Lock()
+
+
+def default_registry():
+    """
+    Return the process-wide registry with the built-in adapters and any
+    installed through entry points.
+    """
+    global _default_registry
+    with _default_lock:
+        if _default_registry is None:
+            _default_registry = AdapterRegistry()
+        return _default_registry
+
+
+class AdapterRegistry:
+    """
+    Maps file formats, detected from their first bytes, to the adapters
+    that embed metadata in them. Each adapter class is imported and
+    instantiated once and the instance is shared, so bulk jobs pay for
+    detection and imports once per format rather than once per file.
+
+    Third-party packages add formats through the "metl.adapters" entry
+    point group: the entry point name is the MIME type and the object is
+    an adapter class. A class may list extra leading byte signatures in a
+    MAGIC attribute for formats sniff_mime does not know.
+    """
+
+    def __init__(self, adapters=None, load_entry_points=True):
+        self._factories = dict(BUILTIN_ADAPTERS if adapters is None else adapters)
+        self._magic = []
+        self._instances = {}
+        self._lock = threading.Lock()
+        self._entry_points_lock = threading.Lock()
+        self._entry_points_loaded = not load_entry_points
+
+    def register(self, mime_type, adapter, magic=()):
+        """
+        Register an adapter for mime_type: a class, a ready instance or a
+        "module:Class" string. magic lists leading byte signatures that
+        identify the format.
+        """
+        with self._lock:
+            self._factories[mime_type] = adapter
+            self._instances.pop(mime_type, None)
+            self._magic.extend((signature, mime_type) for signature in magic)
+
+    def detect(self, file_path, mime_type=None):
+        """
+        Return the MIME type of file_path. A mime_type already sniffed from
+        the file's first bytes (for example by scan_file) is reused unless
+        it has no adapter and registered signatures may know better.
+        """
+        self._load_entry_points()
+        if mime_type is None or (self._magic and mime_type not in self._factories):
+            with open(file_path, "rb") as f:
+                head = f.read(SNIFF_SIZE)
+            mime_type = next((mime for magic, mime in self._magic if head.startswith(magic)), None) \
+                or sniff_mime(head)
+        if mime_type == "application/zip" and _is_docx(file_path):
+            return DOCX_MIME
+        return mime_type
+
+    def adapter_for(self, file_path, mime_type=None):
+        """
+        Return the shared adapter instance for file_path's format, or None
+        if no adapter handles it.
+        """
+        return self.get(self.detect(file_path, mime_type))
+
+    def get(self, mime_type):
+        with self._lock:
+            adapter = self._instances.get(mime_type)
+            if adapter is not None:
+                return adapter
+            factory = self._factories.get(mime_type)
+            if factory is None:
+                return None
+            if isinstance(factory, str):
+                module_name, _, class_name = factory.partition(":")
+                factory = getattr(importlib.import_module(module_name), class_name)
+            adapter = factory() if isinstance(factory, type) else factory
+            self._instances[mime_type] = adapter
+            return adapter
+
+    def _load_entry_points(self):
+        if self._entry_points_loaded:
+            return
+        with self._entry_points_lock:
+            if self._entry_points_loaded:
+                return
+            from importlib.metadata import entry_points
+            found = entry_points()
+            # Python 3.8 and 3.9 return a dict of groups.
+            group = found.select(group=ENTRY_POINT_GROUP) if hasattr(found, "select") \
+                else found.get(ENTRY_POINT_GROUP, [])
+            for entry_point in group:
+                try:
+                    adapter = entry_point.load()
+                except Exception as e:
+                    logger.error(f"Failed to load metadata adapter {entry_point.name}: {e}")
+                    continue
+                self.register(entry_point.name, adapter, getattr(adapter, "MAGIC", ()))
+            self._entry_points_loaded = True
+
+
+def _is_docx(file_path):
+    try:
+        with zipfile.ZipFile(file_path) as archive:
+            archive.getinfo("word/document.xml")
+        return True
+    except (KeyError, OSError, zipfile.BadZipFile):
+        return False
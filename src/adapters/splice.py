@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+from core.hashing import new_hasher
+
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def splice_file(file_path, pieces):
+    """
+    Rebuild file_path from pieces: bytes are written as given and
+    (start, end) tuples copy that byte range of the original file, with
+    end=None meaning end of file. The result is written to a temporary
+    file beside file_path and moved into place, so a failure leaves the
+    original untouched.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metl-")
+    try:
+        with open(file_path, "rb") as src, os.fdopen(fd, "wb") as dst:
+            for piece in pieces:
+                if isinstance(piece, bytes):
+                    dst.write(piece)
+                    continue
+                start, end = piece
+                src.seek(start)
+                if end is None:
+                    shutil.copyfileobj(src, dst, COPY_BLOCK_SIZE)
+                else:
+                    _copy_range(src, dst.write, end - start)
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def hash_pieces(file_path, pieces, algorithm):
+    """
+    Return the hex digest of the bytes splice_file would write for pieces,
+    without writing them.
+    """
+    hasher = new_hasher(algorithm)
+    with open(file_path, "rb") as src:
+        for piece in pieces:
+            if isinstance(piece, bytes):
+                hasher.update(piece)
+                continue
+            start, end = piece
+            src.seek(start)
+            if end is None:
+                end = os.fstat(src.fileno()).st_size
+            _copy_range(src, hasher.update, end - start)
+    return hasher.hexdigest()
+
+
+def _copy_range(src, write, remaining):
+    while remaining:
+        block = src.read(min(remaining, COPY_BLOCK_SIZE))
+        if not block:
+            raise ValueError("File ended before the expected byte range.")
+        write(block)
+        remaining -= len(block)
@@ -1,28 +1,47 @@
 # src/core/ai.py
+import os
 from utils.logger import get_logger
+from core.classifier import DEFAULT_RULES, StreamingClassifier, iter_file_chunks, load_policy_rules
 
 logger = get_logger(__name__)
 
 class AIPolicyRecommender:
     """
     A simple AI-based policy recommender that inspects file content
-    and suggests compliance tags.
+    and suggests compliance tags. Keyword rules come from the policy
+    YAML files in policy_dir, falling back to built-in defaults.
     """
     def __init__(self, config):
         self.enabled = config.get("enabled", True)
+        policy_dir = config.get("policy_dir", os.path.join("configs", "policies"))
+        rules = load_policy_rules(policy_dir) if os.path.isdir(policy_dir) else []
+        self.classifier = StreamingClassifier(rules or DEFAULT_RULES)
 
     def suggest_metadata(self, file_content):
+        if isinstance(file_content, str):
+            file_content = file_content.encode("utf-8", errors="ignore")
+        return self.suggest_metadata_from_chunks([file_content])
+
+    def suggest_metadata_for_file(self, file_path):
+        """
+        Suggest tags for a file by streaming it in bounded chunks instead
+        of reading it into memory. Reading stops early once every pattern
+        has matched.
+        """
+        return self.suggest_metadata_from_chunks(iter_file_chunks(file_path))
+
+    def suggest_metadata_from_chunks(self, chunks):
         if not self.enabled:
             logger.info("AI metadata suggestion disabled.")
             return {}
-        suggestions = {}
-        content_lower = file_content.lower()
-        if "patient" in content_lower:
-            suggestions["compliance_tag"] = "HIPAA"
-        if "financial" in content_lower:
-            suggestions["compliance_tag"] = "SOX"
-        if "personal data" in content_lower:
-            suggestions["compliance_tag"] = "GDPR"
-        if not suggestions:
-            suggestions["compliance_tag"] = "GENERAL"
-        return suggestions
+        return self.suggestions_from_scores(self.classifier.classify_chunks(chunks))
+
+    def suggestions_from_scores(self, tag_scores):
+        """
+        Pick the compliance tag from classifier scores: highest priority
+        first, then highest score.
+        """
+        if not tag_scores:
+            return {"compliance_tag": "GENERAL"}
+        best = max(tag_scores.items(), key=lambda item: (item[1]["priority"], item[1]["score"]))
+        return {"compliance_tag": best[0]}
@@ -0,0 +1,86 @@
+# src/core/aio.py
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+class EngineBusyError(Exception):
+    """
+    Raised to asyncio callers when more calls are already waiting for the
+    engine than the executor's max_waiting allows.
+    """
+
+
+class AsyncExecutor:
+    """
+    Runs blocking engine calls (hashing, signing, sidecar and ledger I/O)
+    for asyncio code on a bounded thread pool, so the event loop never
+    blocks and no thread is spawned per request.
+
+    At most max_concurrency calls run at once. Further callers wait on a
+    semaphore, which is the backpressure a request handler sees. With
+    max_waiting set, callers beyond that many waiters fail at once with
+    EngineBusyError, for services that would rather shed load than queue.
+    A call whose caller is cancelled keeps its slot until the thread
+    finishes, so cancellations cannot push more work into the pool.
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.max_workers = config.get("max_workers") or min(32, (os.cpu_count() or 1) + 4)
+        self.max_concurrency = config.get("max_concurrency") or self.max_workers
+        self.max_waiting = config.get("max_waiting")
+        self.waiting = 0
+        self._executor = None
+        self._semaphore = None
+        self._loop = None
+
+    def _get_semaphore(self):
+        # asyncio primitives belong to one event loop; a new loop (for
+        # example one asyncio.run per test) gets a fresh semaphore.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="metl-async")
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        """
+        Await fn(*args, **kwargs) run on the pool once a slot is free.
+        """
+        semaphore = self._get_semaphore()
+        if self.max_waiting is not None and semaphore.locked() and self.waiting >= self.max_waiting:
+            raise EngineBusyError(f"{self.waiting} calls are already waiting for the engine.")
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), functools.partial(fn, *args, **kwargs))
+        except BaseException:
+            semaphore.release()
+            raise
+        future.add_done_callback(functools.partial(_release, semaphore))
+        return await asyncio.shield(future)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def _release(semaphore, future):
+    semaphore.release()
+    # Retrieve the outcome so a failure nobody awaits any more (the caller
+    # was cancelled) is not reported as never retrieved.
+    if not future.cancelled():
+        future.exception()
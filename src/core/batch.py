@@ -0,0 +1,138 @@
+# src/core/batch.py
+
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from core.sidecars import SIDECAR_SUFFIX
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Per-process state for embed workers, populated once by _init_embed_worker.
+_worker_engine = None
+_worker_private_key = None
+
+
+def iter_files(root):
+    """
+    Walk a directory tree and yield the path of every regular file,
+    skipping METL sidecars. Uses os.scandir so large trees are not
+    materialized in memory.
+    """
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.endswith(SIDECAR_SUFFIX):
+                        yield entry.path
+        except OSError as e:
+            logger.error(f"Unable to scan directory {current}: {e}")
+
+
+def iter_chunks(items, chunksize):
+    """
+    Group an iterable into lists of at most chunksize items.
+    """
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def bounded_map(executor, fn, items, max_in_flight):
+    """
+    Submit fn(item) for every item while keeping at most max_in_flight
+    futures pending, yielding results in completion order. Unlike
+    executor.map this does not submit the whole iterable up front.
+    """
+    pending = set()
+    for item in items:
+        pending.add(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+def summarize_results(total, errors, elapsed):
+    """
+    Build the throughput/error summary returned by bulk operations.
+    """
+    return {
+        "total": total,
+        "succeeded": total - len(errors),
+        "failed": len(errors),
+        "errors": errors,
+        "elapsed": elapsed,
+        "files_per_sec": total / elapsed if elapsed > 0 else 0.0,
+    }
+
+
+def write_jsonl_report(results, stream):
+    """
+    Stream results to a file object as JSON lines, one per result, and
+    return aggregate counts keyed by status.
+    """
+    counts = {}
+    for result in results:
+        stream.write(json.dumps(result, sort_keys=True) + "\n")
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    stream.flush()
+    return counts
+
+
+def _init_embed_worker(private_key_pem, engine_kwargs, hash_cache_config, sidecar_store_config=None,
+                       metadata_index_config=None):
+    # Runs once per worker process: deserialize the signing key and build
+    # an engine so individual files only pay for hashing and signing.
+    global _worker_engine, _worker_private_key
+    from cryptography.hazmat.primitives import serialization
+    from core.metadata import MetadataEngine
+    from core.hashcache import HashCache
+    from core.index import MetadataIndex
+    from core.sidecars import open_sidecar_store
+
+    _worker_private_key = serialization.load_pem_private_key(private_key_pem, password=None)
+    hash_cache = HashCache(hash_cache_config) if hash_cache_config else None
+    metadata_index = MetadataIndex(metadata_index_config) if metadata_index_config else None
+    _worker_engine = MetadataEngine(hash_cache=hash_cache, sidecar_store=open_sidecar_store(sidecar_store_config),
+                                    metadata_index=metadata_index, **engine_kwargs)
+
+
+def _embed_chunk(paths):
+    from core.metadata import signed_file_digest
+
+    results = []
+    for path in paths:
+        try:
+            signed = _worker_engine.embed_file(path, _worker_private_key)
+            results.append((path, None, signed_file_digest(signed)))
+        except Exception as e:
+            results.append((path, str(e), None))
+    return results
+
+
+def run_embed_chunks(chunks, private_key_pem, engine_kwargs, hash_cache_config, workers, sidecar_store_config=None,
+                     metadata_index_config=None, mp_context=None):
+    """
+    Yield (path, error, file_hash) tuples for every file in chunks,
+    embedding them in a pool of worker processes started with mp_context.
+    error is None on success.
+    """
+    initargs = (private_key_pem, engine_kwargs, hash_cache_config, sidecar_store_config, metadata_index_config)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context, initializer=_init_embed_worker,
+                             initargs=initargs) as executor:
+        for results in bounded_map(executor, _embed_chunk, chunks, workers * 2):
+            yield from results
@@ -0,0 +1,148 @@
+# src/core/classifier.py
+
+import codecs
+import glob
+import os
+from utils.config import ConfigLoader
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# Used when no policy directory is available. Matches the keywords the
+# recommender has always looked for; higher priority wins when several
+# tags match.
+DEFAULT_RULES = [
+    {"pattern": "patient", "tag": "HIPAA", "priority": 10, "weight": 1.0},
+    {"pattern": "financial", "tag": "SOX", "priority": 20, "weight": 1.0},
+    {"pattern": "personal data", "tag": "GDPR", "priority": 30, "weight": 1.0},
+]
+
+
+def load_policy_rules(policy_dir):
+    """
+    Load classification rules from every *.yml policy in policy_dir. A
+    policy contributes rules through an optional "classification" section:
+
+        classification:
+          tag: GDPR
+          priority: 30
+          rules:
+            - pattern: "personal data"
+              weight: 1.0
+
+    A rule may override the policy's tag or priority.
+    """
+    rules = []
+    for path in sorted(glob.glob(os.path.join(policy_dir, "*.yml"))):
+        policy = ConfigLoader(path).load_config() or {}
+        section = policy.get("classification")
+        if not section:
+            continue
+        for rule in section.get("rules", []):
+            rules.append({
+                "pattern": rule["pattern"],
+                "tag": rule.get("tag", section.get("tag")),
+                "priority": rule.get("priority", section.get("priority", 0)),
+                "weight": rule.get("weight", 1.0),
+            })
+    return rules
+
+
+class StreamingClassifier:
+    """
+    Matches rule patterns case-insensitively against a byte stream chunk
+    by chunk, carrying the last few characters between chunks so matches
+    spanning a boundary are found. Each chunk is folded once and searched
+    for the patterns not yet seen, so matched patterns drop out of the
+    scan and memory stays bounded by the chunk size regardless of file
+    size.
+
+    When every pattern is ASCII the raw bytes are folded with bytes.lower.
+    That only folds ASCII, so with any non-ASCII pattern the stream is
+    decoded as UTF-8 instead and text and patterns are casefolded.
+    """
+
+    def __init__(self, rules):
+        self.text_mode = not all(rule["pattern"].isascii() for rule in rules)
+        self._rules_by_pattern = {}
+        for rule in rules:
+            pattern = rule["pattern"].casefold()
+            if not self.text_mode:
+                pattern = pattern.encode("ascii")
+            self._rules_by_pattern.setdefault(pattern, []).append(rule)
+        self._overlap = max((len(p) for p in self._rules_by_pattern), default=1) - 1
+
+    def scan(self):
+        """
+        Start a new scan; feed it with update() and read result().
+        """
+        return ClassifierScan(self)
+
+    def classify_chunks(self, chunks):
+        scan = self.scan()
+        for chunk in chunks:
+            scan.update(chunk)
+            if scan.done:
+                break
+        return scan.result()
+
+
+class ClassifierScan:
+    def __init__(self, classifier):
+        self.classifier = classifier
+        self.matched = set()
+        self._remaining = list(classifier._rules_by_pattern)
+        if classifier.text_mode:
+            self._decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+            self._tail = ""
+        else:
+            self._decoder = None
+            self._tail = b""
+
+    @property
+    def done(self):
+        # Nothing left to learn once every pattern has been seen.
+        return not self._remaining
+
+    def update(self, chunk):
+        if self.done:
+            return
+        if self._decoder:
+            folded = self._decoder.decode(chunk).casefold()
+        else:
+            # Buffers other than bytes (read_once passes memoryviews) have
+            # no lower(), so they are copied once first.
+            folded = (chunk if isinstance(chunk, bytes) else bytes(chunk)).lower()
+        # Matches across the previous boundary lie within the carried tail
+        # and the start of this chunk, so the chunk itself is not copied.
+        overlap = self.classifier._overlap
+        boundary = self._tail + folded[:overlap]
+        found = [pattern for pattern in self._remaining if pattern in folded or pattern in boundary]
+        if found:
+            self.matched.update(found)
+            self._remaining = [pattern for pattern in self._remaining if pattern not in self.matched]
+        if overlap:
+            self._tail = folded[-overlap:] if len(folded) >= overlap else boundary[-overlap:]
+
+    def result(self):
+        """
+        Return per-tag scores and priorities for the patterns seen so far.
+        """
+        tags = {}
+        for pattern in self.matched:
+            for rule in self.classifier._rules_by_pattern[pattern]:
+                entry = tags.setdefault(rule["tag"], {"score": 0.0, "priority": rule["priority"]})
+                entry["score"] += rule["weight"]
+                entry["priority"] = max(entry["priority"], rule["priority"])
+        return tags
+
+
+def iter_file_chunks(file_path, chunk_size=CHUNK_SIZE):
+    with open(file_path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
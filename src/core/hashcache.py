@@ -0,0 +1,155 @@
+# src/core/hashcache.py
+
+import os
+import sqlite3
+import threading
+import time
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Files modified this recently are not cached: a write landing within the
+# same mtime tick as our stat would otherwise go unnoticed.
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class HashCache:
+    """
+    A persistent cache of file digests keyed on (device, inode, size,
+    mtime_ns, ctime_ns), so unchanged files are not re-read on repeat
+    embeds and verifications. In paranoid mode every lookup re-hashes the
+    file and refreshes the entry.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.db_path = config.get("db_path", "hashcache.db")
+        self.paranoid = config.get("paranoid", False)
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._ensure_db()
+
+    def _ensure_db(self):
+        conn = self._get_connection()
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            device INTEGER NOT NULL,
+            inode INTEGER NOT NULL,
+            algorithm TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            ctime_ns INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            PRIMARY KEY (device, inode, algorithm)
+        )
+        """)
+
+    def _get_connection(self):
+        # One connection per thread so threaded verification can share the cache.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def get_or_compute(self, file_path, compute, algorithm="sha256"):
+        """
+        Return the cached digest for file_path if its stat key is unchanged,
+        otherwise call compute(file_path) and store the result.
+        """
+        st = os.stat(file_path)
+        digest = self.lookup(st, algorithm)
+        if digest is not None:
+            return digest
+
+        digest = compute(file_path)
+        self.store_if_unchanged(file_path, st, algorithm, digest)
+        return digest
+
+    def store_if_unchanged(self, file_path, st, algorithm, digest):
+        """
+        Cache a digest computed by the caller, provided the file still has
+        the stat key st it had before it was read and was not modified
+        within the racy window.
+        """
+        after = os.stat(file_path)
+        if _stat_key(st) == _stat_key(after) and time.time_ns() - after.st_mtime_ns > RACY_WINDOW_NS:
+            self.store(file_path, after, algorithm, digest)
+
+    def lookup(self, st, algorithm="sha256"):
+        """
+        Return the cached digest for a stat result, or None if the file is
+        unknown, has changed since it was hashed or the cache is paranoid.
+        The outcome is counted as a hit or miss in stats().
+        """
+        digest = None
+        if not self.paranoid:
+            row = self._get_connection().execute(
+                "SELECT size, mtime_ns, ctime_ns, digest FROM file_hashes "
+                "WHERE device = ? AND inode = ? AND algorithm = ?",
+                (st.st_dev, st.st_ino, algorithm),
+            ).fetchone()
+            if row and tuple(row[:3]) == (st.st_size, st.st_mtime_ns, st.st_ctime_ns):
+                digest = row[3]
+        self._count(hit=digest is not None)
+        return digest
+
+    def store(self, file_path, st, algorithm, digest):
+        self._get_connection().execute(
+            "INSERT OR REPLACE INTO file_hashes "
+            "(device, inode, algorithm, size, mtime_ns, ctime_ns, path, digest) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (st.st_dev, st.st_ino, algorithm, st.st_size, st.st_mtime_ns, st.st_ctime_ns,
+             os.path.abspath(file_path), digest),
+        )
+
+    def evict_missing(self):
+        """
+        Remove entries whose file was deleted or replaced by another inode.
+        Returns the number of evicted entries.
+        """
+        conn = self._get_connection()
+        stale = []
+        for device, inode, algorithm, path in conn.execute(
+                "SELECT device, inode, algorithm, path FROM file_hashes"):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                stale.append((device, inode, algorithm))
+                continue
+            if (st.st_dev, st.st_ino) != (device, inode):
+                stale.append((device, inode, algorithm))
+
+        if stale:
+            conn.execute("BEGIN")
+            conn.executemany(
+                "DELETE FROM file_hashes WHERE device = ? AND inode = ? AND algorithm = ?", stale)
+            conn.execute("COMMIT")
+        logger.info(f"Evicted {len(stale)} stale hash cache entries.")
+        return len(stale)
+
+    def stats(self):
+        with self._stats_lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+def _stat_key(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns)
@@ -0,0 +1,74 @@
+# src/core/hashing.py
+
+import hashlib
+import mmap
+import os
+
+DEFAULT_ALGORITHM = "sha256"
+SUPPORTED_ALGORITHMS = ("sha256", "blake2b")
+
+# How sidecars commit to file content: one digest over the whole stream,
+# or the root of a Merkle tree over fixed-size chunks.
+DIGEST_FLAT = "flat"
+DIGEST_MERKLE = "merkle"
+
+# Where signed metadata is kept: in a sidecar store, inside the file itself
+# through its format adapter, or both. Metadata kept inside a file commits
+# to a digest of the file's content without that metadata.
+STORAGE_SIDECAR = "sidecar"
+STORAGE_EMBEDDED = "embedded"
+STORAGE_BOTH = "both"
+STORAGE_MODES = (STORAGE_SIDECAR, STORAGE_EMBEDDED, STORAGE_BOTH)
+DIGEST_SCOPE_CONTENT = "content"
+
+# Files up to BUFFER_SIZE are read in one call, files from MMAP_THRESHOLD up
+# are hashed straight from a read-only mapping, and everything in between is
+# streamed through a single reused buffer with readinto.
+BUFFER_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+
+
+def new_hasher(algorithm=DEFAULT_ALGORITHM):
+    """
+    Return a fresh hashlib object for one of SUPPORTED_ALGORITHMS.
+    """
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        raise ValueError(f"Unsupported digest algorithm: {algorithm}")
+    return hashlib.new(algorithm)
+
+
+def compute_file_digest(file_path, algorithm=DEFAULT_ALGORITHM):
+    """
+    Return the hex digest of a file, choosing the read strategy by size.
+    """
+    hasher = new_hasher(algorithm)
+    with open(file_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= BUFFER_SIZE:
+            hasher.update(f.read())
+        elif size >= MMAP_THRESHOLD:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    hasher.update(mm)
+            except (OSError, OverflowError, ValueError):
+                # Some filesystems and 32-bit builds cannot map the file.
+                hasher = new_hasher(algorithm)
+                f.seek(0)
+                update_from_stream(hasher, f)
+        else:
+            update_from_stream(hasher, f)
+    return hasher.hexdigest()
+
+
+def update_from_stream(hasher, f, buffer_size=BUFFER_SIZE):
+    """
+    Feed a binary file object into hasher using one preallocated buffer,
+    avoiding a new bytes object per read.
+    """
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(buf)
+        if not n:
+            break
+        hasher.update(view[:n])
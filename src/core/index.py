@@ -0,0 +1,256 @@
+# src/core/index.py
+
+import json
+import os
+import sqlite3
+import threading
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Metadata fields that are not worth searching on.
+UNINDEXED_KEYS = ("signature", "file_merkle")
+
+
+def index_terms(metadata):
+    """
+    Flatten signed metadata into (key, value) terms: one per scalar field
+    and one per list element. Values are stored as text, with non-strings
+    in their JSON form (so True is "true"); None is stored as NULL.
+    """
+    terms = []
+    for key, value in metadata.items():
+        if key in UNINDEXED_KEYS:
+            continue
+        for item in value if isinstance(value, list) else [value]:
+            if item is None or isinstance(item, str):
+                terms.append((key, item))
+            else:
+                terms.append((key, json.dumps(item, sort_keys=True)))
+    return terms
+
+
+class MetadataIndex:
+    """
+    A persistent inverted index over signed metadata, kept in SQLite so
+    questions like "which files are tagged HIPAA?" or "which files lack
+    consent_status?" are answered without opening any sidecar. Every
+    (key, value) term points at the files carrying it, and the terms
+    are indexed by key and value. MetadataEngine updates the index as it
+    embeds; rebuild passes re-index only files whose signature changed.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.db_path = config.get("db_path", "metl-index.db")
+        self._local = threading.local()
+        self._ensure_db()
+
+    def _ensure_db(self):
+        conn = self._get_connection()
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS indexed_files (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            file_hash TEXT,
+            signature TEXT,
+            generation INTEGER NOT NULL DEFAULT 0,
+            metadata TEXT NOT NULL
+        )
+        """)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS metadata_terms (
+            key TEXT NOT NULL,
+            value TEXT,
+            file_id INTEGER NOT NULL
+        )
+        """)
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS index_state (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """)
+        # Term lookups walk the first index in file id order; per-file
+        # checks (EXISTS, NOT EXISTS) and re-indexing use the second.
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_terms_key_value ON metadata_terms(key, value, file_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_terms_file ON metadata_terms(file_id, key, value)")
+
+    def _get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def update(self, file_path, metadata):
+        self.update_many([(file_path, metadata)])
+
+    def update_many(self, items, generation=None):
+        """
+        Index (file_path, metadata) pairs in one transaction, replacing
+        what was indexed for those paths before. Entries whose signature
+        is unchanged are left alone apart from being marked with
+        generation. Returns the number of entries re-indexed.
+        """
+        from core.metadata import signed_file_digest
+        conn = self._get_connection()
+        changed = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if generation is None:
+                generation = self._current_generation(conn)
+            for file_path, metadata in items:
+                path = os.path.abspath(file_path)
+                signature = metadata.get("signature")
+                row = conn.execute("SELECT id, signature FROM indexed_files WHERE path = ?", (path,)).fetchone()
+                if row and signature and row[1] == signature:
+                    conn.execute("UPDATE indexed_files SET generation = ? WHERE id = ?", (generation, row[0]))
+                    continue
+                values = (signed_file_digest(metadata), signature, generation, json.dumps(metadata, sort_keys=True))
+                if row:
+                    file_id = row[0]
+                    conn.execute("DELETE FROM metadata_terms WHERE file_id = ?", (file_id,))
+                    conn.execute("UPDATE indexed_files SET file_hash = ?, signature = ?, generation = ?, metadata = ? "
+                                 "WHERE id = ?", values + (file_id,))
+                else:
+                    file_id = conn.execute(
+                        "INSERT INTO indexed_files (path, file_hash, signature, generation, metadata) "
+                        "VALUES (?, ?, ?, ?, ?)", (path,) + values).lastrowid
+                conn.executemany("INSERT INTO metadata_terms (key, value, file_id) VALUES (?, ?, ?)",
+                                 [(key, value, file_id) for key, value in index_terms(metadata)])
+                changed += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return changed
+
+    def remove(self, file_path):
+        conn = self._get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM metadata_terms WHERE file_id IN (SELECT id FROM indexed_files WHERE path = ?)",
+                         (os.path.abspath(file_path),))
+            conn.execute("DELETE FROM indexed_files WHERE path = ?", (os.path.abspath(file_path),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def begin_rebuild(self):
+        """
+        Start a rebuild pass and return its generation number. Entries not
+        touched by the pass, or by embeds made while it runs, can then be
+        dropped with prune.
+        """
+        conn = self._get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        generation = self._current_generation(conn) + 1
+        conn.execute("INSERT OR REPLACE INTO index_state (name, value) VALUES ('generation', ?)", (generation,))
+        conn.execute("COMMIT")
+        return generation
+
+    def prune(self, root, generation):
+        """
+        Drop entries under root that the rebuild pass with generation did
+        not see, because their file or metadata is gone. Returns the
+        number of entries dropped.
+        """
+        lower, upper = _path_range(root)
+        conn = self._get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM metadata_terms WHERE file_id IN (SELECT id FROM indexed_files "
+                "WHERE path >= ? AND path < ? AND generation < ?)", (lower, upper, generation))
+            removed = conn.execute("DELETE FROM indexed_files WHERE path >= ? AND path < ? AND generation < ?",
+                                   (lower, upper, generation)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return removed
+
+    def query(self, equals=(), present=(), missing=(), root=None, limit=None):
+        """
+        Return the paths whose metadata has every (key, value) in equals,
+        every key in present and none of the keys in missing, optionally
+        restricted to files under root. Paths come back in the order they
+        were first indexed, so results stream straight off the term index.
+        """
+        sql, params = self._select("f.path", equals, present, missing, root)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [row[0] for row in self._get_connection().execute(sql, params)]
+
+    def count(self, equals=(), present=(), missing=(), root=None):
+        sql, params = self._select("COUNT(*)", equals, present, missing, root, ordered=False)
+        return self._get_connection().execute(sql, params).fetchone()[0]
+
+    def stats(self):
+        conn = self._get_connection()
+        return {
+            "files": conn.execute("SELECT COUNT(*) FROM indexed_files").fetchone()[0],
+            "terms": conn.execute("SELECT COUNT(*) FROM metadata_terms").fetchone()[0],
+        }
+
+    def get(self, file_path):
+        """
+        Return the indexed metadata for file_path, or None.
+        """
+        row = self._get_connection().execute(
+            "SELECT metadata FROM indexed_files WHERE path = ?", (os.path.abspath(file_path),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _select(self, columns, equals, present, missing, root, ordered=True):
+        # The first key=value term drives the query through the term index
+        # and the other conditions are checked per file, except missing
+        # keys: their NOT IN set is built once, which beats probing every
+        # file when most files are candidates.
+        equals = list(equals)
+        clauses, params = [], []
+        if equals:
+            key, value = equals.pop(0)
+            sql = (f"SELECT {columns} FROM metadata_terms t JOIN indexed_files f ON f.id = t.file_id "
+                   "WHERE t.key = ? AND t.value = ?")
+            params.extend((key, value))
+            order = " ORDER BY t.file_id"
+        else:
+            sql = f"SELECT {columns} FROM indexed_files f WHERE 1"
+            order = " ORDER BY f.id"
+        for key, value in equals:
+            clauses.append("EXISTS (SELECT 1 FROM metadata_terms WHERE file_id = f.id AND key = ? AND value = ?)")
+            params.extend((key, value))
+        for key in present:
+            clauses.append("EXISTS (SELECT 1 FROM metadata_terms WHERE file_id = f.id AND key = ?)")
+            params.append(key)
+        for key in missing:
+            clauses.append("f.id NOT IN (SELECT file_id FROM metadata_terms WHERE key = ?)")
+            params.append(key)
+        if root is not None:
+            clauses.append("f.path >= ? AND f.path < ?")
+            params.extend(_path_range(root))
+        for clause in clauses:
+            sql += " AND " + clause
+        return sql + (order if ordered else ""), params
+
+    def _current_generation(self, conn):
+        row = conn.execute("SELECT value FROM index_state WHERE name = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _path_range(root):
+    # Every absolute path under root sorts between these two bounds, so the
+    # primary key index answers the range.
+    prefix = os.path.join(os.path.abspath(root), "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
@@ -1,14 +1,58 @@
+import atexit
+import hashlib
+import json
+import queue
 import sqlite3
 import os
+import threading
+import time
+from datetime import datetime, timezone
 from utils.logger import get_logger
+from core.cryptography import sign_data, verify_signature
+from core.merkle import hash_leaf, merkle_proof, merkle_root, verify_merkle_proof
 
 logger = get_logger(__name__)
 
+GENESIS_HASH = "0" * 64
+CHECKPOINT_COLUMNS = ("id", "first_id", "last_id", "merkle_root", "chain_hash", "signature", "timestamp")
+# Queryable per-entry columns. Entries with entry_version 2 include them in
+# their hash; rows backfilled from legacy free-text data stay at version 1.
+STRUCTURED_FIELDS = ("action", "file_path", "file_hash", "actor_role", "cms_name")
+ENTRY_COLUMNS = ("id", "timestamp", "data") + STRUCTURED_FIELDS + ("entry_version", "prev_hash", "entry_hash")
+ENTRY_VERSION = 2
+# PRAGMA user_version: 1 chains pre-existing rows, 2 adds structured
+# columns, 3 adds full-text search.
+SCHEMA_VERSION = 3
+
 class Ledger:
-    def __init__(self, config):
+    """
+    An append-only SQLite ledger. Every row is chained to the previous
+    row's hash, and when a signing key is supplied a signed Merkle
+    checkpoint is written every checkpoint_interval rows so auditors can
+    verify incrementally and obtain compact inclusion proofs.
+    """
+    def __init__(self, config, signing_key=None):
         self.db_path = config.get("db_path", "ledger.db")
+        self.checkpoint_interval = config.get("checkpoint_interval", 1000)
+        self.signing_key = signing_key
+        # Background writer settings: queued records are committed together
+        # once batch_size rows are waiting or flush_interval_ms has passed.
+        self.async_writes = config.get("async_writes", False)
+        self.batch_size = config.get("batch_size", 500)
+        self.flush_interval = config.get("flush_interval_ms", 50) / 1000.0
+        # A batch that fails to commit is retried write_retries times, with
+        # the delay doubling from retry_backoff_ms, before it is set aside
+        # for flush() and close() to raise.
+        self.write_retries = config.get("write_retries", 3)
+        self.retry_backoff = config.get("retry_backoff_ms", 50) / 1000.0
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._writer = None
         self._ensure_db()
         self._optimize_db()
+        if self.async_writes:
+            self.start_writer()
 
     def _ensure_db(self):
         if not os.path.exists(self.db_path):
@@ -23,6 +67,145 @@ class Ledger:
             """)
             conn.commit()
             conn.close()
+        self._ensure_chain_schema()
+
+    def _ensure_chain_schema(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        try:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}
+            if "entry_hash" not in columns:
+                conn.execute("ALTER TABLE transactions ADD COLUMN prev_hash TEXT")
+                conn.execute("ALTER TABLE transactions ADD COLUMN entry_hash TEXT")
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                first_id INTEGER NOT NULL,
+                last_id INTEGER NOT NULL,
+                merkle_root TEXT NOT NULL,
+                chain_hash TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                timestamp DATETIME NOT NULL
+            )
+            """)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                self._backfill_chain(conn)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 2:
+                self._migrate_structured_schema(conn)
+            if conn.execute("PRAGMA user_version").fetchone()[0] < 3:
+                self._migrate_text_search(conn)
+            self.text_search = self._has_text_search(conn)
+        finally:
+            conn.close()
+
+    def _migrate_structured_schema(self, conn):
+        # Adds structured columns and the row counter, and parses the known
+        # free-text entry formats of older rows into the new columns.
+        conn.execute("BEGIN IMMEDIATE")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(transactions)")}
+        for field in STRUCTURED_FIELDS:
+            if field not in columns:
+                conn.execute(f"ALTER TABLE transactions ADD COLUMN {field} TEXT")
+        if "entry_version" not in columns:
+            conn.execute("ALTER TABLE transactions ADD COLUMN entry_version INTEGER NOT NULL DEFAULT 1")
+
+        embed_prefix = "Embedded metadata into "
+        conn.execute("UPDATE transactions SET action = 'embed', file_path = substr(data, ?) "
+                     "WHERE action IS NULL AND data LIKE ?", (len(embed_prefix) + 1, embed_prefix + "%"))
+        cms_marker = "' embedded metadata into "
+        conn.execute(
+            "UPDATE transactions SET action = 'embed', "
+            "cms_name = substr(data, 6, instr(substr(data, 6), ?) - 1), "
+            "file_path = substr(data, 5 + instr(substr(data, 6), ?) + ?) "
+            "WHERE action IS NULL AND data LIKE ?",
+            (cms_marker, cms_marker, len(cms_marker), "CMS '%" + cms_marker + "%"))
+
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS ledger_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """)
+        conn.execute("INSERT OR REPLACE INTO ledger_stats (name, value) "
+                     "SELECT 'transaction_count', COUNT(*) FROM transactions")
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_transaction_count_insert AFTER INSERT ON transactions
+        BEGIN
+            UPDATE ledger_stats SET value = value + 1 WHERE name = 'transaction_count';
+        END
+        """)
+        conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_transaction_count_delete AFTER DELETE ON transactions
+        BEGIN
+            UPDATE ledger_stats SET value = value - 1 WHERE name = 'transaction_count';
+        END
+        """)
+        conn.execute("PRAGMA user_version = 2")
+        conn.execute("COMMIT")
+
+    def _migrate_text_search(self, conn):
+        # An external-content FTS5 index over data and file_path backs text
+        # filtering. SQLite builds without FTS5 fall back to LIKE scans.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts "
+                         "USING fts5(data, file_path, content='transactions', content_rowid='id')")
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Full-text search unavailable, text filters will scan: {e}")
+        else:
+            conn.execute("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')")
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_insert AFTER INSERT ON transactions
+            BEGIN
+                INSERT INTO transactions_fts (rowid, data, file_path) VALUES (new.id, new.data, new.file_path);
+            END
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_delete AFTER DELETE ON transactions
+            BEGIN
+                INSERT INTO transactions_fts (transactions_fts, rowid, data, file_path)
+                VALUES ('delete', old.id, old.data, old.file_path);
+            END
+            """)
+            conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_transactions_fts_update AFTER UPDATE ON transactions
+            BEGIN
+                INSERT INTO transactions_fts (transactions_fts, rowid, data, file_path)
+                VALUES ('delete', old.id, old.data, old.file_path);
+                INSERT INTO transactions_fts (rowid, data, file_path) VALUES (new.id, new.data, new.file_path);
+            END
+            """)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute("COMMIT")
+
+    def _has_text_search(self, conn):
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'").fetchone() is not None
+
+    def _backfill_chain(self, conn):
+        # Rows written before hash chaining existed are chained on upgrade;
+        # they are only tamper-evident from this point on. Runs once: every
+        # row written afterwards is chained as it is appended.
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT id, data, timestamp FROM transactions WHERE entry_hash IS NULL ORDER BY id").fetchall()
+        if rows:
+            prev_hash = self._last_entry(conn, before_id=rows[0][0])[1]
+            for tx_id, data, timestamp in rows:
+                entry_hash = compute_entry_hash(tx_id, timestamp, data, prev_hash)
+                conn.execute("UPDATE transactions SET prev_hash = ?, entry_hash = ? WHERE id = ?",
+                             (prev_hash, entry_hash, tx_id))
+                prev_hash = entry_hash
+            logger.warning(f"Chained {len(rows)} pre-existing ledger rows.")
+        conn.execute("PRAGMA user_version = 1")
+        conn.execute("COMMIT")
+
+    def _last_entry(self, conn, before_id=None):
+        if before_id is None:
+            row = conn.execute("SELECT id, entry_hash FROM transactions ORDER BY id DESC LIMIT 1").fetchone()
+        else:
+            row = conn.execute("SELECT id, entry_hash FROM transactions WHERE id < ? ORDER BY id DESC LIMIT 1",
+                               (before_id,)).fetchone()
+        return row if row else (0, GENESIS_HASH)
 
     def _optimize_db(self):
         # Apply PRAGMAs for better performance
@@ -44,23 +227,506 @@ class Ledger:
             c = conn.cursor()
             # Create an index on timestamp to speed up queries by time
             c.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON transactions(timestamp);")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_checkpoint_last_id ON checkpoints(last_id);")
+            # Per-file history is served entirely from this covering index.
+            c.execute("CREATE INDEX IF NOT EXISTS idx_tx_file_path "
+                      "ON transactions(file_path, id, action, timestamp);")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_tx_file_hash ON transactions(file_hash, id);")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_tx_action ON transactions(action, id);")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_tx_cms_name ON transactions(cms_name, id);")
             conn.commit()
 
     def _get_connection(self):
-        # Simple connection pooling: reuse a single connection if possible
-        # For high concurrency, consider a connection pool library.
-        return sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        # One persistent connection per thread. sqlite3 connections must not
+        # be shared across threads mid-transaction, and reopening the file
+        # for every statement dominated the cost of small inserts.
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False, timeout=30)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
 
-    def record_transaction(self, data):
-        with self._get_connection() as conn:
-            c = conn.cursor()
-            c.execute("INSERT INTO transactions (data) VALUES (?)", (data,))
-            tx_id = c.lastrowid
-            logger.info(f"Recorded transaction {tx_id} in the ledger.")
-            return tx_id
+    def record_transaction(self, data, **fields):
+        """
+        Record a single entry. fields are optional structured columns
+        (action, file_path, file_hash, actor_role, cms_name). With the
+        background writer running the entry is queued and committed with its
+        batch, and None is returned instead of the row id.
+        """
+        entry = _as_entry(dict(fields, data=data))
+        if self._writer:
+            self._writer.submit(entry)
+            return None
+        tx_id = self._append_entries([entry])[0]
+        logger.info(f"Recorded transaction {tx_id} in the ledger.")
+        return tx_id
+
+    def record_many(self, data_items):
+        """
+        Record several entries in one transaction and return their row ids.
+        Each item is either a data string or a dict with "data" and any of
+        the structured fields.
+        """
+        data_items = [_as_entry(item) for item in data_items]
+        if not data_items:
+            return []
+        ids = self._append_entries(data_items)
+        logger.info(f"Recorded {len(data_items)} transactions in the ledger.")
+        return ids
+
+    def _append_entries(self, entries):
+        # BEGIN IMMEDIATE takes the write lock up front, so reading the chain
+        # head and appending to it cannot interleave with another writer.
+        conn = self._get_connection()
+        c = conn.cursor()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            last_id, prev_hash = self._last_entry(conn)
+            timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+            rows = []
+            for tx_id, entry in enumerate(entries, start=last_id + 1):
+                fields = {field: entry[field] for field in STRUCTURED_FIELDS}
+                entry_hash = compute_entry_hash(tx_id, timestamp, entry["data"], prev_hash, fields)
+                rows.append((tx_id, timestamp, entry["data"]) + tuple(fields.values())
+                            + (ENTRY_VERSION, prev_hash, entry_hash))
+                prev_hash = entry_hash
+            c.executemany(f"INSERT INTO transactions ({', '.join(ENTRY_COLUMNS)}) "
+                          f"VALUES ({', '.join('?' * len(ENTRY_COLUMNS))})", rows)
+            if self.signing_key:
+                self._write_due_checkpoints(conn, rows[-1][0])
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        return [row[0] for row in rows]
+
+    def _write_due_checkpoints(self, conn, last_id):
+        # Each checkpoint covers the next checkpoint_interval rows that exist.
+        # Ids are unique and increasing, so fewer ids than that since the last
+        # checkpoint means none is due; legacy ledgers may have gaps in ids.
+        last_checkpoint = conn.execute("SELECT MAX(last_id) FROM checkpoints").fetchone()[0] or 0
+        while last_id - last_checkpoint >= self.checkpoint_interval:
+            rows = conn.execute("SELECT id, entry_hash FROM transactions WHERE id > ? ORDER BY id LIMIT ?",
+                                (last_checkpoint, self.checkpoint_interval)).fetchall()
+            if len(rows) < self.checkpoint_interval:
+                break
+            first, last = rows[0][0], rows[-1][0]
+            hashes = [row[1] for row in rows]
+            checkpoint = {
+                "first_id": first,
+                "last_id": last,
+                "merkle_root": merkle_root([hash_leaf(bytes.fromhex(h)) for h in hashes]).hex(),
+                "chain_hash": hashes[-1],
+            }
+            signature = sign_data(checkpoint_payload(checkpoint), self.signing_key)
+            conn.execute("INSERT INTO checkpoints (first_id, last_id, merkle_root, chain_hash, signature, timestamp) "
+                         "VALUES (?, ?, ?, ?, ?, ?)",
+                         (first, last, checkpoint["merkle_root"], checkpoint["chain_hash"], signature,
+                          datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")))
+            logger.info(f"Wrote ledger checkpoint for transactions {first}-{last}.")
+            last_checkpoint = last
+
+    def get_checkpoint(self, checkpoint_id=None):
+        """
+        Return a checkpoint as a dict, the latest one if no id is given, or
+        None if there is no such checkpoint.
+        """
+        if checkpoint_id is None:
+            rows = self._query_checkpoints("1 ORDER BY id DESC LIMIT 1", ())
+        else:
+            rows = self._query_checkpoints("id = ?", (checkpoint_id,))
+        return rows[0] if rows else None
+
+    def _query_checkpoints(self, where, params):
+        rows = self._get_connection().execute(
+            f"SELECT {', '.join(CHECKPOINT_COLUMNS)} FROM checkpoints WHERE {where}", params).fetchall()
+        return [dict(zip(CHECKPOINT_COLUMNS, row)) for row in rows]
+
+    def verify_ledger(self, public_key, trusted_checkpoint=None):
+        """
+        Verify the hash chain and every checkpoint after trusted_checkpoint
+        (a checkpoint id the auditor has already validated), or the whole
+        ledger if none is given. Rows before the trusted checkpoint are not
+        read. Returns a dict with valid, rows_checked, checkpoints_checked,
+        last_checkpoint, unhashed_rows and error.
+
+        Rows written before structured columns existed keep entry_version 1:
+        their hash covers id, timestamp and data only, so the columns the
+        migration parsed out of data are not protected by the chain.
+        unhashed_rows counts such rows that carry structured values; filter
+        results over them are only as trustworthy as the database file.
+        """
+        self.flush()
+        conn = self._get_connection()
+        result = {"valid": False, "rows_checked": 0, "checkpoints_checked": 0,
+                  "last_checkpoint": trusted_checkpoint, "unhashed_rows": 0, "error": None}
+
+        start_id, running_hash = 0, GENESIS_HASH
+        if trusted_checkpoint is not None:
+            checkpoint = self.get_checkpoint(trusted_checkpoint)
+            if not checkpoint or not verify_checkpoint_signature(checkpoint, public_key):
+                result["error"] = f"Trusted checkpoint {trusted_checkpoint} is missing or has a bad signature."
+                return result
+            start_id, running_hash = checkpoint["last_id"], checkpoint["chain_hash"]
+
+        pending = self._query_checkpoints("last_id > ? ORDER BY last_id", (start_id,))
+
+        segment = []
+        cursor = conn.execute(f"SELECT {', '.join(ENTRY_COLUMNS)} FROM transactions "
+                              "WHERE id > ? ORDER BY id", (start_id,))
+        for row in cursor:
+            entry = dict(zip(ENTRY_COLUMNS, row))
+            tx_id, prev_hash, entry_hash = entry["id"], entry["prev_hash"], entry["entry_hash"]
+            # Ids may have gaps in legacy ledgers; a row removed after it was
+            # chained breaks the next row's prev_hash.
+            if prev_hash != running_hash or entry_hash != _entry_hash_of(entry):
+                result["error"] = f"Hash chain broken at transaction {tx_id}."
+                return result
+            running_hash = entry_hash
+            result["rows_checked"] += 1
+            if entry["entry_version"] < 2 and any(entry[field] is not None for field in STRUCTURED_FIELDS):
+                result["unhashed_rows"] += 1
+
+            if pending and pending[0]["first_id"] <= tx_id:
+                segment.append(hash_leaf(bytes.fromhex(entry_hash)))
+            if pending and tx_id == pending[0]["last_id"]:
+                checkpoint = pending.pop(0)
+                if (checkpoint["chain_hash"] != entry_hash
+                        or checkpoint["merkle_root"] != merkle_root(segment).hex()
+                        or not verify_checkpoint_signature(checkpoint, public_key)):
+                    result["error"] = f"Checkpoint {checkpoint['id']} does not match the ledger."
+                    return result
+                result["checkpoints_checked"] += 1
+                result["last_checkpoint"] = checkpoint["id"]
+                segment = []
+
+        if pending:
+            result["error"] = f"Checkpoint {pending[0]['id']} covers transactions that are missing."
+            return result
+        result["valid"] = True
+        return result
+
+    def get_inclusion_proof(self, tx_id):
+        """
+        Return an O(log n) proof that a transaction is covered by a signed
+        checkpoint, or None if it has not been checkpointed yet. The proof
+        can be checked with verify_inclusion_proof without the ledger.
+        """
+        self.flush()
+        conn = self._get_connection()
+        checkpoints = self._query_checkpoints("last_id >= ? ORDER BY last_id LIMIT 1", (tx_id,))
+        if not checkpoints or checkpoints[0]["first_id"] > tx_id:
+            return None
+        checkpoint = checkpoints[0]
+        entry = conn.execute(f"SELECT {', '.join(ENTRY_COLUMNS)} FROM transactions WHERE id = ?",
+                             (tx_id,)).fetchone()
+        if entry is None:
+            return None
+        rows = conn.execute("SELECT id, entry_hash FROM transactions WHERE id BETWEEN ? AND ? ORDER BY id",
+                            (checkpoint["first_id"], checkpoint["last_id"])).fetchall()
+        leaves = [hash_leaf(bytes.fromhex(entry_hash)) for _, entry_hash in rows]
+        index = next(i for i, (row_id, _) in enumerate(rows) if row_id == tx_id)
+        return {
+            "entry": dict(zip(ENTRY_COLUMNS, entry)),
+            "checkpoint": checkpoint,
+            "proof": merkle_proof(leaves, index),
+        }
+
+    def start_writer(self):
+        """
+        Start the background writer thread if it is not already running.
+        It is flushed and stopped by close(), which also runs at exit.
+        """
+        if not self._writer:
+            self._writer = LedgerWriter(self, self.batch_size, self.flush_interval,
+                                        self.write_retries, self.retry_backoff)
+            self._writer.start()
+            atexit.register(self.close)
+
+    def open_writer(self):
+        """
+        Start and return a separate LedgerWriter for callers that want
+        their own entries queued and batched without switching the whole
+        ledger to async_writes. The caller flushes and stops it.
+        """
+        writer = LedgerWriter(self, self.batch_size, self.flush_interval, self.write_retries, self.retry_backoff)
+        writer.start()
+        return writer
+
+    def flush(self):
+        """
+        Block until every queued entry has been committed. Raises
+        LedgerWriteError with the entries the writer gave up on.
+        """
+        if self._writer:
+            self._writer.flush()
+
+    async def aflush(self):
+        """
+        asyncio counterpart of flush: waits without blocking the event loop.
+        """
+        if self._writer:
+            import asyncio
+            await asyncio.get_running_loop().run_in_executor(None, self._writer.flush)
+
+    def close(self):
+        """
+        Flush and stop the background writer, then close all connections.
+        Raises LedgerWriteError, after closing, if entries could not be
+        written.
+        """
+        try:
+            if self._writer:
+                writer, self._writer = self._writer, None
+                atexit.unregister(self.close)
+                writer.stop()
+        finally:
+            with self._connections_lock:
+                for conn in self._connections:
+                    conn.close()
+                self._connections = []
+            self._local = threading.local()
+
+    def fetch_page(self, after_id=0, limit=1000, since=None, until=None, text=None, **filters):
+        """
+        Return up to limit entries with id greater than after_id, oldest
+        first, matching structured field filters (e.g. file_path=...). Pass
+        the last returned id as after_id to get the next page. since and
+        until bound the timestamp ("YYYY-MM-DD HH:MM:SS", inclusive) and
+        text matches words in data or file_path.
+        """
+        clauses, params = ["id > ?"], [after_id]
+        if since or until:
+            low, high = self._id_bounds(since, until)
+            if low is None:
+                return []
+            clauses.append("id BETWEEN ? AND ?")
+            params.extend([low, high])
+        if since:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            clauses.append("timestamp <= ?")
+            params.append(until)
+        if text:
+            if self.text_search:
+                clauses.append("id IN (SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ? "
+                               "AND rowid > ?)")
+                params.extend([_fts_phrase(text), after_id])
+            else:
+                clauses.append("(data LIKE ? OR file_path LIKE ?)")
+                params.extend([f"%{text}%", f"%{text}%"])
+        for field, value in filters.items():
+            if field not in STRUCTURED_FIELDS:
+                raise ValueError(f"Unknown ledger filter: {field}")
+            clauses.append(f"{field} = ?")
+            params.append(value)
+        rows = self._get_connection().execute(
+            f"SELECT {', '.join(ENTRY_COLUMNS)} FROM transactions WHERE {' AND '.join(clauses)} "
+            "ORDER BY id LIMIT ?", params + [limit]).fetchall()
+        return [dict(zip(ENTRY_COLUMNS, row)) for row in rows]
+
+    def _id_bounds(self, since, until):
+        # Ids and timestamps are assigned together under the write lock, so
+        # a timestamp range maps to an id range found with two index seeks.
+        conn = self._get_connection()
+        low, high = 1, None
+        if since:
+            row = conn.execute("SELECT id FROM transactions WHERE timestamp >= ? "
+                               "ORDER BY timestamp, id LIMIT 1", (since,)).fetchone()
+            if not row:
+                return None, None
+            low = row[0]
+        if until:
+            row = conn.execute("SELECT id FROM transactions WHERE timestamp <= ? "
+                               "ORDER BY timestamp DESC, id DESC LIMIT 1", (until,)).fetchone()
+            if not row:
+                return None, None
+            high = row[0]
+        else:
+            high = self._last_entry(conn)[0]
+        return low, high
+
+    def iter_transactions(self, page_size=1000, after_id=0, **filters):
+        """
+        Stream matching entries using keyset pagination, holding at most one
+        page in memory.
+        """
+        self.flush()
+        while True:
+            page = self.fetch_page(after_id, page_size, **filters)
+            yield from page
+            if len(page) < page_size:
+                return
+            after_id = page[-1]["id"]
 
     def get_transaction_count(self):
+        self.flush()
         with self._get_connection() as conn:
             c = conn.cursor()
-            c.execute("SELECT COUNT(*) FROM transactions")
+            c.execute("SELECT value FROM ledger_stats WHERE name = 'transaction_count'")
             return c.fetchone()[0]
+
+
+def compute_entry_hash(tx_id, timestamp, data, prev_hash, fields=None):
+    """
+    Hash of a ledger row, committing to its content and its predecessor.
+    fields holds the structured columns of version 2 entries.
+    """
+    payload = {"id": tx_id, "timestamp": timestamp, "data": data}
+    if fields is not None:
+        payload["fields"] = fields
+    payload = json.dumps(payload, sort_keys=True)
+    return hashlib.sha256(bytes.fromhex(prev_hash) + payload.encode("utf-8")).hexdigest()
+
+
+def _entry_hash_of(entry):
+    fields = None
+    if entry.get("entry_version", 1) >= 2:
+        fields = {field: entry.get(field) for field in STRUCTURED_FIELDS}
+    return compute_entry_hash(entry["id"], entry["timestamp"], entry["data"], entry["prev_hash"], fields)
+
+
+def _fts_phrase(text):
+    # Match the words of text as a prefix phrase, e.g. "data report"*.
+    return '"' + text.replace('"', '""') + '"*'
+
+
+def _as_entry(item):
+    if isinstance(item, str):
+        item = {"data": item}
+    unknown = set(item) - set(STRUCTURED_FIELDS) - {"data"}
+    if unknown:
+        raise ValueError(f"Unknown ledger fields: {', '.join(sorted(unknown))}")
+    return {"data": item["data"], **{field: item.get(field) for field in STRUCTURED_FIELDS}}
+
+
+def checkpoint_payload(checkpoint):
+    fields = ("first_id", "last_id", "merkle_root", "chain_hash")
+    return json.dumps({key: checkpoint[key] for key in fields}, sort_keys=True)
+
+
+def verify_checkpoint_signature(checkpoint, public_key):
+    try:
+        return verify_signature(checkpoint_payload(checkpoint), checkpoint["signature"], public_key)
+    except ValueError:
+        return False
+
+
+def verify_inclusion_proof(proof, public_key):
+    """
+    Check a proof from Ledger.get_inclusion_proof: the entry hash, its
+    Merkle path to the checkpoint root and the checkpoint signature.
+    """
+    entry, checkpoint = proof["entry"], proof["checkpoint"]
+    entry_hash = _entry_hash_of(entry)
+    if entry_hash != entry["entry_hash"]:
+        return False
+    leaf = hash_leaf(bytes.fromhex(entry_hash))
+    if not verify_merkle_proof(leaf, proof["proof"], bytes.fromhex(checkpoint["merkle_root"])):
+        return False
+    return verify_checkpoint_signature(checkpoint, public_key)
+
+
+class LedgerWriteError(Exception):
+    """
+    Raised by Ledger.flush and close when the background writer could not
+    commit some entries. records holds them so they can be written again.
+    """
+    def __init__(self, records, error):
+        super().__init__(f"Failed to write {len(records)} ledger entries: {error}")
+        self.records = records
+
+
+class LedgerWriter(threading.Thread):
+    """
+    Daemon thread that drains queued ledger entries and commits them with
+    Ledger.record_many, so many producers share one transaction per batch.
+    A failed batch is retried with exponential backoff; if it still fails
+    its entries are kept and raised from the next flush or stop.
+    """
+    _STOP = object()
+
+    def __init__(self, ledger, batch_size, flush_interval, retries=3, retry_backoff=0.05):
+        super().__init__(name="ledger-writer", daemon=True)
+        self.ledger = ledger
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.queue = queue.Queue()
+        self._failed = []
+        self._error = None
+        self._failed_lock = threading.Lock()
+
+    def submit(self, data):
+        self.queue.put(data)
+
+    def record_transaction(self, data, **fields):
+        """
+        Queue one entry with optional structured fields, as
+        Ledger.record_transaction does with its own writer.
+        """
+        self.submit(_as_entry(dict(fields, data=data)))
+
+    def flush(self):
+        self.queue.join()
+        self._raise_failed()
+
+    def stop(self):
+        self.queue.put(self._STOP)
+        self.join()
+        self._raise_failed()
+
+    def _raise_failed(self):
+        with self._failed_lock:
+            failed, self._failed = self._failed, []
+            error = self._error
+        if failed:
+            raise LedgerWriteError(failed, error)
+
+    def _write(self, records):
+        for attempt in range(self.retries + 1):
+            try:
+                self.ledger.record_many(records)
+                return
+            except Exception as e:
+                error = e
+                if attempt < self.retries:
+                    logger.warning(f"Retrying {len(records)} ledger entries after error: {e}")
+                    time.sleep(self.retry_backoff * 2 ** attempt)
+        logger.error(f"Failed to write {len(records)} ledger entries: {error}")
+        with self._failed_lock:
+            self._failed.extend(records)
+            self._error = error
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if self._STOP in batch:
+                stopping = True
+                # Anything queued behind the stop marker still gets written.
+                while True:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+            records = [data for data in batch if data is not self._STOP]
+            try:
+                if records:
+                    self._write(records)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
@@ -0,0 +1,99 @@
+# src/core/manifest.py
+
+import json
+import os
+from core.merkle import hash_leaf, merkle_proof, merkle_root, verify_merkle_proof
+
+# Ends with the sidecar suffix so directory walks skip it like a sidecar.
+MANIFEST_NAME = ".metl-manifest.metl.json"
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(directory):
+    return os.path.join(directory, MANIFEST_NAME)
+
+
+def entry_path(directory, file_path):
+    """
+    Return the manifest key for a file: its path relative to the manifest
+    directory, with forward slashes.
+    """
+    return os.path.relpath(file_path, directory).replace(os.sep, "/")
+
+
+def entry_leaf(entry, algorithm):
+    return hash_leaf(json.dumps(entry, sort_keys=True, separators=(",", ":")).encode("utf-8"), algorithm)
+
+
+def build_manifest(entries, algorithm, timestamp):
+    """
+    Sort entries by path and return the unsigned manifest: a header that
+    commits to the Merkle root over all entries, and the entries in leaf
+    order.
+    """
+    entries = sorted(entries, key=lambda entry: entry["path"])
+    leaves = [entry_leaf(entry, algorithm) for entry in entries]
+    header = {
+        "manifest_version": MANIFEST_VERSION,
+        "hash_algorithm": algorithm,
+        "merkle_root": merkle_root(leaves, algorithm).hex(),
+        "entry_count": len(entries),
+        "timestamp": timestamp,
+    }
+    return {"header": header, "entries": entries}
+
+
+def manifest_payload(header):
+    return json.dumps(header, sort_keys=True)
+
+
+def manifest_root_matches(manifest):
+    header = manifest["header"]
+    leaves = [entry_leaf(entry, header["hash_algorithm"]) for entry in manifest["entries"]]
+    return (len(leaves) == header["entry_count"]
+            and merkle_root(leaves, header["hash_algorithm"]).hex() == header["merkle_root"])
+
+
+def entry_proof(manifest, path):
+    """
+    Return a standalone proof for one manifest entry: the signed header,
+    the entry and its Merkle audit path. It can be checked without the
+    rest of the manifest.
+    """
+    entries = manifest["entries"]
+    index = _find_entry(entries, path)
+    if index is None:
+        raise KeyError(f"{path} is not in the manifest")
+    algorithm = manifest["header"]["hash_algorithm"]
+    leaves = [entry_leaf(entry, algorithm) for entry in entries]
+    return {
+        "header": manifest["header"],
+        "signature": manifest["signature"],
+        "entry": entries[index],
+        "proof": merkle_proof(leaves, index, algorithm),
+    }
+
+
+def verify_entry_proof(proof):
+    """
+    Check that a proof's entry hashes up to the root in its header. The
+    header signature is checked separately by the caller.
+    """
+    header = proof["header"]
+    algorithm = header["hash_algorithm"]
+    return verify_merkle_proof(entry_leaf(proof["entry"], algorithm), proof["proof"],
+                               bytes.fromhex(header["merkle_root"]), algorithm)
+
+
+def _find_entry(entries, path):
+    # Entries are sorted by path, so a binary search finds one in O(log n).
+    low, high = 0, len(entries)
+    while low < high:
+        mid = (low + high) // 2
+        if entries[mid]["path"] < path:
+            low = mid + 1
+        else:
+            high = mid
+    if low < len(entries) and entries[low]["path"] == path:
+        return low
+    return None
@@ -0,0 +1,147 @@
+# src/core/merkle.py
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from core.hashing import BUFFER_SIZE, DEFAULT_ALGORITHM, new_hasher
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+# Domain separation prefixes so a leaf can never be confused with an
+# interior node (second-preimage protection, as in RFC 6962).
+LEAF_PREFIX = b"\x00"
+NODE_PREFIX = b"\x01"
+
+
+def hash_leaf(data, algorithm=DEFAULT_ALGORITHM):
+    hasher = new_hasher(algorithm)
+    hasher.update(LEAF_PREFIX)
+    hasher.update(data)
+    return hasher.digest()
+
+
+def hash_node(left, right, algorithm=DEFAULT_ALGORITHM):
+    hasher = new_hasher(algorithm)
+    hasher.update(NODE_PREFIX)
+    hasher.update(left)
+    hasher.update(right)
+    return hasher.digest()
+
+
+def merkle_root(leaves, algorithm=DEFAULT_ALGORITHM):
+    """
+    Compute the root of a binary Merkle tree over leaf digests. An odd
+    node at the end of a level is carried up unchanged.
+    """
+    if not leaves:
+        return hash_leaf(b"", algorithm)
+    level = list(leaves)
+    while len(level) > 1:
+        level = _next_level(level, algorithm)
+    return level[0]
+
+
+def _next_level(level, algorithm):
+    parents = [hash_node(level[i], level[i + 1], algorithm) for i in range(0, len(level) - 1, 2)]
+    if len(level) % 2:
+        parents.append(level[-1])
+    return parents
+
+
+def chunk_digests(file_path, chunk_size=DEFAULT_CHUNK_SIZE, algorithm=DEFAULT_ALGORITHM, workers=None):
+    """
+    Hash a file as fixed-size chunks in a thread pool and return the leaf
+    digests in file order. Each chunk is streamed through its own buffer,
+    so memory stays bounded by workers * BUFFER_SIZE.
+    """
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return [hash_leaf(b"", algorithm)]
+    offsets = range(0, size, chunk_size)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(offsets) == 1:
+        return [_hash_chunk(file_path, offset, chunk_size, algorithm) for offset in offsets]
+    with ThreadPoolExecutor(max_workers=min(workers, len(offsets))) as executor:
+        return list(executor.map(lambda offset: _hash_chunk(file_path, offset, chunk_size, algorithm),
+                                 offsets))
+
+
+def _hash_chunk(file_path, offset, chunk_size, algorithm):
+    hasher = new_hasher(algorithm)
+    hasher.update(LEAF_PREFIX)
+    buf = bytearray(min(chunk_size, BUFFER_SIZE))
+    view = memoryview(buf)
+    remaining = chunk_size
+    with open(file_path, "rb", buffering=0) as f:
+        f.seek(offset)
+        while remaining > 0:
+            n = f.readinto(view[:min(remaining, len(buf))])
+            if not n:
+                break
+            hasher.update(view[:n])
+            remaining -= n
+    return hasher.digest()
+
+
+def file_merkle_tree(file_path, chunk_size=DEFAULT_CHUNK_SIZE, algorithm=DEFAULT_ALGORITHM, workers=None):
+    """
+    Return the sidecar form of a file's Merkle digest: the root, the chunk
+    size, the algorithm and the per-chunk leaf digests (hex encoded).
+    """
+    leaves = chunk_digests(file_path, chunk_size, algorithm, workers)
+    return merkle_tree_from_leaves(leaves, chunk_size, algorithm)
+
+
+def merkle_tree_from_leaves(leaves, chunk_size, algorithm=DEFAULT_ALGORITHM):
+    return {
+        "algorithm": algorithm,
+        "chunk_size": chunk_size,
+        "root": merkle_root(leaves, algorithm).hex(),
+        "leaves": [leaf.hex() for leaf in leaves],
+    }
+
+
+def changed_regions(expected, actual):
+    """
+    Compare two Merkle digests with the same chunk size and return the
+    (offset, length) byte ranges whose chunks differ. Chunks present in
+    only one of them (the file grew or shrank) are reported too.
+    """
+    chunk_size = expected["chunk_size"]
+    old, new = expected["leaves"], actual["leaves"]
+    regions = []
+    for index in range(max(len(old), len(new))):
+        if index >= len(old) or index >= len(new) or old[index] != new[index]:
+            regions.append((index * chunk_size, chunk_size))
+    return regions
+
+
+def merkle_proof(leaves, index, algorithm=DEFAULT_ALGORITHM):
+    """
+    Return the audit path for leaves[index] as a list of (side, hex digest)
+    pairs, where side says whether the sibling sits to the left ("L") or
+    right ("R"). Its length is O(log n).
+    """
+    if not 0 <= index < len(leaves):
+        raise IndexError(f"Leaf index {index} out of range")
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        if index % 2:
+            proof.append(("L", level[index - 1].hex()))
+        elif index + 1 < len(level):
+            proof.append(("R", level[index + 1].hex()))
+        # An odd last node is carried up without a sibling.
+        level = _next_level(level, algorithm)
+        index //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf, proof, root, algorithm=DEFAULT_ALGORITHM):
+    """
+    Check that a leaf digest and its audit path hash up to root.
+    """
+    node = leaf
+    for side, sibling in proof:
+        sibling = bytes.fromhex(sibling)
+        node = hash_node(sibling, node, algorithm) if side == "L" else hash_node(node, sibling, algorithm)
+    return node == root
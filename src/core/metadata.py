@@ -1,77 +1,656 @@
 # src/core/metadata.py
 
+import atexit
 import json
-import hashlib
 import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
 from utils.logger import get_logger
 from core.cryptography import sign_data, verify_signature, generate_key_pair, serialize_private_key, serialize_public_key
-from core.ai import AIPolicyRecommender
+from core.hashing import (DEFAULT_ALGORITHM, DIGEST_FLAT, DIGEST_MERKLE, DIGEST_SCOPE_CONTENT, STORAGE_EMBEDDED,
+                          STORAGE_MODES, STORAGE_SIDECAR, compute_file_digest)
+from core.pipeline import ClassifierConsumer, DigestConsumer, MimeConsumer, SizeConsumer, read_once
+from core.manifest import (build_manifest, entry_path, entry_proof, manifest_path_for, manifest_payload,
+                           manifest_root_matches, verify_entry_proof)
+from core.sidecars import LOOKUP_BATCH_SIZE, JsonSidecarStore
+from core.merkle import DEFAULT_CHUNK_SIZE, changed_regions, file_merkle_tree, merkle_tree_from_leaves
 
 logger = get_logger(__name__)
 
+VERIFY_OK = "ok"
+VERIFY_MISSING_SIDECAR = "missing-sidecar"
+VERIFY_HASH_MISMATCH = "hash-mismatch"
+VERIFY_BAD_SIGNATURE = "bad-signature"
+VERIFY_ERROR = "error"
+
+# Marks a sidecar that could not be fetched as part of a batch lookup.
+_UNLOADED = object()
+
+def signed_file_digest(metadata):
+    """
+    Return the file digest a signed sidecar commits to: the flat file_hash
+    or the Merkle root.
+    """
+    if "file_merkle" in metadata:
+        return metadata["file_merkle"]["root"]
+    return metadata.get("file_hash")
+
+def _verify_result(file_path, status, detail):
+    return {"path": file_path, "status": status, "detail": detail}
+
 class MetadataEngine:
     """
     The MetadataEngine handles embedding and verifying metadata
-    in files via sidecar JSON files. It also provides methods for
+    in files via sidecar JSON files, or inside the files themselves
+    through format adapters. It also provides methods for
     key loading/generation, metadata suggestion, and ledger logging
     if a ledger is provided.
     """
 
-    def __init__(self, private_key=None, public_key=None, ledger=None, ai_config=None):
+    def __init__(self, private_key=None, public_key=None, ledger=None, ai_config=None, hash_cache=None,
+                 hash_algorithm=DEFAULT_ALGORITHM, digest_mode=DIGEST_FLAT,
+                 merkle_chunk_size=DEFAULT_CHUNK_SIZE, hash_workers=None, sidecar_store=None,
+                 storage=STORAGE_SIDECAR, adapter_registry=None, metadata_index=None, async_executor=None,
+                 actor_role=None):
         self._private_key = private_key
         self._public_key = public_key
         self.ledger = ledger
-        self.ai_recommender = AIPolicyRecommender(ai_config or {"enabled": True})
+        self.hash_cache = hash_cache
+        self.hash_algorithm = hash_algorithm
+        # In merkle mode the file is hashed as parallel fixed-size chunks and
+        # the sidecar stores the tree instead of a flat file_hash.
+        self.digest_mode = digest_mode
+        self.merkle_chunk_size = merkle_chunk_size
+        self.hash_workers = hash_workers
+        # Where signed metadata lives: <file>.metl.json by default, or a
+        # shared store such as SqliteSidecarStore.
+        self.sidecar_store = sidecar_store or JsonSidecarStore()
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown metadata storage: {storage}")
+        if storage != STORAGE_SIDECAR and digest_mode == DIGEST_MERKLE:
+            raise ValueError("Embedded metadata requires flat digests.")
+        self.storage = storage
+        self._adapter_registry = adapter_registry
+        # Optional MetadataIndex kept up to date with every embed.
+        self.metadata_index = metadata_index
+        # Bounded pool behind the asyncio methods, created on first use.
+        self._async_executor = async_executor
+        # Role recorded with ledger entries; acting_as overrides it per thread.
+        self.actor_role = actor_role
+        self._acting = threading.local()
+        # Background writer for ledger entries of the async calls, opened on
+        # first use so synchronous calls keep committing directly.
+        self._ledger_writer = None
+        self._ledger_writer_lock = threading.Lock()
+        self.ai_config = ai_config
+        self._ai_recommender = None
+
+    @property
+    def ai_recommender(self):
+        # Created on first use: loading the policy rules is only needed to
+        # suggest metadata, not to verify.
+        if self._ai_recommender is None:
+            from core.ai import AIPolicyRecommender
+            self._ai_recommender = AIPolicyRecommender(self.ai_config or {"enabled": True})
+        return self._ai_recommender
 
-    def embed_metadata(self, file_path, metadata_dict, private_key):
+    @property
+    def adapter_registry(self):
+        if self._adapter_registry is None:
+            from adapters.registry import default_registry
+            self._adapter_registry = default_registry()
+        return self._adapter_registry
+
+    @property
+    def async_executor(self):
+        if self._async_executor is None:
+            from core.aio import AsyncExecutor
+            self._async_executor = AsyncExecutor()
+        return self._async_executor
+
+    def embed_metadata(self, file_path, metadata_dict, private_key, file_hash=None, mime_type=None):
         """
-        Embed metadata into a sidecar JSON file. The metadata is signed
-        to ensure integrity.
+        Embed metadata into the file's sidecar, the file itself or both,
+        depending on the engine's storage. The metadata is signed to
+        ensure integrity. file_hash may carry a flat digest of the whole
+        file the caller already computed with the engine's hash algorithm,
+        and mime_type the format sniffed from its first bytes.
         """
-        file_hash = self._compute_file_hash(file_path)
-        metadata_dict["file_hash"] = file_hash
-        signed_metadata = self._sign_metadata(metadata_dict, private_key)
+        adapter = None
+        if self.storage != STORAGE_SIDECAR:
+            adapter = self.adapter_registry.adapter_for(file_path, mime_type)
+            if adapter is None and self.storage == STORAGE_EMBEDDED:
+                raise ValueError(f"No metadata adapter for {file_path}")
 
-        sidecar_path = self._get_sidecar_path(file_path)
-        with open(sidecar_path, "w") as f:
-            json.dump(signed_metadata, f, sort_keys=True)
+        if adapter is not None:
+            signed_metadata = self._embed_in_file(adapter, file_path, metadata_dict, private_key)
+        else:
+            if self.digest_mode == DIGEST_MERKLE:
+                metadata_dict["file_merkle"] = self._compute_file_merkle(
+                    file_path, self.hash_algorithm, self.merkle_chunk_size)
+            else:
+                metadata_dict["file_hash"] = file_hash or self._compute_file_hash(file_path)
+                metadata_dict["hash_algorithm"] = self.hash_algorithm
+            signed_metadata = self._sign_metadata(metadata_dict, private_key)
+
+        if self.storage != STORAGE_EMBEDDED:
+            self.sidecar_store.save(file_path, signed_metadata)
+        if self.metadata_index:
+            self.metadata_index.update(file_path, signed_metadata)
 
         if self.ledger:
-            self.log_to_ledger(f"Embedded metadata into {file_path}")
+            self.log_to_ledger(f"Embedded metadata into {file_path}", action="embed", file_path=file_path,
+                               file_hash=signed_file_digest(signed_metadata))
+
+        return signed_metadata
 
+    def _embed_in_file(self, adapter, file_path, metadata_dict, private_key):
+        if not adapter.can_update_in_place(file_path):
+            # Let the adapter restructure the file once (for example add the
+            # part that holds the metadata) so that the content digest is
+            # stable across the embed that follows.
+            if not (adapter.embed_metadata(file_path, {}) and adapter.can_update_in_place(file_path)):
+                raise ValueError(f"Unable to embed verifiable metadata into {file_path}")
+        metadata_dict["file_hash"] = self._compute_content_digest(file_path, adapter, self.hash_algorithm)
+        metadata_dict["hash_algorithm"] = self.hash_algorithm
+        metadata_dict["digest_scope"] = DIGEST_SCOPE_CONTENT
+        signed_metadata = self._sign_metadata(metadata_dict, private_key)
+        if not adapter.embed_metadata(file_path, signed_metadata):
+            raise ValueError(f"Unable to embed metadata into {file_path}")
         return signed_metadata
 
+    def embed_file(self, file_path, private_key):
+        """
+        Suggest metadata for a file from its content and embed it into a
+        signed sidecar, the file itself or both.
+        """
+        if self.digest_mode == DIGEST_MERKLE or self.storage != STORAGE_SIDECAR:
+            # Merkle digests read chunks in parallel on their own, and
+            # embedded metadata commits to a content digest from the
+            # format adapter, so only the classifier and sniffers share
+            # this pass.
+            results = self.scan_file(file_path, include_digest=False)
+            file_hash = None
+        else:
+            results = self.scan_file(file_path)
+            file_hash = results["digest"]
+        suggestions = results["suggestions"]
+        suggestions["file_size"] = results["size"]
+        suggestions["mime_type"] = results["mime_type"]
+        return self.embed_metadata(file_path, suggestions, private_key, file_hash=file_hash,
+                                   mime_type=results["mime_type"])
+
+    def scan_file(self, file_path, include_digest=True):
+        """
+        Read a file once and fan the same buffers out to the digest, the
+        policy classifier and the size and MIME sniffers. Returns a dict
+        with digest (if requested), suggestions, size and mime_type.
+        """
+        st = os.stat(file_path)
+        cached = None
+        if include_digest and self.hash_cache:
+            cached = self.hash_cache.lookup(st, self.hash_algorithm)
+
+        consumers = {"size": SizeConsumer(), "mime_type": MimeConsumer()}
+        if include_digest and cached is None:
+            consumers["digest"] = DigestConsumer(self.hash_algorithm)
+        if self.ai_recommender.enabled:
+            consumers["tag_scores"] = ClassifierConsumer(self.ai_recommender.classifier)
+        results = read_once(file_path, consumers)
+
+        if "tag_scores" in results:
+            results["suggestions"] = self.ai_recommender.suggestions_from_scores(results.pop("tag_scores"))
+        else:
+            results["suggestions"] = self.ai_recommender.suggest_metadata_from_chunks([])
+        if include_digest and self.hash_cache and cached is None:
+            self.hash_cache.store_if_unchanged(file_path, st, self.hash_algorithm, results["digest"])
+        if cached is not None:
+            results["digest"] = cached
+        return results
+
+    def embed_many(self, file_paths, private_key, workers=None, chunksize=64, mp_context=None):
+        """
+        Embed suggested metadata into sidecars for many files using a pool
+        of worker processes. Each worker loads the signing key once and
+        receives files in chunks of chunksize. mp_context picks how the
+        workers are started (the platform default if None). Returns a
+        summary dict with counts, per-file errors and throughput.
+        """
+        from core.batch import iter_chunks, run_embed_chunks, summarize_results
+        workers = workers or os.cpu_count() or 1
+        start = time.perf_counter()
+        total = 0
+        errors = []
+
+        if workers <= 1:
+            results = self._embed_inline(file_paths, private_key)
+        else:
+            private_key_pem = serialize_private_key(private_key)
+            engine_kwargs = {
+                "ai_config": self.ai_config,
+                "hash_algorithm": self.hash_algorithm,
+                "digest_mode": self.digest_mode,
+                "merkle_chunk_size": self.merkle_chunk_size,
+                "hash_workers": self.hash_workers,
+                "storage": self.storage,
+            }
+            hash_cache_config = self.hash_cache.config if self.hash_cache else None
+            index_config = self.metadata_index.config if self.metadata_index else None
+            results = run_embed_chunks(iter_chunks(file_paths, chunksize), private_key_pem,
+                                       engine_kwargs, hash_cache_config, workers, self.sidecar_store.config,
+                                       index_config, mp_context)
+
+        for path, error, file_hash in results:
+            total += 1
+            if error:
+                logger.error(f"Failed to embed metadata into {path}: {error}")
+                errors.append({"path": path, "error": error})
+            elif workers > 1:
+                # Worker engines have no ledger; record their embeds here.
+                self.log_to_ledger(f"Embedded metadata into {path}", action="embed", file_path=path,
+                                   file_hash=file_hash)
+
+        summary = summarize_results(total, errors, time.perf_counter() - start)
+        logger.info(f"Embedded {summary['succeeded']}/{total} files in {summary['elapsed']:.2f}s "
+                    f"({summary['files_per_sec']:.1f} files/s)")
+        return summary
+
+    def _embed_inline(self, file_paths, private_key):
+        for path in file_paths:
+            try:
+                signed = self.embed_file(path, private_key)
+                yield path, None, signed_file_digest(signed)
+            except Exception as e:
+                yield path, str(e), None
+
     def verify_metadata(self, file_path, public_key):
         """
         Verify the metadata sidecar file against the file's hash and signature.
         """
-        sidecar_path = self._get_sidecar_path(file_path)
-        if not os.path.exists(sidecar_path):
-            logger.error("Sidecar metadata file not found.")
-            return False
+        result = self.check_metadata(file_path, public_key)
+        if result["status"] == VERIFY_OK:
+            logger.info("Metadata signature verified successfully.")
+            return True
+        logger.error(f"Metadata verification failed ({result['status']}): {result['detail']}")
+        return False
+
+    def check_metadata(self, file_path, public_key):
+        """
+        Verify a file against its sidecar (or, depending on the engine's
+        storage, the metadata embedded in it) without logging, returning a
+        dict with the path, a status (ok, missing-sidecar, hash-mismatch,
+        bad-signature or error) and a human-readable detail.
+        """
+        try:
+            extracted_metadata = self.load_metadata(file_path)
+        except (OSError, ValueError) as e:
+            return _verify_result(file_path, VERIFY_ERROR, str(e))
+        return self._check_sidecar(file_path, extracted_metadata, public_key)
+
+    async def aembed_metadata(self, file_path, metadata_dict, private_key, file_hash=None, mime_type=None):
+        """
+        asyncio counterpart of embed_metadata. The work runs on the engine's
+        bounded AsyncExecutor and callers wait for a free slot when it is
+        saturated.
+        """
+        return await self.async_executor.run(self._with_queued_ledger_writes, self.embed_metadata, file_path,
+                                             metadata_dict, private_key, file_hash, mime_type)
+
+    async def aembed_file(self, file_path, private_key):
+        """
+        asyncio counterpart of embed_file.
+        """
+        return await self.async_executor.run(self._with_queued_ledger_writes, self.embed_file, file_path,
+                                             private_key)
+
+    async def averify_metadata(self, file_path, public_key):
+        """
+        asyncio counterpart of verify_metadata.
+        """
+        return await self.async_executor.run(self.verify_metadata, file_path, public_key)
+
+    @contextmanager
+    def queued_ledger_writes(self):
+        """
+        Queue ledger entries made by the current thread while the block runs
+        to the engine's background writer, committed in batches, instead of
+        committing each one. The async calls use this so no pool thread or
+        event loop waits on a transaction; other callers of the same ledger
+        are unaffected. See aflush and close_ledger_writer.
+        """
+        previous = getattr(self._acting, "queue_ledger", False)
+        self._acting.queue_ledger = True
+        try:
+            yield self
+        finally:
+            self._acting.queue_ledger = previous
+
+    def _with_queued_ledger_writes(self, fn, *args):
+        with self.queued_ledger_writes():
+            return fn(*args)
+
+    def _get_ledger_writer(self):
+        with self._ledger_writer_lock:
+            if self._ledger_writer is None:
+                self._ledger_writer = self.ledger.open_writer()
+                atexit.register(self.close_ledger_writer)
+            return self._ledger_writer
+
+    async def aflush(self):
+        """
+        Wait, without blocking the event loop, until ledger entries queued
+        by async calls are committed. Raises LedgerWriteError with entries
+        that could not be written.
+        """
+        if self._ledger_writer:
+            import asyncio
+            await asyncio.get_running_loop().run_in_executor(None, self._ledger_writer.flush)
+
+    def close_ledger_writer(self):
+        """
+        Flush and stop the writer behind queued_ledger_writes, if running.
+        """
+        with self._ledger_writer_lock:
+            writer, self._ledger_writer = self._ledger_writer, None
+        if writer:
+            atexit.unregister(self.close_ledger_writer)
+            writer.stop()
+
+    def load_metadata(self, file_path):
+        """
+        Return a file's signed metadata, or None if there is none. With
+        storage "both" the sidecar is preferred and the embedded copy is
+        the fallback.
+        """
+        metadata = None
+        if self.storage != STORAGE_EMBEDDED:
+            metadata = self.sidecar_store.load(file_path)
+        if metadata is None and self.storage != STORAGE_SIDECAR:
+            adapter = self.adapter_registry.adapter_for(file_path)
+            metadata = (adapter.extract_metadata(file_path) or None) if adapter else None
+        return metadata
 
-        with open(sidecar_path, "r") as f:
-            extracted_metadata = json.load(f)
+    def _check_sidecar(self, file_path, extracted_metadata, public_key):
+        if extracted_metadata is None:
+            return _verify_result(file_path, VERIFY_MISSING_SIDECAR, "Sidecar metadata file not found.")
 
-        file_hash = self._compute_file_hash(file_path)
-        if file_hash != extracted_metadata.get("file_hash"):
-            logger.error("File hash does not match metadata hash.")
-            return False
+        try:
+            mismatch = self._check_file_digest(file_path, extracted_metadata)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            return _verify_result(file_path, VERIFY_ERROR, str(e))
+
+        if mismatch:
+            return _verify_result(file_path, VERIFY_HASH_MISMATCH, mismatch)
 
         signature = extracted_metadata.pop("signature", None)
         if not signature:
-            logger.error("No signature found in metadata.")
-            return False
+            return _verify_result(file_path, VERIFY_BAD_SIGNATURE, "No signature found in metadata.")
 
         metadata_json = json.dumps(extracted_metadata, sort_keys=True)
-        verified = verify_signature(metadata_json, signature, public_key)
-        if verified:
-            logger.info("Metadata signature verified successfully.")
+        try:
+            verified = verify_signature(metadata_json, signature, public_key)
+        except ValueError:
+            verified = False
+        if not verified:
+            return _verify_result(file_path, VERIFY_BAD_SIGNATURE, "Metadata signature verification failed.")
+        return _verify_result(file_path, VERIFY_OK, "")
+
+    def locate_changes(self, file_path):
+        """
+        Return the (offset, length) byte ranges of a file that no longer
+        match its Merkle sidecar, or None if the sidecar has no tree.
+        """
+        expected = (self.sidecar_store.load(file_path) or {}).get("file_merkle")
+        if not expected:
+            return None
+        actual = self._compute_file_merkle(file_path, expected["algorithm"], expected["chunk_size"])
+        return changed_regions(expected, actual)
+
+    def _check_file_digest(self, file_path, extracted_metadata):
+        # Returns a mismatch description, or None if the file matches. Accepts
+        # both the flat file_hash form and the file_merkle tree form.
+        expected_tree = extracted_metadata.get("file_merkle")
+        if expected_tree:
+            actual_tree = self._compute_file_merkle(
+                file_path, expected_tree["algorithm"], expected_tree["chunk_size"])
+            if actual_tree["root"] == expected_tree["root"]:
+                return None
+            regions = changed_regions(expected_tree, actual_tree)
+            ranges = ", ".join(f"{offset}+{length}" for offset, length in regions)
+            return f"File Merkle root does not match metadata. Changed byte ranges: {ranges}"
+
+        # Sidecars written before hash_algorithm was recorded are sha256.
+        algorithm = extracted_metadata.get("hash_algorithm", DEFAULT_ALGORITHM)
+        if extracted_metadata.get("digest_scope") == DIGEST_SCOPE_CONTENT:
+            adapter = self.adapter_registry.adapter_for(file_path)
+            if adapter is None:
+                raise ValueError(f"No metadata adapter for {file_path}")
+            actual = self._compute_content_digest(file_path, adapter, algorithm)
         else:
-            logger.error("Metadata signature verification failed.")
-            logger.debug(f"Failed metadata: {metadata_json}")
-            logger.debug(f"Signature: {signature}")
-        return verified
+            actual = self._compute_file_hash(file_path, algorithm)
+        if actual != extracted_metadata.get("file_hash"):
+            return "File hash does not match metadata hash."
+        return None
+
+    def verify_many(self, file_paths, public_key, workers=None):
+        """
+        Verify many files in a thread pool. Hashing and Ed25519 checks both
+        release the GIL, so threads scale across cores. Yields one
+        check_metadata result per file, in completion order, while keeping
+        only a bounded number of files in flight. Sidecars are fetched from
+        the store in batches.
+        """
+        from core.batch import bounded_map
+        workers = workers or os.cpu_count() or 1
+
+        def check(item):
+            path, metadata = item
+            if metadata is _UNLOADED:
+                # The batch lookup failed; load this file's sidecar on its own
+                # so the error is reported against the right file.
+                return self.check_metadata(path, public_key)
+            return self._check_sidecar(path, metadata, public_key)
+
+        if workers <= 1:
+            for item in self._iter_sidecars(file_paths):
+                yield check(item)
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from bounded_map(executor, check, self._iter_sidecars(file_paths), workers * 4)
+
+    def _iter_sidecars(self, file_paths):
+        # Yields (path, metadata or None), looking paths up LOOKUP_BATCH_SIZE at a time.
+        # Embedded metadata is read per file by check_metadata instead.
+        from core.batch import iter_chunks
+        missing = None if self.storage == STORAGE_SIDECAR else _UNLOADED
+        for chunk in iter_chunks(file_paths, LOOKUP_BATCH_SIZE):
+            if self.storage == STORAGE_EMBEDDED:
+                found = {}
+            else:
+                try:
+                    found = self.sidecar_store.load_many(chunk)
+                except (OSError, ValueError):
+                    found = dict.fromkeys(chunk, _UNLOADED)
+            for path in chunk:
+                yield path, found.get(path, missing)
+
+    def rebuild_index(self, root, workers=None):
+        """
+        Bring the metadata index up to date for every file under root.
+        Metadata is loaded in batches by a thread pool and only entries
+        whose signature changed are re-indexed. Entries for files that are
+        gone or no longer carry metadata are dropped. Returns a dict with
+        the files scanned, re-indexed and dropped.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from core.batch import bounded_map, iter_chunks, iter_files
+        if not self.metadata_index:
+            raise ValueError("No metadata index configured.")
+        workers = workers or os.cpu_count() or 1
+        start = time.perf_counter()
+        generation = self.metadata_index.begin_rebuild()
+        scanned = reindexed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for items in bounded_map(executor, self._load_for_index, iter_chunks(iter_files(root), LOOKUP_BATCH_SIZE),
+                                     workers * 2):
+                scanned += len(items)
+                reindexed += self.metadata_index.update_many(items, generation)
+        dropped = self.metadata_index.prune(root, generation)
+        elapsed = time.perf_counter() - start
+        logger.info(f"Indexed {scanned} files under {root} in {elapsed:.2f}s "
+                    f"({reindexed} changed, {dropped} dropped).")
+        return {"scanned": scanned, "reindexed": reindexed, "dropped": dropped, "elapsed": elapsed}
+
+    def _load_for_index(self, paths):
+        # Returns (path, metadata) for the paths in one batch that have any.
+        found, batch_failed = {}, False
+        if self.storage != STORAGE_EMBEDDED:
+            try:
+                found = self.sidecar_store.load_many(paths)
+            except (OSError, ValueError):
+                # Load one at a time so a bad sidecar is reported on its own.
+                batch_failed = True
+        items = []
+        for path in paths:
+            metadata = found.get(path)
+            if metadata is None and (self.storage != STORAGE_SIDECAR or batch_failed):
+                try:
+                    metadata = self.load_metadata(path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Unable to read metadata for {path}: {e}")
+            if metadata:
+                items.append((path, metadata))
+        return items
+
+    def embed_manifest(self, directory, private_key, workers=None):
+        """
+        Sign one manifest for every file under directory instead of writing
+        a sidecar per file. Each entry records the file's digest and
+        suggested metadata. A single signature covers the Merkle root over
+        all entries, so one file can later be proven with a short audit
+        path. Files that cannot be read are left out and reported. Returns
+        the signed manifest and a list of {"path", "error"} dicts.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from core.batch import bounded_map, iter_files
+
+        def scan(path):
+            try:
+                results = self.scan_file(path)
+            except OSError as e:
+                return None, {"path": path, "error": str(e)}
+            return dict(results["suggestions"], path=entry_path(directory, path), file_hash=results["digest"],
+                        file_size=results["size"], mime_type=results["mime_type"]), None
+
+        entries, errors = [], []
+        workers = workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for entry, error in bounded_map(executor, scan, iter_files(directory), workers * 4):
+                if error:
+                    logger.error(f"Failed to add {error['path']} to the manifest: {error['error']}")
+                    errors.append(error)
+                else:
+                    entries.append(entry)
+
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        manifest = build_manifest(entries, self.hash_algorithm, timestamp)
+        manifest["signature"] = sign_data(manifest_payload(manifest["header"]), private_key)
+        with open(manifest_path_for(directory), "w") as f:
+            json.dump(manifest, f, sort_keys=True)
+
+        self.log_to_ledger(f"Signed manifest of {len(entries)} files in {directory}", action="embed-manifest",
+                           file_path=directory, file_hash=manifest["header"]["merkle_root"])
+        return manifest, errors
+
+    def verify_manifest(self, directory, public_key, workers=None):
+        """
+        Verify a directory against its manifest. Checks the signature and
+        Merkle root once, then yields one check_metadata-style result per
+        entry: hash-mismatch for changed files, error for files that are
+        gone, and missing-sidecar for files the manifest does not list.
+        """
+        manifest_path = manifest_path_for(directory)
+        try:
+            manifest = self.load_manifest(directory)
+        except (OSError, ValueError) as e:
+            yield _verify_result(manifest_path, VERIFY_MISSING_SIDECAR, f"Unable to read manifest: {e}")
+            return
+        invalid = self._check_manifest_header(manifest["header"], manifest.get("signature"), public_key)
+        if not invalid and not manifest_root_matches(manifest):
+            invalid = "Manifest entries do not match the signed Merkle root."
+        if invalid:
+            yield _verify_result(manifest_path, VERIFY_BAD_SIGNATURE, invalid)
+            return
+
+        from concurrent.futures import ThreadPoolExecutor
+        from core.batch import bounded_map, iter_files
+        algorithm = manifest["header"]["hash_algorithm"]
+
+        def check(entry):
+            file_path = os.path.join(directory, *entry["path"].split("/"))
+            return self._check_manifest_entry(file_path, entry, algorithm)
+
+        workers = workers or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            yield from bounded_map(executor, check, manifest["entries"], workers * 4)
+
+        listed = {entry["path"] for entry in manifest["entries"]}
+        for path in iter_files(directory):
+            if entry_path(directory, path) not in listed:
+                yield _verify_result(path, VERIFY_MISSING_SIDECAR, "File is not listed in the manifest.")
+
+    def load_manifest(self, directory):
+        with open(manifest_path_for(directory), "r") as f:
+            return json.load(f)
+
+    def manifest_proof(self, directory, file_path):
+        """
+        Return a standalone proof that file_path is listed in the
+        directory's signed manifest, for check_manifest_proof. This reads
+        the whole manifest; save the proof to check the file cheaply later.
+        """
+        return entry_proof(self.load_manifest(directory), entry_path(directory, file_path))
+
+    def check_manifest_proof(self, directory, file_path, proof, public_key):
+        """
+        Verify a single file against a manifest proof without loading the
+        manifest: the header signature, the entry's audit path to the
+        signed root, that the entry is the file's path under directory and
+        the file's digest.
+        """
+        invalid = self._check_manifest_header(proof["header"], proof.get("signature"), public_key)
+        if not invalid and not verify_entry_proof(proof):
+            invalid = "Manifest entry is not covered by the signed Merkle root."
+        if not invalid and proof["entry"]["path"] != entry_path(directory, file_path):
+            invalid = f"Manifest proof is for {proof['entry']['path']}, not this file."
+        if invalid:
+            return _verify_result(file_path, VERIFY_BAD_SIGNATURE, invalid)
+        return self._check_manifest_entry(file_path, proof["entry"], proof["header"]["hash_algorithm"])
+
+    def _check_manifest_header(self, header, signature, public_key):
+        # Returns a failure description, or None if the header is signed.
+        if not signature:
+            return "No signature found in manifest."
+        try:
+            verified = verify_signature(manifest_payload(header), signature, public_key)
+        except ValueError:
+            verified = False
+        return None if verified else "Manifest signature verification failed."
+
+    def _check_manifest_entry(self, file_path, entry, algorithm):
+        try:
+            file_hash = self._compute_file_hash(file_path, algorithm)
+        except FileNotFoundError:
+            return _verify_result(file_path, VERIFY_ERROR, "File listed in the manifest is missing.")
+        except OSError as e:
+            return _verify_result(file_path, VERIFY_ERROR, str(e))
+        if file_hash != entry["file_hash"]:
+            return _verify_result(file_path, VERIFY_HASH_MISMATCH, "File hash does not match manifest entry.")
+        return _verify_result(file_path, VERIFY_OK, "")
 
     def suggest_metadata(self, content):
         """
@@ -79,6 +658,13 @@ class MetadataEngine:
         """
         return self.ai_recommender.suggest_metadata(content)
 
+    def suggest_metadata_for_file(self, file_path):
+        """
+        Suggest metadata tags for a file, streaming its content in bounded
+        chunks rather than reading it into memory.
+        """
+        return self.ai_recommender.suggest_metadata_for_file(file_path)
+
     def load_private_key(self, key_path="private_key.pem"):
         """
         Load the private key from a PEM file if it exists. Otherwise, generate one.
@@ -117,25 +703,63 @@ class MetadataEngine:
             with open(public_key_path, "wb") as f:
                 f.write(serialize_public_key(self._public_key))
 
-    def log_to_ledger(self, data):
+    @contextmanager
+    def acting_as(self, role):
         """
-        Record a transaction in the ledger if available.
+        Attribute ledger entries made by the current thread to role while
+        the block runs, for services that share one engine between callers.
+        """
+        previous = getattr(self._acting, "role", None)
+        self._acting.role = role
+        try:
+            yield self
+        finally:
+            self._acting.role = previous
+
+    def log_to_ledger(self, data, **fields):
+        """
+        Record a transaction in the ledger if available. fields are passed
+        through as the ledger's structured columns; actor_role defaults to
+        the role the engine is acting as.
         """
         if self.ledger:
-            self.ledger.record_transaction(data)
+            if fields.get("actor_role") is None:
+                fields["actor_role"] = getattr(self._acting, "role", None) or self.actor_role
+            if getattr(self._acting, "queue_ledger", False):
+                self._get_ledger_writer().record_transaction(data, **fields)
+            else:
+                self.ledger.record_transaction(data, **fields)
+
+    def _compute_file_hash(self, file_path, algorithm=None):
+        algorithm = algorithm or self.hash_algorithm
+        if self.hash_cache:
+            return self.hash_cache.get_or_compute(
+                file_path, lambda path: self._hash_file_contents(path, algorithm), algorithm)
+        return self._hash_file_contents(file_path, algorithm)
 
-    def _compute_file_hash(self, file_path):
-        sha256 = hashlib.sha256()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(16384), b""):
-                sha256.update(chunk)
-        return sha256.hexdigest()
+    def _compute_content_digest(self, file_path, adapter, algorithm):
+        if self.hash_cache:
+            return self.hash_cache.get_or_compute(
+                file_path, lambda path: adapter.content_digest(path, algorithm), f"content-{algorithm}")
+        return adapter.content_digest(file_path, algorithm)
+
+    def _hash_file_contents(self, file_path, algorithm=DEFAULT_ALGORITHM):
+        return compute_file_digest(file_path, algorithm)
+
+    def _compute_file_merkle(self, file_path, algorithm, chunk_size):
+        if not self.hash_cache:
+            return file_merkle_tree(file_path, chunk_size, algorithm, self.hash_workers)
+        # The cache stores the leaf list; the root is cheap to rebuild from it.
+        leaves_json = self.hash_cache.get_or_compute(
+            file_path,
+            lambda path: json.dumps(file_merkle_tree(path, chunk_size, algorithm, self.hash_workers)["leaves"]),
+            f"merkle-{algorithm}-{chunk_size}",
+        )
+        leaves = [bytes.fromhex(leaf) for leaf in json.loads(leaves_json)]
+        return merkle_tree_from_leaves(leaves, chunk_size, algorithm)
 
     def _sign_metadata(self, metadata_dict, private_key):
         metadata_json = json.dumps(metadata_dict, sort_keys=True)
         signature = sign_data(metadata_json, private_key)
         metadata_dict["signature"] = signature
         return metadata_dict
-
-    def _get_sidecar_path(self, file_path):
-        return f"{file_path}.metl.json"
\ No newline at end of file
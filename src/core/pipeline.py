@@ -0,0 +1,99 @@
+# src/core/pipeline.py
+
+from core.hashing import BUFFER_SIZE, DEFAULT_ALGORITHM, new_hasher
+
+# Leading bytes of common formats, checked in order.
+MAGIC_NUMBERS = [
+    (b"%PDF-", "application/pdf"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"PK\x03\x04", "application/zip"),
+]
+
+
+def sniff_mime(head):
+    """
+    Guess a MIME type from the first bytes of a file.
+    """
+    for magic, mime_type in MAGIC_NUMBERS:
+        if head.startswith(magic):
+            return mime_type
+    if not head:
+        return "application/octet-stream"
+    try:
+        # A multi-byte character may be cut at the end of the sample.
+        head.decode("utf-8")
+    except UnicodeDecodeError as e:
+        if e.start < len(head) - 3:
+            return "application/octet-stream"
+    return "text/plain"
+
+
+class DigestConsumer:
+    def __init__(self, algorithm=DEFAULT_ALGORITHM):
+        self.hasher = new_hasher(algorithm)
+
+    def update(self, buf):
+        self.hasher.update(buf)
+
+    def result(self):
+        return self.hasher.hexdigest()
+
+
+class ClassifierConsumer:
+    def __init__(self, classifier):
+        self.scan = classifier.scan()
+
+    def update(self, buf):
+        if not self.scan.done:
+            self.scan.update(buf)
+
+    def result(self):
+        return self.scan.result()
+
+
+class SizeConsumer:
+    def __init__(self):
+        self.size = 0
+
+    def update(self, buf):
+        self.size += len(buf)
+
+    def result(self):
+        return self.size
+
+
+class MimeConsumer:
+    SAMPLE_SIZE = 512
+
+    def __init__(self):
+        self.head = b""
+
+    def update(self, buf):
+        if len(self.head) < self.SAMPLE_SIZE:
+            self.head += bytes(buf[:self.SAMPLE_SIZE - len(self.head)])
+
+    def result(self):
+        return sniff_mime(self.head)
+
+
+def read_once(file_path, consumers, buffer_size=BUFFER_SIZE):
+    """
+    Read a file a single time through one reused buffer and feed every
+    chunk to each consumer in consumers (a dict of name -> object with
+    update(buf) and result()). Returns a dict of name -> result().
+    Consumers must copy anything they keep, since the buffer is reused.
+    """
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with open(file_path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            for consumer in consumers.values():
+                consumer.update(chunk)
+    return {name: consumer.result() for name, consumer in consumers.items()}
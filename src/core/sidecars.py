@@ -0,0 +1,224 @@
+# src/core/sidecars.py
+
+import json
+import os
+import sqlite3
+import threading
+from core.manifest import MANIFEST_NAME
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+SIDECAR_SUFFIX = ".metl.json"
+BACKEND_JSON = "json"
+BACKEND_SQLITE = "sqlite"
+# Paths per SELECT when looking sidecars up in bulk; stays well under
+# SQLite's bound-parameter limit.
+LOOKUP_BATCH_SIZE = 500
+
+
+def open_sidecar_store(config=None):
+    """
+    Build a sidecar store from its config dict: {"backend": "json"} (the
+    default) or {"backend": "sqlite", "db_path": ...}.
+    """
+    config = config or {}
+    backend = config.get("backend", BACKEND_JSON)
+    if backend == BACKEND_JSON:
+        return JsonSidecarStore(config)
+    if backend == BACKEND_SQLITE:
+        return SqliteSidecarStore(config)
+    raise ValueError(f"Unknown sidecar backend: {backend}")
+
+
+class JsonSidecarStore:
+    """
+    Stores each file's signed metadata in <file>.metl.json next to it.
+    """
+
+    def __init__(self, config=None):
+        self.config = dict(config or {}, backend=BACKEND_JSON)
+
+    def sidecar_path(self, file_path):
+        return f"{file_path}{SIDECAR_SUFFIX}"
+
+    def load(self, file_path):
+        """
+        Return the stored metadata for file_path, or None if there is none.
+        """
+        try:
+            with open(self.sidecar_path(file_path), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def load_many(self, file_paths):
+        """
+        Return a dict of path -> metadata for the paths that have any.
+        """
+        found = {}
+        for path in file_paths:
+            metadata = self.load(path)
+            if metadata is not None:
+                found[path] = metadata
+        return found
+
+    def save(self, file_path, metadata):
+        with open(self.sidecar_path(file_path), "w") as f:
+            json.dump(metadata, f, sort_keys=True)
+
+    def save_many(self, items):
+        for file_path, metadata in items:
+            self.save(file_path, metadata)
+        return len(items)
+
+    def delete(self, file_path):
+        try:
+            os.remove(self.sidecar_path(file_path))
+        except FileNotFoundError:
+            pass
+
+    def iter_sidecars(self, root):
+        """
+        Yield (file_path, metadata) for every sidecar under root.
+        """
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if not name.endswith(SIDECAR_SUFFIX) or name == MANIFEST_NAME:
+                    continue
+                file_path = os.path.join(dirpath, name[:-len(SIDECAR_SUFFIX)])
+                try:
+                    yield file_path, self.load(file_path)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Unable to read sidecar for {file_path}: {e}")
+
+    def close(self):
+        pass
+
+
+class SqliteSidecarStore:
+    """
+    Stores signed metadata for many files in one SQLite database keyed by
+    absolute path, with the committed content digest indexed alongside.
+    Avoids one extra file per asset on shared filesystems, and answers
+    bulk lookups with a few indexed queries.
+    """
+
+    def __init__(self, config):
+        self.config = dict(config, backend=BACKEND_SQLITE)
+        self.db_path = config.get("db_path", "sidecars.db")
+        self._local = threading.local()
+        self._ensure_db()
+
+    def _ensure_db(self):
+        conn = self._get_connection()
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS sidecars (
+            path TEXT PRIMARY KEY,
+            file_hash TEXT,
+            metadata TEXT NOT NULL
+        )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sidecars_file_hash ON sidecars(file_hash)")
+
+    def _get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def load(self, file_path):
+        row = self._get_connection().execute(
+            "SELECT metadata FROM sidecars WHERE path = ?", (os.path.abspath(file_path),)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_many(self, file_paths):
+        conn = self._get_connection()
+        keys = {os.path.abspath(path): path for path in file_paths}
+        key_list = list(keys)
+        found = {}
+        for start in range(0, len(key_list), LOOKUP_BATCH_SIZE):
+            batch = key_list[start:start + LOOKUP_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            for key, metadata in conn.execute(
+                    f"SELECT path, metadata FROM sidecars WHERE path IN ({placeholders})", batch):
+                found[keys[key]] = json.loads(metadata)
+        return found
+
+    def find_by_hash(self, file_hash):
+        """
+        Return the paths whose stored metadata commits to file_hash.
+        """
+        return [row[0] for row in self._get_connection().execute(
+            "SELECT path FROM sidecars WHERE file_hash = ? ORDER BY path", (file_hash,))]
+
+    def save(self, file_path, metadata):
+        self.save_many([(file_path, metadata)])
+
+    def save_many(self, items):
+        """
+        Store (file_path, metadata) pairs in one transaction.
+        """
+        from core.metadata import signed_file_digest
+        rows = [(os.path.abspath(path), signed_file_digest(metadata), json.dumps(metadata, sort_keys=True))
+                for path, metadata in items]
+        conn = self._get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany("INSERT OR REPLACE INTO sidecars (path, file_hash, metadata) VALUES (?, ?, ?)", rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def delete(self, file_path):
+        self._get_connection().execute("DELETE FROM sidecars WHERE path = ?", (os.path.abspath(file_path),))
+
+    def iter_sidecars(self, root):
+        prefix = os.path.join(os.path.abspath(root), "")
+        # Every path under root sorts between prefix and prefix with its
+        # trailing separator bumped, so the primary key index answers this.
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        for path, metadata in self._get_connection().execute(
+                "SELECT path, metadata FROM sidecars WHERE path >= ? AND path < ? ORDER BY path", (prefix, upper)):
+            yield path, json.loads(metadata)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def copy_sidecars(source, destination, root, batch_size=LOOKUP_BATCH_SIZE, remove=False):
+    """
+    Copy every sidecar under root from one store to another, for example
+    to import existing JSON sidecars into a SQLite store or to export them
+    back. With remove=True the source entries are deleted once copied.
+    Returns the number of sidecars copied.
+    """
+    copied = 0
+    batch = []
+    for file_path, metadata in source.iter_sidecars(root):
+        if metadata is None:
+            continue
+        batch.append((file_path, metadata))
+        if len(batch) >= batch_size:
+            copied += _flush_copy(source, destination, batch, remove)
+            batch = []
+    if batch:
+        copied += _flush_copy(source, destination, batch, remove)
+    logger.info(f"Copied {copied} sidecars under {root}.")
+    return copied
+
+
+def _flush_copy(source, destination, batch, remove):
+    destination.save_many(batch)
+    if remove:
+        for file_path, _ in batch:
+            source.delete(file_path)
+    return len(batch)
@@ -2,25 +2,116 @@
 
 import click
 import os
-from core.metadata import MetadataEngine
+import signal
+import threading
+from core.hashing import (DEFAULT_ALGORITHM, DIGEST_FLAT, DIGEST_MERKLE, STORAGE_MODES, STORAGE_SIDECAR,
+                          SUPPORTED_ALGORITHMS)
+from interfaces.daemon import DaemonClient, DaemonError, MetlDaemon
 from core.rbac import check_permission
 from utils.logger import get_logger
 from utils.auth import authenticate_user
 
 logger = get_logger(__name__)
 
+# Only these commands are forwarded to a running daemon; every other
+# command runs locally without connecting to it.
+DAEMON_COMMANDS = ('embed', 'embed-tree', 'verify', 'verify-tree', 'cache-evict')
+
 @click.group()
 @click.option('--token', prompt='User Token', help='Authentication token to determine user role.')
+@click.option('--hash-cache', default=None, help='SQLite file caching digests of unchanged files.')
+@click.option('--paranoid', is_flag=True, help='Always re-hash files, refreshing the hash cache.')
+@click.option('--hash-algorithm', default=DEFAULT_ALGORITHM, show_default=True,
+              type=click.Choice(SUPPORTED_ALGORITHMS), help='Digest recorded in new sidecars.')
+@click.option('--digest-mode', default=DIGEST_FLAT, show_default=True, type=click.Choice([DIGEST_FLAT, DIGEST_MERKLE]),
+              help='Hash files as one stream or as a Merkle tree of chunks hashed in parallel.')
+@click.option('--merkle-chunk-mib', default=64, show_default=True, help='Merkle chunk size in MiB.')
+@click.option('--sidecar-store', default=None,
+              help='SQLite file holding all sidecars (default: a <file>.metl.json next to each file).')
+@click.option('--storage', default=STORAGE_SIDECAR, show_default=True, type=click.Choice(STORAGE_MODES),
+              help='Keep signed metadata in sidecars, embedded in supported files (PDF, DOCX, JPEG, PNG), or both.')
+@click.option('--index', 'index_path', default=None, envvar='METL_INDEX',
+              help='SQLite metadata search index to keep up to date and to query.')
+@click.option('--socket', 'socket_path', default=None, envvar='METL_SOCKET',
+              help='Unix socket of the METL daemon (default: metl-<uid>.sock in the temp directory).')
+@click.option('--no-daemon', is_flag=True, help='Run locally even if a METL daemon is listening.')
 @click.pass_context
-def cli(ctx, token):
+def cli(ctx, token, hash_cache, paranoid, hash_algorithm, digest_mode, merkle_chunk_mib, sidecar_store, storage,
+        index_path, socket_path, no_daemon):
     user_info = authenticate_user(token)
     ctx.ensure_object(dict)
     ctx.obj['role'] = user_info['role']
+    ctx.obj['socket_path'] = socket_path
+
+    # The engine and keys are loaded on first use by the subcommand, so
+    # --help never pays for them and verify never reads the private key.
+    ctx.obj['engine_options'] = _engine_options(
+        hash_cache=hash_cache, paranoid=paranoid, sidecar_store=sidecar_store, hash_algorithm=hash_algorithm,
+        digest_mode=digest_mode, merkle_chunk_mib=merkle_chunk_mib, storage=storage, index_path=index_path)
+
+    # A running daemon already holds the engine and keys; hand it the work
+    # if its engine is configured like this invocation's.
+    ctx.obj['daemon'] = None
+    if not no_daemon and ctx.invoked_subcommand in DAEMON_COMMANDS:
+        ctx.obj['daemon'] = DaemonClient.connect(socket_path, token=token, options=ctx.obj['engine_options'])
+        if ctx.obj['daemon']:
+            ctx.call_on_close(ctx.obj['daemon'].close)
+
+def _engine_options(hash_cache=None, paranoid=False, sidecar_store=None, hash_algorithm=DEFAULT_ALGORITHM,
+                   digest_mode=DIGEST_FLAT, merkle_chunk_mib=64, storage=STORAGE_SIDECAR, index_path=None):
+    """
+    The engine settings of the global options, with database paths made
+    absolute so a daemon started elsewhere can compare them.
+    """
+    def absolute(path):
+        return os.path.abspath(path) if path else None
+    return {
+        "hash_cache": absolute(hash_cache),
+        "paranoid": paranoid,
+        "sidecar_store": absolute(sidecar_store),
+        "hash_algorithm": hash_algorithm,
+        "digest_mode": digest_mode,
+        "merkle_chunk_size": merkle_chunk_mib * 1024 * 1024,
+        "storage": storage,
+        "metadata_index": absolute(index_path),
+    }
+
+def _get_engine(ctx):
+    if 'engine' not in ctx.obj:
+        from core.hashcache import HashCache
+        from core.metadata import MetadataEngine
+        options = dict(ctx.obj['engine_options'])
+        hash_cache = options.pop("hash_cache")
+        paranoid = options.pop("paranoid")
+        cache = HashCache({"db_path": hash_cache, "paranoid": paranoid}) if hash_cache else None
+        store = _open_sidecar_store(options.pop("sidecar_store"))
+        index_path = options.pop("metadata_index")
+        ctx.obj['engine'] = MetadataEngine(hash_cache=cache, sidecar_store=store,
+                                           metadata_index=_open_index(index_path) if index_path else None,
+                                           actor_role=ctx.obj['role'], **options)
+    return ctx.obj['engine']
+
+def _open_index(db_path):
+    from core.index import MetadataIndex
+    return MetadataIndex({"db_path": db_path})
+
+def _open_sidecar_store(db_path):
+    from core.sidecars import BACKEND_SQLITE, open_sidecar_store
+    return open_sidecar_store({"backend": BACKEND_SQLITE, "db_path": db_path} if db_path else None)
 
-    # Initialize engine and keys
-    ctx.obj['engine'] = MetadataEngine()
-    ctx.obj['private_key'] = ctx.obj['engine'].load_private_key()
-    ctx.obj['public_key'] = ctx.obj['engine'].load_public_key()
+def _get_private_key(ctx):
+    if 'private_key' not in ctx.obj:
+        ctx.obj['private_key'] = _get_engine(ctx).load_private_key()
+    return ctx.obj['private_key']
+
+def _get_public_key(ctx, key_path="public_key.pem"):
+    # Verification only needs the public key. Unlike the engine's loader,
+    # never generate a fresh key pair here: nothing could verify against it.
+    if 'public_key' not in ctx.obj:
+        if not os.path.exists(key_path):
+            return None
+        ctx.obj['public_key'] = _get_engine(ctx).load_public_key(key_path)
+    return ctx.obj['public_key']
 
 @cli.command()
 @click.argument('file_path')
@@ -35,16 +126,43 @@ def embed(ctx, file_path, policy):
         click.echo("File not found.")
         return
 
-    engine = ctx.obj['engine']
-    with open(file_path, "r", errors='ignore') as f:
-        content = f.read()
-    suggestions = engine.suggest_metadata(content)
-    signed_meta = engine.embed_metadata(file_path, suggestions, ctx.obj['private_key'])
+    if ctx.obj['daemon']:
+        signed_meta = _daemon_call(ctx.obj['daemon'].embed, file_path)
+    else:
+        signed_meta = _get_engine(ctx).embed_file(file_path, _get_private_key(ctx))
     if signed_meta:
         click.echo("Metadata embedded successfully.")
     else:
         click.echo("Failed to embed metadata.")
 
+@cli.command('embed-tree')
+@click.argument('directory')
+@click.option('--workers', default=None, type=int, help='Number of worker processes (default: CPU count).')
+@click.option('--chunk-size', default=64, show_default=True, help='Files handed to a worker at a time.')
+@click.pass_context
+def embed_tree(ctx, directory, workers, chunk_size):
+    """Embed metadata sidecars for every file under a directory."""
+    if not check_permission(ctx.obj['role'], 'embed'):
+        click.echo("Permission denied. You do not have embed rights.")
+        return
+    if not os.path.isdir(directory):
+        click.echo("Directory not found.")
+        return
+
+    if ctx.obj['daemon']:
+        summary = _daemon_call(ctx.obj['daemon'].embed_tree, directory, workers=workers, chunk_size=chunk_size)
+        if summary is None:
+            return
+    else:
+        from core.batch import iter_files
+        summary = _get_engine(ctx).embed_many(iter_files(directory), _get_private_key(ctx),
+                                              workers=workers, chunksize=chunk_size)
+    for error in summary['errors']:
+        click.echo(f"Error: {error['path']}: {error['error']}")
+    click.echo(f"Embedded {summary['succeeded']}/{summary['total']} files in "
+               f"{summary['elapsed']:.2f}s ({summary['files_per_sec']:.1f} files/s), "
+               f"{summary['failed']} failed.")
+
 @cli.command()
 @click.argument('file_path')
 @click.pass_context
@@ -57,12 +175,333 @@ def verify(ctx, file_path):
         click.echo("File not found.")
         return
 
-    engine = ctx.obj['engine']
-    verified = engine.verify_metadata(file_path, ctx.obj['public_key'])
+    if ctx.obj['daemon']:
+        result = _daemon_call(ctx.obj['daemon'].verify, file_path)
+        verified = result is not None and result['status'] == "ok"
+    elif not _get_public_key(ctx):
+        click.echo("Public key not found.")
+        return
+    else:
+        verified = _get_engine(ctx).verify_metadata(file_path, _get_public_key(ctx))
     if verified:
         click.echo("Metadata verified successfully.")
     else:
         click.echo("Metadata verification failed.")
 
+@cli.command('verify-tree')
+@click.argument('directory')
+@click.option('--workers', default=None, type=int, help='Number of verification threads (default: CPU count).')
+@click.option('--report', default='-', show_default=True, help='JSONL report path, or - for stdout.')
+@click.pass_context
+def verify_tree(ctx, directory, workers, report):
+    """Verify every file under a directory and write a JSONL report."""
+    if not check_permission(ctx.obj['role'], 'verify'):
+        click.echo("Permission denied. You do not have verify rights.")
+        return
+    if not os.path.isdir(directory):
+        click.echo("Directory not found.")
+        return
+
+    from core.batch import iter_files, write_jsonl_report
+    engine = None
+    if ctx.obj['daemon']:
+        results = ctx.obj['daemon'].verify_tree(directory, workers=workers)
+    elif not _get_public_key(ctx):
+        click.echo("Public key not found.")
+        return
+    else:
+        engine = _get_engine(ctx)
+        results = engine.verify_many(iter_files(directory), _get_public_key(ctx), workers=workers)
+    with click.open_file(report, 'w') as stream:
+        try:
+            counts = write_jsonl_report(results, stream)
+        except DaemonError as e:
+            click.echo(f"METL daemon error: {e}", err=True)
+            return
+    total = sum(counts.values())
+    summary = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    click.echo(f"Verified {total} files ({summary or 'none'}).", err=report == '-')
+    if engine and engine.hash_cache:
+        stats = engine.hash_cache.stats()
+        click.echo(f"Hash cache: {stats['hits']} hits, {stats['misses']} misses.", err=report == '-')
+
+@cli.command('embed-manifest')
+@click.argument('directory')
+@click.option('--workers', default=None, type=int, help='Number of hashing threads (default: CPU count).')
+@click.pass_context
+def embed_manifest(ctx, directory, workers):
+    """Sign one Merkle manifest covering every file under a directory."""
+    if not check_permission(ctx.obj['role'], 'embed'):
+        click.echo("Permission denied. You do not have embed rights.")
+        return
+    if not os.path.isdir(directory):
+        click.echo("Directory not found.")
+        return
+
+    manifest, errors = _get_engine(ctx).embed_manifest(directory, _get_private_key(ctx), workers=workers)
+    for error in errors:
+        click.echo(f"Error: {error['path']}: {error['error']}")
+    header = manifest['header']
+    click.echo(f"Signed manifest of {header['entry_count']} files (root {header['merkle_root']}).")
+
+@cli.command('verify-manifest')
+@click.argument('directory')
+@click.option('--file', 'file_path', default=None, help='Verify only this file, using its Merkle proof.')
+@click.option('--proof', 'proof_path', default=None,
+              help='Proof saved by manifest-proof for --file; the manifest itself is not read.')
+@click.option('--workers', default=None, type=int, help='Number of verification threads (default: CPU count).')
+@click.option('--report', default='-', show_default=True, help='JSONL report path, or - for stdout.')
+@click.pass_context
+def verify_manifest(ctx, directory, file_path, proof_path, workers, report):
+    """Verify a directory, or one file in it, against its signed manifest."""
+    if not check_permission(ctx.obj['role'], 'verify'):
+        click.echo("Permission denied. You do not have verify rights.")
+        return
+    if not os.path.isdir(directory):
+        click.echo("Directory not found.")
+        return
+    public_key = _get_public_key(ctx)
+    if not public_key:
+        click.echo("Public key not found.")
+        return
+
+    import json
+    from core.batch import write_jsonl_report
+    engine = _get_engine(ctx)
+    if proof_path and not file_path:
+        click.echo("--proof requires --file.")
+        return
+    if file_path:
+        try:
+            if proof_path:
+                with open(proof_path, "r") as f:
+                    proof = json.load(f)
+            else:
+                proof = engine.manifest_proof(directory, file_path)
+        except (OSError, ValueError, KeyError) as e:
+            click.echo(f"Unable to load manifest proof: {e}")
+            return
+        results = [engine.check_manifest_proof(directory, file_path, proof, public_key)]
+    else:
+        results = engine.verify_manifest(directory, public_key, workers=workers)
+    with click.open_file(report, 'w') as stream:
+        counts = write_jsonl_report(results, stream)
+    total = sum(counts.values())
+    summary = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    click.echo(f"Verified {total} manifest entries ({summary or 'none'}).", err=report == '-')
+
+@cli.command('manifest-proof')
+@click.argument('directory')
+@click.argument('file_path')
+@click.option('--output', default='-', show_default=True, help='Proof file path, or - for stdout.')
+@click.pass_context
+def manifest_proof(ctx, directory, file_path, output):
+    """Save the Merkle proof of one file in a signed manifest, for verify-manifest --proof."""
+    if not check_permission(ctx.obj['role'], 'verify'):
+        click.echo("Permission denied. You do not have verify rights.")
+        return
+    import json
+    try:
+        proof = _get_engine(ctx).manifest_proof(directory, file_path)
+    except (OSError, ValueError, KeyError) as e:
+        click.echo(f"Unable to build manifest proof: {e}")
+        return
+    with click.open_file(output, 'w') as stream:
+        json.dump(proof, stream, sort_keys=True)
+    if output != '-':
+        click.echo(f"Manifest proof written to {output}.")
+
+@cli.command('sidecars-import')
+@click.argument('directory')
+@click.option('--remove', is_flag=True, help='Delete each JSON sidecar once it is imported.')
+@click.pass_context
+def sidecars_import(ctx, directory, remove):
+    """Move <file>.metl.json sidecars under a directory into the --sidecar-store database."""
+    _copy_sidecars(ctx, directory, remove, to_store=True)
+
+@cli.command('sidecars-export')
+@click.argument('directory')
+@click.option('--remove', is_flag=True, help='Delete each entry from the database once it is exported.')
+@click.pass_context
+def sidecars_export(ctx, directory, remove):
+    """Write <file>.metl.json sidecars for --sidecar-store entries under a directory."""
+    _copy_sidecars(ctx, directory, remove, to_store=False)
+
+def _copy_sidecars(ctx, directory, remove, to_store):
+    if not check_permission(ctx.obj['role'], 'embed'):
+        click.echo("Permission denied. You do not have embed rights.")
+        return
+    db_path = ctx.obj['engine_options']['sidecar_store']
+    if not db_path:
+        click.echo("No sidecar store configured. Use --sidecar-store.")
+        return
+    if not os.path.isdir(directory):
+        click.echo("Directory not found.")
+        return
+
+    from core.sidecars import copy_sidecars
+    json_store, db_store = _open_sidecar_store(None), _open_sidecar_store(db_path)
+    source, destination = (json_store, db_store) if to_store else (db_store, json_store)
+    copied = copy_sidecars(source, destination, directory, remove=remove)
+    click.echo(f"{'Imported' if to_store else 'Exported'} {copied} sidecars.")
+
+@cli.group()
+def index():
+    """Maintain the metadata search index given with --index."""
+
+@index.command('rebuild')
+@click.argument('directory')
+@click.option('--workers', default=None, type=int, help='Threads loading metadata (default: CPU count).')
+@click.pass_context
+def index_rebuild(ctx, directory, workers):
+    """Index the signed metadata of every file under a directory."""
+    if not check_permission(ctx.obj['role'], 'embed'):
+        click.echo("Permission denied. You do not have embed rights.")
+        return
+    if not ctx.obj['engine_options']['metadata_index']:
+        click.echo("No metadata index configured. Use --index.")
+        return
+    if not os.path.isdir(directory):
+        click.echo("Directory not found.")
+        return
+
+    summary = _get_engine(ctx).rebuild_index(directory, workers=workers)
+    click.echo(f"Indexed {summary['scanned']} files in {summary['elapsed']:.2f}s "
+               f"({summary['reindexed']} updated, {summary['dropped']} dropped).")
+
+@cli.command()
+@click.option('--tag', 'tags', multiple=True, help='key=value the metadata must contain. Repeatable.')
+@click.option('--has', 'present', multiple=True, help='Key the metadata must have. Repeatable.')
+@click.option('--missing', multiple=True, help='Key the metadata must lack. Repeatable.')
+@click.option('--under', default=None, help='Only match files under this directory.')
+@click.option('--limit', default=None, type=int, help='Print at most this many paths.')
+@click.option('--count', is_flag=True, help='Print the number of matching files instead of their paths.')
+@click.pass_context
+def query(ctx, tags, present, missing, under, limit, count):
+    """List files whose indexed metadata matches every condition."""
+    if not check_permission(ctx.obj['role'], 'verify'):
+        click.echo("Permission denied. You do not have verify rights.")
+        return
+    index_path = ctx.obj['engine_options']['metadata_index']
+    if not index_path:
+        click.echo("No metadata index configured. Use --index.")
+        return
+    equals = []
+    for tag in tags:
+        key, sep, value = tag.partition('=')
+        if not sep:
+            click.echo(f"Invalid --tag {tag!r}: expected key=value.")
+            return
+        equals.append((key, value))
+
+    metadata_index = _open_index(index_path)
+    if count:
+        click.echo(metadata_index.count(equals, present, missing, root=under))
+        return
+    for path in metadata_index.query(equals, present, missing, root=under, limit=limit):
+        click.echo(path)
+
+@cli.command('cache-evict')
+@click.pass_context
+def cache_evict(ctx):
+    """Drop hash cache entries for files that no longer exist."""
+    if not check_permission(ctx.obj['role'], 'embed'):
+        click.echo("Permission denied. You do not have embed rights.")
+        return
+    if ctx.obj['daemon']:
+        evicted = _daemon_call(ctx.obj['daemon'].cache_evict)
+        if evicted is not None:
+            click.echo(f"Evicted {evicted} stale hash cache entries.")
+        return
+    engine = _get_engine(ctx)
+    if not engine.hash_cache:
+        click.echo("No hash cache configured. Use --hash-cache.")
+        return
+    evicted = engine.hash_cache.evict_missing()
+    click.echo(f"Evicted {evicted} stale hash cache entries.")
+
+@cli.command()
+@click.option('--ledger', 'ledger_path', default=None, help='SQLite ledger that records embeds.')
+@click.pass_context
+def serve(ctx, ledger_path):
+    """Keep the engine, keys and ledger loaded and serve requests on a Unix socket."""
+    from core.ledger import Ledger
+    engine = _get_engine(ctx)
+    private_key = _get_private_key(ctx)
+    public_key = engine.load_public_key()
+    if ledger_path:
+        engine.ledger = Ledger({"db_path": ledger_path, "async_writes": True}, signing_key=private_key)
+
+    daemon = MetlDaemon(engine, private_key, public_key, ctx.obj['socket_path'], options=ctx.obj['engine_options'])
+    try:
+        daemon.bind()
+    except DaemonError as e:
+        click.echo(str(e))
+        return
+    # shutdown() waits for serve_forever(), so it cannot run on the signalled thread.
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=daemon.shutdown).start())
+    click.echo(f"METL daemon listening on {daemon.socket_path}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if engine.ledger:
+            engine.ledger.close()
+
+@cli.command()
+@click.argument('directories', nargs=-1, required=True)
+@click.option('--cms-name', default='watch', show_default=True, help='CMS name recorded in the ledger.')
+@click.option('--workers', default=None, type=int, help='Threads embedding metadata (default: CPU count).')
+@click.option('--queue-size', default=1024, show_default=True, help='Files waiting for a worker before intake blocks.')
+@click.option('--settle', default=2.0, show_default=True, help='Seconds a file must be quiet before it is processed.')
+@click.option('--poll-interval', default=5.0, show_default=True, help='Seconds between scans when polling.')
+@click.option('--backend', default='auto', show_default=True, type=click.Choice(['auto', 'inotify', 'polling']),
+              help='Use inotify where available, or always poll.')
+@click.option('--checkpoints', default='metl-watch.db', show_default=True,
+              help='SQLite file remembering processed files across restarts.')
+@click.option('--ledger', 'ledger_path', default=None, help='SQLite ledger that records embeds.')
+@click.pass_context
+def watch(ctx, directories, cms_name, workers, queue_size, settle, poll_interval, backend, checkpoints, ledger_path):
+    """Embed metadata into files as they are written to CMS drop folders."""
+    from core.ledger import Ledger
+    from interfaces.plugins import CMSPlugin
+    if not check_permission(ctx.obj['role'], 'embed'):
+        click.echo("Permission denied. You do not have embed rights.")
+        return
+    missing = [directory for directory in directories if not os.path.isdir(directory)]
+    if missing:
+        click.echo(f"Directory not found: {missing[0]}")
+        return
+
+    engine = _get_engine(ctx)
+    if ledger_path:
+        engine.ledger = Ledger({"db_path": ledger_path, "async_writes": True}, signing_key=_get_private_key(ctx))
+    plugin = CMSPlugin(cms_name, engine=engine)
+    watcher = plugin.watch(directories, {
+        "workers": workers, "queue_size": queue_size, "settle_seconds": settle, "poll_interval": poll_interval,
+        "backend": backend, "checkpoint_db": checkpoints,
+    })
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    click.echo(f"Watching {', '.join(watcher.directories)}")
+    try:
+        watcher.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        if engine.ledger:
+            engine.ledger.close()
+        click.echo(f"Processed {watcher.stats['processed']} files ({watcher.stats['failed']} failed, "
+                   f"{watcher.stats['skipped']} unchanged).")
+
+def _daemon_call(method, *args, **kwargs):
+    # Report daemon-side failures the way the local commands would.
+    try:
+        return method(*args, **kwargs)
+    except DaemonError as e:
+        click.echo(str(e))
+        return None
+
 if __name__ == '__main__':
     cli()
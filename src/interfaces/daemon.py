@@ -0,0 +1,308 @@
+# src/interfaces/daemon.py
+
+import json
+import os
+import socket
+import socketserver
+import struct
+from core.rbac import check_permission
+from utils.auth import authenticate_user
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+# Frames are a 4-byte big-endian length followed by a compact JSON body.
+_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+# Results of tree operations are streamed back in frames of this many entries.
+RESULT_BATCH_SIZE = 500
+
+OP_PERMISSIONS = {
+    "ping": None,
+    "embed": "embed",
+    "embed-tree": "embed",
+    "verify": "verify",
+    "verify-tree": "verify",
+    "cache-evict": "embed",
+}
+# Seconds to wait for a daemon to accept a connection and answer a ping.
+CONNECT_TIMEOUT = 2.0
+
+
+def default_socket_path():
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), f"metl-{os.getuid()}.sock")
+
+
+class DaemonError(Exception):
+    pass
+
+
+def send_frame(sock, message):
+    body = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def recv_frame(sock):
+    """
+    Read one frame from sock. Returns None if the peer closed the
+    connection between frames.
+    """
+    header = _recv_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (length,) = _HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise DaemonError(f"Frame of {length} bytes exceeds the {MAX_FRAME_SIZE} byte limit.")
+    body = _recv_exact(sock, length)
+    if body is None:
+        raise DaemonError("Connection closed mid-frame.")
+    return json.loads(body)
+
+
+def _recv_exact(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if not n:
+            if received:
+                raise DaemonError("Connection closed mid-frame.")
+            return None
+        received += n
+    return bytes(buf)
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # A connection may carry any number of requests, one after another.
+        while True:
+            try:
+                request = recv_frame(self.request)
+            except (DaemonError, ValueError) as e:
+                logger.error(f"Dropping daemon client: {e}")
+                return
+            if request is None:
+                return
+            try:
+                for response in self.server.daemon.dispatch(request):
+                    send_frame(self.request, response)
+            except OSError:
+                return
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class MetlDaemon:
+    """
+    Serves embed and verify requests over a Unix domain socket so callers
+    skip interpreter startup, key loading and ledger setup. The engine and
+    keys are loaded once by the caller; each request carries the user
+    token and is checked against RBAC like a CLI invocation. The socket is
+    created with mode 0600.
+
+    options describes how the engine was configured. A request sent with
+    different options is refused, so the caller runs it locally instead of
+    silently getting the daemon's sidecar store, digests or cache.
+    """
+
+    def __init__(self, engine, private_key, public_key, socket_path=None, options=None):
+        self.engine = engine
+        self.private_key = private_key
+        self.public_key = public_key
+        self.socket_path = socket_path or default_socket_path()
+        self.options = options
+        self.server = None
+
+    def bind(self):
+        if os.path.exists(self.socket_path):
+            client = DaemonClient.connect(self.socket_path)
+            if client:
+                client.close()
+                raise DaemonError(f"A METL daemon is already listening on {self.socket_path}.")
+            os.unlink(self.socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            self.server = _UnixServer(self.socket_path, _RequestHandler)
+        finally:
+            os.umask(old_umask)
+        self.server.daemon = self
+        logger.info(f"METL daemon listening on {self.socket_path}")
+
+    def serve_forever(self):
+        if not self.server:
+            self.bind()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        if self.server:
+            self.server.shutdown()
+
+    def close(self):
+        if self.server:
+            server, self.server = self.server, None
+            server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        if self.engine.ledger:
+            self.engine.ledger.flush()
+
+    def dispatch(self, request):
+        """
+        Handle one request and yield its response frames. Single-file
+        operations answer with one frame; tree operations stream result
+        batches and finish with a frame marked done.
+        """
+        op = request.get("op")
+        if op not in OP_PERMISSIONS:
+            yield {"ok": False, "done": True, "error": f"Unknown operation: {op}"}
+            return
+        options = request.get("options")
+        if options is not None and self.options is not None and options != self.options:
+            yield {"ok": False, "done": True, "error": "The daemon runs with different engine options."}
+            return
+        action = OP_PERMISSIONS[op]
+        role = authenticate_user(request.get("token", ""))["role"]
+        if action and not check_permission(role, action):
+            yield {"ok": False, "done": True, "error": f"Permission denied. You do not have {action} rights."}
+            return
+
+        try:
+            with self.engine.acting_as(role):
+                yield from getattr(self, "_op_" + op.replace("-", "_"))(request)
+        except Exception as e:
+            logger.error(f"Daemon {op} request failed: {e}")
+            yield {"ok": False, "done": True, "error": str(e)}
+
+    def _op_ping(self, request):
+        yield {"ok": True, "done": True, "pid": os.getpid()}
+
+    def _op_embed(self, request):
+        path = request["path"]
+        if not os.path.exists(path):
+            yield {"ok": False, "done": True, "error": "File not found."}
+            return
+        signed = self.engine.embed_file(path, self.private_key)
+        yield {"ok": bool(signed), "done": True}
+
+    def _op_verify(self, request):
+        path = request["path"]
+        if not os.path.exists(path):
+            yield {"ok": False, "done": True, "error": "File not found."}
+            return
+        result = self.engine.check_metadata(path, self.public_key)
+        yield {"ok": True, "done": True, "result": result}
+
+    def _op_embed_tree(self, request):
+        import multiprocessing
+        from core.batch import iter_files
+        # Forking this threaded server (which may also run the ledger
+        # writer) could hand a worker a lock another thread holds, so the
+        # pool starts its workers from a clean forkserver process.
+        summary = self.engine.embed_many(iter_files(request["directory"]), self.private_key,
+                                         workers=request.get("workers"), chunksize=request.get("chunk_size", 64),
+                                         mp_context=multiprocessing.get_context("forkserver"))
+        yield {"ok": True, "done": True, "summary": summary}
+
+    def _op_verify_tree(self, request):
+        from core.batch import iter_files
+        batch = []
+        for result in self.engine.verify_many(iter_files(request["directory"]), self.public_key,
+                                              workers=request.get("workers")):
+            batch.append(result)
+            if len(batch) >= RESULT_BATCH_SIZE:
+                yield {"ok": True, "done": False, "results": batch}
+                batch = []
+        yield {"ok": True, "done": True, "results": batch}
+
+    def _op_cache_evict(self, request):
+        if not self.engine.hash_cache:
+            yield {"ok": False, "done": True, "error": "No hash cache configured. Use --hash-cache."}
+            return
+        yield {"ok": True, "done": True, "evicted": self.engine.hash_cache.evict_missing()}
+
+
+class DaemonClient:
+    """
+    A connection to a running METL daemon. Paths are made absolute before
+    they are sent, since the daemon may run from another directory. With
+    options set, every request carries them and the daemon refuses it if
+    its engine was configured differently.
+    """
+
+    def __init__(self, sock, token=None, options=None):
+        self.sock = sock
+        self.token = token
+        self.options = options
+
+    @classmethod
+    def connect(cls, socket_path=None, token=None, timeout=CONNECT_TIMEOUT, options=None):
+        """
+        Connect to the daemon, returning None if none is listening, it
+        does not answer a ping within timeout seconds or it runs with other
+        engine options, so the caller can run locally instead. Later
+        requests wait as long as they take.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        client = cls(sock, token, options)
+        try:
+            sock.connect(socket_path or default_socket_path())
+            client.ping()
+        except (OSError, ValueError, DaemonError):
+            sock.close()
+            return None
+        sock.settimeout(None)
+        return client
+
+    def request(self, op, **params):
+        """
+        Send a request and yield its response frames until the last one.
+        Raises DaemonError if the daemon reports a failure.
+        """
+        request = dict(params, op=op, token=self.token)
+        if self.options is not None:
+            request["options"] = self.options
+        send_frame(self.sock, request)
+        while True:
+            response = recv_frame(self.sock)
+            if response is None:
+                raise DaemonError("The METL daemon closed the connection.")
+            if "error" in response:
+                raise DaemonError(response["error"])
+            yield response
+            if response.get("done"):
+                return
+
+    def call(self, op, **params):
+        responses = list(self.request(op, **params))
+        return responses[-1]
+
+    def ping(self):
+        return self.call("ping")
+
+    def embed(self, file_path):
+        return self.call("embed", path=os.path.abspath(file_path))["ok"]
+
+    def verify(self, file_path):
+        return self.call("verify", path=os.path.abspath(file_path))["result"]
+
+    def embed_tree(self, directory, workers=None, chunk_size=64):
+        return self.call("embed-tree", directory=os.path.abspath(directory), workers=workers,
+                         chunk_size=chunk_size)["summary"]
+
+    def verify_tree(self, directory, workers=None):
+        for response in self.request("verify-tree", directory=os.path.abspath(directory), workers=workers):
+            yield from response["results"]
+
+    def cache_evict(self):
+        return self.call("cache-evict")["evicted"]
+
+    def close(self):
+        self.sock.close()
@@ -1,49 +1,211 @@
 # src/interfaces/gui.py
 
+import os
 import sys
-import sqlite3
+import threading
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QMessageBox,
-    QHBoxLayout, QLineEdit, QDialog, QTableWidget, QTableWidgetItem, QMenuBar, QMenu, QAction, QStatusBar
+    QHBoxLayout, QLineEdit, QDialog, QTableView, QHeaderView, QMenuBar, QMenu, QAction, QStatusBar,
+    QTableWidget, QTableWidgetItem, QProgressBar, QComboBox
 )
 from PyQt5.QtGui import QIcon
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QObject, QRunnable, QThreadPool, pyqtSignal
 
-from core.metadata import MetadataEngine
+from core.batch import iter_files
+from core.metadata import MetadataEngine, VERIFY_OK
 from utils.auth import authenticate_user
 from core.ledger import Ledger
 from utils.logger import get_logger
 
 logger = get_logger(__name__)
 
+class LedgerTableModel(QAbstractTableModel):
+    """
+    A read-only table model over the ledger that fetches pages on demand
+    as the view scrolls (canFetchMore/fetchMore) instead of loading every
+    row up front. Filtering runs in SQL through Ledger.fetch_page.
+    """
+    COLUMNS = ("id", "timestamp", "action", "file_path", "data")
+    HEADERS = ("ID", "Timestamp", "Action", "File", "Data")
+
+    def __init__(self, ledger, page_size=500, parent=None):
+        super().__init__(parent)
+        self.ledger = ledger
+        self.page_size = page_size
+        self.filters = {}
+        self._rows = []
+        self._exhausted = False
+
+    def set_filters(self, **filters):
+        """
+        Replace the active filters (since, until, text or structured
+        fields) and restart paging from the first row.
+        """
+        self.beginResetModel()
+        self.filters = {key: value for key, value in filters.items() if value}
+        self._rows = []
+        self._exhausted = False
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        value = self._rows[index.row()][index.column()]
+        return "" if value is None else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        after_id = self._rows[-1][0] if self._rows else 0
+        try:
+            page = self.ledger.fetch_page(after_id, self.page_size, **self.filters)
+        except Exception as e:
+            logger.error(f"Failed to fetch ledger page: {e}")
+            page = []
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(page) - 1)
+            # Plain tuples keep each cached row small.
+            self._rows.extend(tuple(entry[column] for column in self.COLUMNS) for entry in page)
+            self.endInsertRows()
+
+
 class LedgerDialog(QDialog):
-    def __init__(self, parent, rows):
+    def __init__(self, parent, ledger):
         super().__init__(parent)
         self.setWindowTitle("Ledger Transactions")
-        self.resize(600, 400)
-
-        self.table = QTableWidget(self)
-        self.table.setColumnCount(3)
-        self.table.setHorizontalHeaderLabels(["ID", "Data", "Timestamp"])
-        self.table.setRowCount(len(rows))
-        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
-        self.table.setSelectionBehavior(QTableWidget.SelectRows)
-        self.table.setSelectionMode(QTableWidget.SingleSelection)
+        self.resize(800, 500)
+
+        self.model = LedgerTableModel(ledger, parent=self)
+
+        filter_layout = QHBoxLayout()
+        self.since_input = QLineEdit(self)
+        self.since_input.setPlaceholderText("From (YYYY-MM-DD)")
+        self.until_input = QLineEdit(self)
+        self.until_input.setPlaceholderText("To (YYYY-MM-DD)")
+        self.text_input = QLineEdit(self)
+        self.text_input.setPlaceholderText("Search text or file path")
+        self.filter_button = QPushButton("Filter", self)
+        self.filter_button.clicked.connect(self.apply_filters)
+        self.text_input.returnPressed.connect(self.apply_filters)
+        for widget in (self.since_input, self.until_input, self.text_input, self.filter_button):
+            filter_layout.addWidget(widget)
+
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
+        self.table.setEditTriggers(QTableView.NoEditTriggers)
+        self.table.setSelectionBehavior(QTableView.SelectRows)
+        self.table.setSelectionMode(QTableView.SingleSelection)
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setAlternatingRowColors(True)
-
-        for i, r in enumerate(rows):
-            id_item = QTableWidgetItem(str(r[0]))
-            data_item = QTableWidgetItem(str(r[1]))
-            ts_item = QTableWidgetItem(str(r[2]))
-            self.table.setItem(i, 0, id_item)
-            self.table.setItem(i, 1, data_item)
-            self.table.setItem(i, 2, ts_item)
+        # Uniform row heights let the view skip measuring every row.
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
 
         layout = QVBoxLayout(self)
+        layout.addLayout(filter_layout)
         layout.addWidget(self.table)
         self.setLayout(layout)
 
+    def apply_filters(self):
+        since = self.since_input.text().strip()
+        until = self.until_input.text().strip()
+        if until and len(until) == 10:
+            # A bare date includes the whole day.
+            until += " 23:59:59"
+        self.model.set_filters(since=since, until=until, text=self.text_input.text().strip())
+
+class TaskSignals(QObject):
+    # row, success, detail
+    finished = pyqtSignal(int, bool, str)
+
+
+class FileTask(QRunnable):
+    """
+    Embeds or verifies one file on a QThreadPool worker and reports the
+    outcome through TaskSignals, which Qt delivers on the GUI thread.
+    Tasks still queued when the batch is cancelled finish immediately.
+    """
+    def __init__(self, engine, operation, file_path, row, cancel_event):
+        super().__init__()
+        self.engine = engine
+        self.operation = operation
+        self.file_path = file_path
+        self.row = row
+        self.cancel_event = cancel_event
+        self.signals = TaskSignals()
+
+    def run(self):
+        if self.cancel_event.is_set():
+            self.signals.finished.emit(self.row, False, "Cancelled")
+            return
+        try:
+            if self.operation == "embed":
+                signed_meta = self.engine.embed_file(self.file_path, self.engine._private_key)
+                success = bool(signed_meta)
+                detail = "Metadata embedded (sidecar)." if success else "Failed to embed metadata."
+            else:
+                result = self.engine.check_metadata(self.file_path, self.engine._public_key)
+                success = result["status"] == VERIFY_OK
+                detail = "Metadata verified." if success else f"{result['status']}: {result['detail']}"
+        except Exception as e:
+            success, detail = False, str(e)
+        self.signals.finished.emit(self.row, success, detail)
+
+
+class ScanSignals(QObject):
+    # file paths, operation
+    batch = pyqtSignal(list, str)
+    done = pyqtSignal()
+
+
+class FolderScanTask(QRunnable):
+    """
+    Walks a dropped folder on a QThreadPool worker and hands the files to
+    the GUI thread in batches, so a large tree neither blocks the event
+    loop while it is enumerated nor arrives as one huge table update.
+    Scanning stops early when the batch is cancelled.
+    """
+    def __init__(self, directory, operation, cancel_event, batch_size=200):
+        super().__init__()
+        self.directory = directory
+        self.operation = operation
+        self.cancel_event = cancel_event
+        self.batch_size = batch_size
+        self.signals = ScanSignals()
+
+    def run(self):
+        batch = []
+        try:
+            for file_path in iter_files(self.directory):
+                if self.cancel_event.is_set():
+                    batch = []
+                    break
+                batch.append(file_path)
+                if len(batch) >= self.batch_size:
+                    self.signals.batch.emit(batch, self.operation)
+                    batch = []
+            if batch:
+                self.signals.batch.emit(batch, self.operation)
+        except Exception as e:
+            logger.error(f"Failed to scan {self.directory}: {e}")
+        self.signals.done.emit()
+
+
 class METLGUI(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -54,11 +216,19 @@ class METLGUI(QMainWindow):
         self.engine.load_private_key()
         self.engine.load_public_key()
 
+        self.thread_pool = QThreadPool(self)
+        self._cancel_event = threading.Event()
+        self._pending = 0
+        self._scanning = 0
+        self._batch_total = 0
+        self._notify_rows = set()
+
         self.initUI()
+        self.setAcceptDrops(True)
 
     def initUI(self):
         self.setWindowTitle("METL")
-        self.resize(600, 300)
+        self.resize(800, 500)
 
         central_widget = QWidget(self)
         self.setCentralWidget(central_widget)
@@ -91,6 +261,27 @@ class METLGUI(QMainWindow):
         self.btn_verify.clicked.connect(self.select_file_for_verification)
         main_layout.addWidget(self.btn_verify)
 
+        drop_layout = QHBoxLayout()
+        drop_layout.addWidget(QLabel("Drop files or folders to:", self))
+        self.drop_action = QComboBox(self)
+        self.drop_action.addItems(["Embed", "Verify"])
+        drop_layout.addWidget(self.drop_action)
+        self.btn_cancel = QPushButton("Cancel", self)
+        self.btn_cancel.setEnabled(False)
+        self.btn_cancel.clicked.connect(self.cancel_tasks)
+        drop_layout.addWidget(self.btn_cancel)
+        main_layout.addLayout(drop_layout)
+
+        self.progress = QProgressBar(self)
+        self.progress.setValue(0)
+        main_layout.addWidget(self.progress)
+
+        self.results_table = QTableWidget(0, 4, self)
+        self.results_table.setHorizontalHeaderLabels(["File", "Operation", "Status", "Detail"])
+        self.results_table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.results_table.horizontalHeader().setStretchLastSection(True)
+        main_layout.addWidget(self.results_table)
+
         self.btn_ledger = QPushButton("Show Ledger")
         self.btn_ledger.setIcon(QIcon())
         self.btn_ledger.setEnabled(False)
@@ -139,21 +330,7 @@ class METLGUI(QMainWindow):
             self.embed_metadata(file_path)
 
     def embed_metadata(self, file_path):
-        try:
-            with open(file_path, "r", errors='ignore') as f:
-                content = f.read()
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"Unable to read file:\n{e}")
-            return
-
-        suggestions = self.engine.suggest_metadata(content)
-        signed_meta = self.engine.embed_metadata(file_path, suggestions, self.engine._private_key)
-        if signed_meta:
-            QMessageBox.information(self, "Success", "Metadata embedded successfully (sidecar).")
-            self.status_bar.showMessage("Metadata embedded successfully.")
-        else:
-            QMessageBox.critical(self, "Error", "Failed to embed metadata.")
-            self.status_bar.showMessage("Embedding failed.")
+        self.queue_files([file_path], "embed", notify=True)
 
     def select_file_for_verification(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Select File to Verify Metadata")
@@ -161,30 +338,117 @@ class METLGUI(QMainWindow):
             self.verify_metadata(file_path)
 
     def verify_metadata(self, file_path):
-        verified = self.engine.verify_metadata(file_path, self.engine._public_key)
-        if verified:
-            QMessageBox.information(self, "Verification", "Metadata verified successfully.")
-            self.status_bar.showMessage("Metadata verified successfully.")
+        self.queue_files([file_path], "verify", notify=True)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
         else:
-            QMessageBox.critical(self, "Verification Failed", "Metadata verification failed.")
-            self.status_bar.showMessage("Metadata verification failed.")
+            event.ignore()
+
+    def dropEvent(self, event):
+        operation = self.drop_action.currentText().lower()
+        paths = []
+        for url in event.mimeData().urls():
+            path = url.toLocalFile()
+            if os.path.isdir(path):
+                self.queue_folder(path, operation)
+            elif os.path.isfile(path):
+                paths.append(path)
+        if paths:
+            self.queue_files(paths, operation)
+        event.acceptProposedAction()
+
+    def _start_batch(self):
+        if self._pending == 0 and self._scanning == 0:
+            self._cancel_event = threading.Event()
+            self._batch_total = 0
+
+    def queue_folder(self, directory, operation):
+        """
+        Enumerate a folder on the worker pool; its files are queued batch
+        by batch as the scan finds them.
+        """
+        self._start_batch()
+        task = FolderScanTask(directory, operation, self._cancel_event)
+        task.signals.batch.connect(self.queue_files)
+        task.signals.done.connect(self.on_scan_finished)
+        self._scanning += 1
+        self.btn_cancel.setEnabled(True)
+        self.status_bar.showMessage(f"Scanning {directory}...")
+        self.thread_pool.start(task)
+
+    def queue_files(self, file_paths, operation, notify=False):
+        """
+        Queue files for embedding or verification on the worker pool. Each
+        file gets a row in the results table. With notify, a message box
+        reports the outcome, as for single files picked from the dialog.
+        """
+        self._start_batch()
+        first_row = self.results_table.rowCount()
+        # Size the table once per batch rather than once per file.
+        self.results_table.setRowCount(first_row + len(file_paths))
+        for row, file_path in enumerate(file_paths, first_row):
+            for column, text in enumerate((file_path, operation, "Queued", "")):
+                self.results_table.setItem(row, column, QTableWidgetItem(text))
+            if notify:
+                self._notify_rows.add(row)
+            task = FileTask(self.engine, operation, file_path, row, self._cancel_event)
+            task.signals.finished.connect(self.on_task_finished)
+            self._pending += 1
+            self._batch_total += 1
+            self.thread_pool.start(task)
+        self.progress.setMaximum(self._batch_total)
+        self.btn_cancel.setEnabled(True)
+        self.status_bar.showMessage(f"Processing {self._pending} file(s)...")
+
+    def on_scan_finished(self):
+        self._scanning -= 1
+        self._finish_batch()
+
+    def _finish_batch(self):
+        if self._pending == 0 and self._scanning == 0:
+            self.btn_cancel.setEnabled(False)
+            self.status_bar.showMessage(f"Finished {self._batch_total} file(s).")
+
+    def on_task_finished(self, row, success, detail):
+        self._pending -= 1
+        self.results_table.item(row, 2).setText("OK" if success else "Failed")
+        self.results_table.item(row, 3).setText(detail)
+        self.progress.setValue(self._batch_total - self._pending)
+
+        if row in self._notify_rows:
+            self._notify_rows.discard(row)
+            if self.results_table.item(row, 1).text() == "embed":
+                if success:
+                    QMessageBox.information(self, "Success", "Metadata embedded successfully (sidecar).")
+                else:
+                    QMessageBox.critical(self, "Error", f"Failed to embed metadata:\n{detail}")
+            elif success:
+                QMessageBox.information(self, "Verification", "Metadata verified successfully.")
+            else:
+                QMessageBox.critical(self, "Verification Failed", f"Metadata verification failed:\n{detail}")
+
+        self._finish_batch()
+
+    def cancel_tasks(self):
+        """
+        Stop folder scans and skip every queued task that has not started
+        yet; running tasks finish normally.
+        """
+        self._cancel_event.set()
+        self.status_bar.showMessage("Cancelling queued files...")
 
     def show_ledger(self):
         if self.role != "admin":
             QMessageBox.warning(self, "Access Denied", "You do not have permission to view the ledger.")
             return
 
-        conn = sqlite3.connect('ledger.db')
-        c = conn.cursor()
-        c.execute("SELECT id, data, timestamp FROM transactions ORDER BY id ASC")
-        rows = c.fetchall()
-        conn.close()
-
-        if not rows:
+        if not self.ledger.get_transaction_count():
             QMessageBox.information(self, "Ledger", "No transactions recorded.")
             return
 
-        dlg = LedgerDialog(self, rows)
+        dlg = LedgerDialog(self, self.ledger)
         dlg.exec_()
         self.status_bar.showMessage("Ledger viewed.")
 
@@ -1,7 +1,9 @@
 # src/interfaces/plugins.py
 
 from utils.logger import get_logger
-from core.metadata import MetadataEngine
+from core.aio import EngineBusyError
+from core.hashing import STORAGE_SIDECAR
+from core.metadata import MetadataEngine, signed_file_digest
 import os
 
 logger = get_logger(__name__)
@@ -9,39 +11,78 @@ logger = get_logger(__name__)
 class CMSPlugin:
     """
     A plugin to integrate with a CMS, automatically embedding metadata into files
-    processed by the CMS.
+    processed by the CMS. storage selects sidecars, metadata embedded in the
+    files themselves, or both. An already configured engine may be passed
+    instead. role is recorded as the actor of the plugin's ledger entries.
     """
-    def __init__(self, cms_name, ledger=None):
+    def __init__(self, cms_name, ledger=None, storage=STORAGE_SIDECAR, engine=None, role=None):
         self.cms_name = cms_name
-        self.engine = MetadataEngine(ledger=ledger)
+        self.role = role
+        self.engine = engine or MetadataEngine(ledger=ledger, storage=storage)
         self.engine.load_private_key()
         self.engine.load_public_key()
 
     def process_file(self, file_path):
         """
-        Processes a file by embedding suggested metadata into a sidecar.
+        Processes a file by embedding suggested, signed metadata.
         """
-        if not self.engine._private_key:
-            logger.error("Private key not found. Cannot embed metadata.")
+        if not self._can_process(file_path):
             return False
 
-        if not os.path.exists(file_path):
-            logger.error(f"File not found: {file_path}")
+        try:
+            signed_meta = self.engine.embed_file(file_path, self.engine._private_key)
+        except Exception as e:
+            logger.error(f"Unable to read file {file_path}: {e}")
+            return False
+        return self._record(file_path, signed_meta)
+
+    async def process_file_async(self, file_path):
+        """
+        asyncio counterpart of process_file. Embedding runs on the engine's
+        bounded executor and the ledger entry goes to the engine's
+        background writer, so the event loop is never blocked. Raises
+        EngineBusyError when the engine's executor turns the call away.
+        """
+        if not self._can_process(file_path):
             return False
 
         try:
-            with open(file_path, "r", errors='ignore') as f:
-                content = f.read()
+            signed_meta = await self.engine.aembed_file(file_path, self.engine._private_key)
+        except EngineBusyError:
+            # Overload is the caller's to handle, not a file error.
+            raise
         except Exception as e:
             logger.error(f"Unable to read file {file_path}: {e}")
             return False
+        # Queue the entry so the event loop does not wait on a commit.
+        with self.engine.queued_ledger_writes():
+            return self._record(file_path, signed_meta)
 
-        suggestions = self.engine.suggest_metadata(content)
-        signed_meta = self.engine.embed_metadata(file_path, suggestions, self.engine._private_key)
+    def _can_process(self, file_path):
+        if not self.engine._private_key:
+            logger.error("Private key not found. Cannot embed metadata.")
+            return False
+
+        if not os.path.exists(file_path):
+            logger.error(f"File not found: {file_path}")
+            return False
+        return True
+
+    def _record(self, file_path, signed_meta):
         if signed_meta:
-            self.engine.log_to_ledger(f"CMS '{self.cms_name}' embedded metadata into {file_path}")
+            self.engine.log_to_ledger(f"CMS '{self.cms_name}' embedded metadata into {file_path}", action="embed",
+                                      file_path=file_path, file_hash=signed_file_digest(signed_meta),
+                                      actor_role=self.role, cms_name=self.cms_name)
             logger.info(f"CMS '{self.cms_name}' embedded metadata into {file_path}")
             return True
         else:
             logger.error(f"CMS '{self.cms_name}' failed to embed metadata into {file_path}")
             return False
+
+    def watch(self, directories, config=None):
+        """
+        Start processing files as they are written to the CMS drop folders
+        and return the running FolderWatcher. See FolderWatcher for config.
+        """
+        from interfaces.watch import FolderWatcher
+        return FolderWatcher(self, directories, config).start()
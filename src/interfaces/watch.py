@@ -0,0 +1,407 @@
+# src/interfaces/watch.py
+
+import collections
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from core.batch import iter_files
+from core.hashing import STORAGE_SIDECAR
+from core.sidecars import SIDECAR_SUFFIX
+from utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+BACKEND_AUTO = "auto"
+BACKEND_INOTIFY = "inotify"
+BACKEND_POLLING = "polling"
+WATCH_BACKENDS = (BACKEND_AUTO, BACKEND_INOTIFY, BACKEND_POLLING)
+
+# A file is ingested once it has seen no events for this long.
+DEFAULT_SETTLE_SECONDS = 2.0
+DEFAULT_POLL_INTERVAL = 5.0
+DEFAULT_QUEUE_SIZE = 1024
+# Temporary files METL writes beside a file while rewriting it.
+TEMP_PREFIX = ".metl-"
+
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_DONT_FOLLOW = 0x02000000
+_IN_ISDIR = 0x40000000
+_WATCH_MASK = (_IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+               | _IN_ONLYDIR | _IN_DONT_FOLLOW)
+_EVENT = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+
+def is_watched_name(name):
+    """
+    Whether a file name is ingested: METL's own sidecars, manifests and
+    temporary files are not.
+    """
+    return not (name.endswith(SIDECAR_SUFFIX) or name.startswith(TEMP_PREFIX))
+
+
+def _scan(roots):
+    for root in roots:
+        for path in iter_files(root):
+            if is_watched_name(os.path.basename(path)):
+                yield path
+
+
+class WatchCheckpoints:
+    """
+    Remembers the size and mtime of every file the watcher has processed,
+    in SQLite, so a restarted watcher only re-processes files that are new
+    or changed since.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.db_path = config.get("db_path", "metl-watch.db")
+        self._local = threading.local()
+        self._ensure_db()
+
+    def _ensure_db(self):
+        conn = self._get_connection()
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        conn.execute("""
+        CREATE TABLE IF NOT EXISTS watch_checkpoints (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            processed_at REAL NOT NULL
+        )
+        """)
+
+    def _get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def is_current(self, file_path, st):
+        row = self._get_connection().execute(
+            "SELECT size, mtime_ns FROM watch_checkpoints WHERE path = ?", (os.path.abspath(file_path),)).fetchone()
+        return row is not None and row == (st.st_size, st.st_mtime_ns)
+
+    def mark(self, file_path, st):
+        self._get_connection().execute(
+            "INSERT OR REPLACE INTO watch_checkpoints (path, size, mtime_ns, processed_at) VALUES (?, ?, ?, ?)",
+            (os.path.abspath(file_path), st.st_size, st.st_mtime_ns, time.time()))
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class PollingSource:
+    """
+    Finds changed files by re-scanning the roots every interval and
+    comparing sizes and mtimes with the previous scan. The first poll
+    reports every file.
+    """
+
+    def __init__(self, roots, interval=DEFAULT_POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self._snapshot = None
+        self._next_scan = 0.0
+
+    def poll(self, timeout):
+        """
+        Return the paths that changed, waiting at most timeout seconds.
+        """
+        delay = self._next_scan - time.monotonic()
+        if delay > 0:
+            time.sleep(min(delay, timeout))
+            if delay > timeout:
+                return []
+        self._next_scan = time.monotonic() + self.interval
+        snapshot = {}
+        for path in _scan(self.roots):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            snapshot[path] = (st.st_size, st.st_mtime_ns)
+        previous, self._snapshot = self._snapshot or {}, snapshot
+        return [path for path, key in snapshot.items() if previous.get(path) != key]
+
+    def close(self):
+        pass
+
+
+class InotifySource:
+    """
+    Linux inotify watches on every directory under the roots, read through
+    libc so no extra package is needed. Directories created or moved in
+    later are watched and scanned as they appear. If the kernel queue
+    overflows, the next poll re-scans everything; checkpoints keep that
+    from re-processing files.
+    """
+
+    def __init__(self, roots):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux.")
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.roots = roots
+        self._directories = {}
+        # Watches go in before the first scan, so no file slips between them.
+        self._rescan = list(roots)
+        for root in roots:
+            self._watch_tree(root)
+
+    def _watch_tree(self, root):
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), _WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                # ENOSPC means fs.inotify.max_user_watches is exhausted.
+                raise OSError(errno, f"Unable to watch {directory}: {os.strerror(errno)}")
+            self._directories[wd] = directory
+            try:
+                with os.scandir(directory) as it:
+                    stack.extend(entry.path for entry in it if entry.is_dir(follow_symlinks=False))
+            except OSError as e:
+                logger.error(f"Unable to scan directory {directory}: {e}")
+
+    def poll(self, timeout):
+        """
+        Return the paths with file events, waiting at most timeout seconds.
+        """
+        if self._rescan:
+            roots, self._rescan = self._rescan, []
+            return list(_scan(roots))
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + name_length].rstrip(b"\x00")
+            offset += _EVENT.size + name_length
+            if mask & _IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflowed; re-scanning watched folders.")
+                self._rescan = list(self.roots)
+                continue
+            if mask & _IN_IGNORED:
+                self._directories.pop(wd, None)
+                continue
+            directory = self._directories.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            if mask & _IN_ISDIR:
+                if mask & (_IN_CREATE | _IN_MOVED_TO):
+                    self._watch_tree(path)
+                    self._rescan.append(path)
+            elif is_watched_name(os.path.basename(path)):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def open_watch_source(roots, backend=BACKEND_AUTO, poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Return an event source for roots: inotify where available (or when
+    asked for), polling otherwise.
+    """
+    if backend not in WATCH_BACKENDS:
+        raise ValueError(f"Unknown watch backend: {backend}")
+    if backend != BACKEND_POLLING:
+        try:
+            return InotifySource(roots)
+        except (OSError, AttributeError) as e:
+            if backend == BACKEND_INOTIFY:
+                raise
+            logger.info(f"inotify unavailable ({e}); polling every {poll_interval}s.")
+    return PollingSource(roots, poll_interval)
+
+
+class FolderWatcher:
+    """
+    Feeds files that appear or change under CMS drop folders to a
+    CMSPlugin.
+
+    Events for a path are coalesced until the path has been quiet for
+    settle_seconds, so partial writes and bursts are processed once. Due
+    paths whose size and mtime match their checkpoint are skipped, which
+    also covers METL's own writes into the files. The rest go through a
+    bounded queue to a pool of worker threads; when the workers fall
+    behind, the queue blocks the dispatcher instead of growing.
+
+    config keys: workers, queue_size, settle_seconds, poll_interval,
+    backend ("auto", "inotify" or "polling") and checkpoint_db.
+    """
+
+    def __init__(self, plugin, directories, config=None):
+        config = config or {}
+        self.plugin = plugin
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.workers = config.get("workers") or os.cpu_count() or 1
+        self.settle_seconds = config.get("settle_seconds", DEFAULT_SETTLE_SECONDS)
+        self.poll_interval = config.get("poll_interval", DEFAULT_POLL_INTERVAL)
+        self.backend = config.get("backend", BACKEND_AUTO)
+        self.checkpoints = WatchCheckpoints({"db_path": config.get("checkpoint_db", "metl-watch.db")})
+        self.stats = {"processed": 0, "failed": 0, "skipped": 0}
+        self.source = None
+        self._queue = queue.Queue(config.get("queue_size", DEFAULT_QUEUE_SIZE))
+        # path -> time of its last event, oldest first.
+        self._pending = collections.OrderedDict()
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._scanned = False
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.source = open_watch_source(self.directories, self.backend, self.poll_interval)
+        self._threads = [threading.Thread(target=self._dispatch_loop, name="metl-watch-dispatch", daemon=True)]
+        self._threads += [threading.Thread(target=self._worker_loop, name=f"metl-watch-{i}", daemon=True)
+                          for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Watching {', '.join(self.directories)} with {type(self.source).__name__} "
+                    f"and {self.workers} workers.")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.source:
+            self.source.close()
+        self.checkpoints.close()
+
+    def wait(self, timeout=None):
+        """
+        Block until the watcher is stopped or its dispatcher fails.
+        """
+        return self._stop.wait(timeout)
+
+    def wait_idle(self, timeout=None):
+        """
+        Block until the first scan is done and no path is pending, queued
+        or being processed. Returns False on timeout.
+        """
+        with self._idle:
+            return self._idle.wait_for(
+                lambda: self._scanned and not self._pending and not self._in_flight, timeout)
+
+    def _dispatch_loop(self):
+        try:
+            while not self._stop.is_set():
+                with self._lock:
+                    oldest = next(iter(self._pending.values()), None)
+                timeout = 1.0 if oldest is None else max(0.0, oldest + self.settle_seconds - time.monotonic())
+                paths = self.source.poll(min(timeout, 1.0))
+                now = time.monotonic()
+                with self._lock:
+                    for path in paths:
+                        self._pending[path] = now
+                        self._pending.move_to_end(path)
+                    self._scanned = True
+                for path in self._due(now):
+                    self._enqueue(path)
+                with self._idle:
+                    self._idle.notify_all()
+        except Exception as e:
+            logger.error(f"Watch dispatcher failed: {e}")
+            self._stop.set()
+        finally:
+            for _ in range(self.workers):
+                self._queue.put(None)
+
+    def _due(self, now):
+        due = []
+        with self._lock:
+            while self._pending:
+                path, last_event = next(iter(self._pending.items()))
+                if now - last_event < self.settle_seconds:
+                    break
+                del self._pending[path]
+                if path in self._in_flight:
+                    # Changed while queued or processing: look again later.
+                    self._pending[path] = now
+                    continue
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if self.checkpoints.is_current(path, st):
+                    self.stats["skipped"] += 1
+                    continue
+                self._in_flight.add(path)
+                due.append(path)
+        return due
+
+    def _enqueue(self, path):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(path, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        with self._lock:
+            self._in_flight.discard(path)
+
+    def _worker_loop(self):
+        while True:
+            path = self._queue.get()
+            if path is None:
+                return
+            try:
+                self._process(path)
+            finally:
+                with self._idle:
+                    self._in_flight.discard(path)
+                    self._idle.notify_all()
+
+    def _process(self, path):
+        try:
+            before = os.stat(path)
+            ok = self.plugin.process_file(path)
+            # Embedded storage rewrites the file, so its own write must not
+            # look like a change; sidecar storage leaves it untouched.
+            st = before if self.plugin.engine.storage == STORAGE_SIDECAR else os.stat(path)
+        except Exception as e:
+            logger.error(f"Unable to process watched file {path}: {e}")
+            ok = False
+        if ok:
+            self.checkpoints.mark(path, st)
+        with self._lock:
+            self.stats["processed" if ok else "failed"] += 1
@@ -1,32 +1,151 @@
 # src/utils/encryption.py
 
 import os
+import struct
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.primitives import serialization, hashes, keywrap
-from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 import json
 
+NONCE_SIZE = 12
+TAG_SIZE = 16
+# AESGCM wants the tag appended to the ciphertext, but blobs store it in
+# front, so decrypting through it copies the ciphertext once. From this
+# size on decrypt_metadata passes the tag to a GCM decryptor separately
+# instead; below it, setting up that decryptor costs more than the copy.
+DETACHED_TAG_MIN_SIZE = 512 * 1024
+
+# Streaming format: a header of magic, version, chunk size and a random
+# 7-byte nonce prefix, then one AES-GCM frame (ciphertext + tag) per
+# chunk. Chunk i is sealed under nonce prefix || i || last-flag with the
+# header as associated data, so frames cannot be reordered, dropped,
+# truncated at a chunk boundary or moved to another stream.
+STREAM_MAGIC = b"MTLS"
+STREAM_VERSION = 1
+STREAM_CHUNK_SIZE = 1024 * 1024
+MAX_STREAM_CHUNK_SIZE = 64 * 1024 * 1024
+_STREAM_HEADER = struct.Struct("!4sBI7s")
+_MAX_CHUNKS = 2 ** 32
+
+
 class EncryptionManager:
     def __init__(self, key: bytes):
         # key should be 32 bytes for AES-256
         self.key = key
+        # One AEAD context serves every call; only the nonce changes.
+        self._aead = AESGCM(key)
+        self._aes = algorithms.AES(key)
 
     def encrypt_metadata(self, metadata: dict) -> bytes:
         plaintext = json.dumps(metadata, sort_keys=True).encode('utf-8')
-        iv = os.urandom(12)  # GCM nonce
-        cipher = Cipher(algorithms.AES(self.key), modes.GCM(iv))
-        encryptor = cipher.encryptor()
-        ciphertext = encryptor.update(plaintext) + encryptor.finalize()
-        return iv + encryptor.tag + ciphertext
+        iv = os.urandom(NONCE_SIZE)  # GCM nonce
+        sealed = memoryview(self._aead.encrypt(iv, plaintext, None))
+        # Moving the tag in front of the ciphertext copies the output once.
+        return b"".join((iv, sealed[-TAG_SIZE:], sealed[:-TAG_SIZE]))
 
     def decrypt_metadata(self, data: bytes) -> dict:
-        # data format: iv(12 bytes) + tag(16 bytes) + ciphertext
-        if len(data) < 28:
+        # data format: iv(12 bytes) + tag(16 bytes) + ciphertext. Any
+        # bytes-like object is accepted and sliced through a memoryview.
+        view = memoryview(data)
+        if len(view) < NONCE_SIZE + TAG_SIZE:
             raise ValueError("Invalid encrypted data length.")
-        iv = data[:12]
-        tag = data[12:28]
-        ciphertext = data[28:]
-        cipher = Cipher(algorithms.AES(self.key), modes.GCM(iv, tag))
-        decryptor = cipher.decryptor()
-        plaintext = decryptor.update(ciphertext) + decryptor.finalize()
-        return json.loads(plaintext.decode('utf-8'))
+        iv = view[:NONCE_SIZE]
+        tag = view[NONCE_SIZE:NONCE_SIZE + TAG_SIZE]
+        ciphertext = view[NONCE_SIZE + TAG_SIZE:]
+        if len(ciphertext) < DETACHED_TAG_MIN_SIZE:
+            plaintext = self._aead.decrypt(iv, b"".join((ciphertext, tag)), None)
+        else:
+            decryptor = Cipher(self._aes, modes.GCM(iv, bytes(tag))).decryptor()
+            plaintext = decryptor.update(ciphertext)
+            decryptor.finalize()
+        return json.loads(plaintext)
+
+    def encrypt_many(self, metadata_list):
+        """
+        Encrypt a batch of metadata dicts with the shared AEAD context.
+        """
+        return [self.encrypt_metadata(metadata) for metadata in metadata_list]
+
+    def decrypt_many(self, blobs):
+        """
+        Decrypt a batch of encrypted metadata blobs, in order.
+        """
+        return [self.decrypt_metadata(blob) for blob in blobs]
+
+    def encrypt_stream(self, reader, writer, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Encrypt everything readable from reader into writer in the chunked
+        streaming format. Memory stays bounded by two chunks regardless of
+        the payload size. Returns the number of plaintext bytes encrypted.
+        """
+        if not 0 < chunk_size <= MAX_STREAM_CHUNK_SIZE:
+            raise ValueError(f"Chunk size must be between 1 and {MAX_STREAM_CHUNK_SIZE} bytes.")
+        header = _STREAM_HEADER.pack(STREAM_MAGIC, STREAM_VERSION, chunk_size, os.urandom(7))
+        writer.write(header)
+        total = 0
+        for index, chunk, last in _iter_stream_chunks(reader, chunk_size):
+            writer.write(self._aead.encrypt(_stream_nonce(header, index, last), chunk, header))
+            total += len(chunk)
+        return total
+
+    def decrypt_stream(self, reader, writer):
+        """
+        Decrypt a stream written by encrypt_stream into writer. Frames are
+        read into reused buffers and authenticated straight from memoryview
+        slices. Raises cryptography.exceptions.InvalidTag if any frame was
+        altered, reordered or the stream was truncated. Returns the number
+        of plaintext bytes written.
+        """
+        header = _read_full(reader, bytearray(_STREAM_HEADER.size))
+        if len(header) < _STREAM_HEADER.size:
+            raise ValueError("Invalid encrypted stream header.")
+        header = bytes(header)
+        magic, version, chunk_size, _ = _STREAM_HEADER.unpack(header)
+        if magic != STREAM_MAGIC or version != STREAM_VERSION:
+            raise ValueError("Not a METL encrypted stream.")
+        if not 0 < chunk_size <= MAX_STREAM_CHUNK_SIZE:
+            raise ValueError(f"Invalid stream chunk size: {chunk_size}")
+
+        total = 0
+        for index, frame, last in _iter_stream_chunks(reader, chunk_size + TAG_SIZE):
+            if len(frame) < TAG_SIZE:
+                raise ValueError("Encrypted stream is truncated.")
+            plaintext = self._aead.decrypt(_stream_nonce(header, index, last), frame, header)
+            writer.write(plaintext)
+            total += len(plaintext)
+        return total
+
+
+def _stream_nonce(header, index, last):
+    if index >= _MAX_CHUNKS:
+        raise ValueError("Stream has too many chunks for its nonce space.")
+    return header[-7:] + struct.pack("!IB", index, 1 if last else 0)
+
+
+def _iter_stream_chunks(reader, size):
+    # Yields (index, memoryview, is_last) over fixed-size reads from
+    # reader, using two alternating buffers so the final chunk is known
+    # before it is yielded. Each view is only valid until the next one.
+    buffers = (bytearray(size), bytearray(size))
+    current = _read_full(reader, buffers[0])
+    index = 0
+    while True:
+        following = _read_full(reader, buffers[(index + 1) % 2])
+        last = not following
+        yield index, current, last
+        if last:
+            return
+        current = following
+        index += 1
+
+
+def _read_full(reader, buf):
+    # Fill buf from reader, stopping early only at end of stream, and
+    # return a memoryview of the bytes read.
+    view = memoryview(buf)
+    filled = 0
+    while filled < len(buf):
+        n = reader.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return view[:filled]
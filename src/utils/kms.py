@@ -1,11 +1,86 @@
 # src/utils/kms.py
+import base64
+import json
 import os
+import struct
+import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from utils.encryption import EncryptionManager
+
+# Envelope blobs: magic, version, wrapped data key length and wrapped data
+# key, followed by the data key's EncryptionManager output.
+ENVELOPE_MAGIC = b"MTLE"
+ENVELOPE_VERSION = 1
+_ENVELOPE_HEADER = struct.Struct("!4sBH")
+
+# Mock master key for demonstration. DO NOT use in production.
+_MOCK_MASTER_KEY = b'\x00' * 32
+
+
+class DataKeyCache:
+    """
+    An in-memory cache of unwrapped data keys. Entries expire after ttl
+    seconds or max_uses lookups, whichever comes first, and the least
+    recently used entry is evicted once max_entries is reached.
+    """
+
+    def __init__(self, ttl=300, max_uses=10000, max_entries=1000):
+        self.ttl = ttl
+        self.max_uses = max_uses
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        """
+        Return the cached value for cache_key and count one use, or None if
+        it is missing, expired or used up.
+        """
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry and (time.monotonic() - entry["created"] > self.ttl or entry["uses"] >= self.max_uses):
+                del self._entries[cache_key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            entry["uses"] += 1
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, cache_key, value):
+        with self._lock:
+            self._entries[cache_key] = {"value": value, "created": time.monotonic(), "uses": 1}
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
 
 class KMSClient:
-    def __init__(self, provider="mock", key_id=None, region=None):
+    def __init__(self, provider="mock", key_id=None, region=None, endpoint=None, cache=None, timeout=10):
         self.provider = provider
         self.key_id = key_id
         self.region = region
+        # Used by the "http" provider: a KMS speaking the AWS KMS JSON
+        # protocol, such as utils.kms_emulator.
+        self.endpoint = endpoint
+        self.timeout = timeout
+        # Without a cache every envelope operation costs a KMS round trip.
+        self.cache = cache if cache is not None else DataKeyCache()
         # In a real scenario, you would initialize a client to connect to AWS KMS or another service.
 
     def retrieve_encryption_key(self) -> bytes:
@@ -22,4 +97,110 @@ class KMSClient:
             raise NotImplementedError("AWS KMS integration not implemented yet.")
         else:
             # Mock key for demonstration. DO NOT use in production.
-            return b'\x00' * 32
+            return _MOCK_MASTER_KEY
+
+    def generate_data_key(self):
+        """
+        Ask the KMS for a fresh AES-256 data key. Returns (plaintext key,
+        wrapped key); only the wrapped key may be stored.
+        """
+        if self.provider == "http":
+            response = self._call("GenerateDataKey", {"KeyId": self.key_id, "KeySpec": "AES_256"})
+            return base64.b64decode(response["Plaintext"]), base64.b64decode(response["CiphertextBlob"])
+        if self.provider == "aws":
+            raise NotImplementedError("AWS KMS integration not implemented yet.")
+        data_key = os.urandom(32)
+        nonce = os.urandom(12)
+        return data_key, nonce + AESGCM(self.retrieve_encryption_key()).encrypt(nonce, data_key, None)
+
+    def decrypt_data_key(self, wrapped_key):
+        """
+        Unwrap a data key through the KMS.
+        """
+        if self.provider == "http":
+            response = self._call("Decrypt", {"CiphertextBlob": base64.b64encode(wrapped_key).decode("ascii")})
+            return base64.b64decode(response["Plaintext"])
+        if self.provider == "aws":
+            raise NotImplementedError("AWS KMS integration not implemented yet.")
+        return AESGCM(self.retrieve_encryption_key()).decrypt(wrapped_key[:12], wrapped_key[12:], None)
+
+    def encrypt_metadata(self, metadata: dict) -> bytes:
+        """
+        Envelope-encrypt metadata: encrypt it under a data key and store
+        the wrapped data key alongside the ciphertext. The current data key
+        is reused from the cache until it expires or runs out of uses.
+        """
+        wrapped_key, manager = self._encryption_key()
+        return _ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, len(wrapped_key)) + wrapped_key \
+            + manager.encrypt_metadata(metadata)
+
+    def decrypt_metadata(self, data: bytes) -> dict:
+        """
+        Decrypt an envelope produced by encrypt_metadata. The KMS is only
+        contacted when the wrapped data key is not cached.
+        """
+        view = memoryview(data)
+        wrapped_key, offset = _parse_envelope(view)
+        return self._decryption_manager(wrapped_key).decrypt_metadata(view[offset:])
+
+    def encrypt_stream(self, reader, writer, **kwargs):
+        """
+        Envelope-encrypt a stream: the envelope header, then the data key's
+        chunked EncryptionManager stream.
+        """
+        wrapped_key, manager = self._encryption_key()
+        writer.write(_ENVELOPE_HEADER.pack(ENVELOPE_MAGIC, ENVELOPE_VERSION, len(wrapped_key)) + wrapped_key)
+        return manager.encrypt_stream(reader, writer, **kwargs)
+
+    def decrypt_stream(self, reader, writer):
+        header = reader.read(_ENVELOPE_HEADER.size)
+        if len(header) < _ENVELOPE_HEADER.size:
+            raise ValueError("Invalid envelope header.")
+        magic, version, key_length = _ENVELOPE_HEADER.unpack(header)
+        if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION:
+            raise ValueError("Not a METL envelope.")
+        wrapped_key = reader.read(key_length)
+        if len(wrapped_key) < key_length:
+            raise ValueError("Invalid envelope header.")
+        return self._decryption_manager(wrapped_key).decrypt_stream(reader, writer)
+
+    def _encryption_key(self):
+        cache_key = ("encrypt", self.provider, self.key_id)
+        cached = self.cache.get(cache_key)
+        if cached is None:
+            data_key, wrapped_key = self.generate_data_key()
+            cached = (wrapped_key, EncryptionManager(data_key))
+            self.cache.put(cache_key, cached)
+            # Encrypting with a fresh key means it can decrypt, too.
+            self.cache.put(("decrypt", self.provider, wrapped_key), cached[1])
+        return cached
+
+    def _decryption_manager(self, wrapped_key):
+        cache_key = ("decrypt", self.provider, bytes(wrapped_key))
+        manager = self.cache.get(cache_key)
+        if manager is None:
+            manager = EncryptionManager(self.decrypt_data_key(bytes(wrapped_key)))
+            self.cache.put(cache_key, manager)
+        return manager
+
+    def _call(self, operation, payload):
+        request = urllib.request.Request(
+            self.endpoint,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/x-amz-json-1.1", "X-Amz-Target": f"TrentService.{operation}"},
+            method="POST",
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+def _parse_envelope(view):
+    if len(view) < _ENVELOPE_HEADER.size:
+        raise ValueError("Invalid envelope length.")
+    magic, version, key_length = _ENVELOPE_HEADER.unpack(view[:_ENVELOPE_HEADER.size])
+    if magic != ENVELOPE_MAGIC or version != ENVELOPE_VERSION:
+        raise ValueError("Not a METL envelope.")
+    offset = _ENVELOPE_HEADER.size + key_length
+    if len(view) < offset:
+        raise ValueError("Invalid envelope length.")
+    return bytes(view[_ENVELOPE_HEADER.size:offset]), offset
@@ -0,0 +1,111 @@
+# src/utils/kms_emulator.py
+import base64
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+
+class KMSEmulator:
+    """
+    A local stand-in for a KMS speaking the AWS KMS JSON protocol
+    (GenerateDataKey and Decrypt), for tests and development. Master keys
+    are generated per KeyId on first use and live only in memory. Request
+    counts per operation are kept in calls.
+
+    Usage:
+        emulator = KMSEmulator()
+        emulator.start()
+        client = KMSClient(provider="http", key_id="alias/metl", endpoint=emulator.url)
+        ...
+        emulator.stop()
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.port = port
+        self.calls = {}
+        self._master_keys = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self._server.server_address[1]}/"
+
+    def start(self):
+        emulator = self
+
+        class Handler(_KMSRequestHandler):
+            kms = emulator
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="kms-emulator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def handle(self, operation, payload):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if operation == "GenerateDataKey":
+            key_id = payload.get("KeyId") or "default"
+            data_key = os.urandom(32)
+            return {"KeyId": key_id, "Plaintext": _b64(data_key), "CiphertextBlob": _b64(self._wrap(key_id, data_key))}
+        if operation == "Decrypt":
+            key_id, data_key = self._unwrap(base64.b64decode(payload["CiphertextBlob"]))
+            return {"KeyId": key_id, "Plaintext": _b64(data_key)}
+        raise ValueError(f"Unsupported operation: {operation}")
+
+    def _master_key(self, key_id):
+        with self._lock:
+            return self._master_keys.setdefault(key_id, AESGCM.generate_key(bit_length=256))
+
+    def _wrap(self, key_id, data_key):
+        encoded_id = key_id.encode("utf-8")
+        nonce = os.urandom(12)
+        sealed = AESGCM(self._master_key(key_id)).encrypt(nonce, data_key, encoded_id)
+        return bytes([len(encoded_id)]) + encoded_id + nonce + sealed
+
+    def _unwrap(self, blob):
+        id_length = blob[0]
+        encoded_id = blob[1:1 + id_length]
+        nonce = blob[1 + id_length:13 + id_length]
+        key_id = encoded_id.decode("utf-8")
+        return key_id, AESGCM(self._master_key(key_id)).decrypt(nonce, blob[13 + id_length:], encoded_id)
+
+
+class _KMSRequestHandler(BaseHTTPRequestHandler):
+    kms = None
+
+    def do_POST(self):
+        operation = self.headers.get("X-Amz-Target", "").rpartition(".")[2]
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            status, body = 200, self.kms.handle(operation, payload)
+        except (InvalidTag, IndexError, KeyError, UnicodeDecodeError):
+            status, body = 400, {"__type": "InvalidCiphertextException"}
+        except ValueError as e:
+            status, body = 400, {"__type": "ValidationException", "message": str(e)}
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _b64(data):
+    return base64.b64encode(data).decode("ascii")
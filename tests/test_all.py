@@ -7,6 +7,7 @@ from interfaces.cli import cli
 from interfaces.gui import METLGUI
 from PyQt5.QtWidgets import QApplication
 import sys
+import json
 from core.metadata import MetadataEngine
 from core.cryptography import generate_key_pair, serialize_private_key, serialize_public_key
 from cryptography.hazmat.primitives import serialization
@@ -67,11 +68,13 @@ def test_gui_verify_metadata(qapp, tmp_path):
     sidecar.write_text('{"file_hash":"abc","signature":"xyz"}')  # placeholder
 
     with patch("PyQt5.QtWidgets.QFileDialog.getOpenFileName", return_value=(str(test_file), "")), \
-         patch("core.metadata.MetadataEngine.verify_metadata", return_value=True), \
+         patch("core.metadata.MetadataEngine.check_metadata", return_value={"status": "ok", "detail": ""}), \
          patch("utils.auth.authenticate_user", return_value={"role":"metadata-verifier"}), \
          patch("PyQt5.QtWidgets.QMessageBox.information") as mock_info:
         gui = METLGUI()
         gui.select_file_for_verification()
+        gui.thread_pool.waitForDone()
+        qapp.processEvents()
         mock_info.assert_called_once()
 
 @pytest.mark.parametrize("file_size_kb", [1, 1024, 5120])
@@ -91,3 +94,1102 @@ def test_large_file_performance(tmp_path, file_size_kb):
     engine.embed_metadata(str(test_file), stable_metadata, private_key)
     verified = engine.verify_metadata(str(test_file), public_key)
     assert verified, "Verification should not fail for large file"
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_embed_many(tmp_path, workers):
+    for i in range(5):
+        (tmp_path / f"file{i}.txt").write_text(f"patient record {i}")
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "sub" / "nested.txt").write_text("financial report")
+
+    engine = MetadataEngine()
+    private_key = engine.load_private_key()
+    public_key = engine.load_public_key()
+
+    from core.batch import iter_files
+    summary = engine.embed_many(iter_files(str(tmp_path)), private_key, workers=workers, chunksize=2)
+    assert summary["total"] == 6
+    assert summary["failed"] == 0
+    for path in iter_files(str(tmp_path)):
+        assert engine.verify_metadata(path, public_key)
+
+def test_cli_embed_tree_command(tmp_path):
+    runner = CliRunner()
+    (tmp_path / "a.txt").write_text("personal data")
+    (tmp_path / "b.txt").write_text("general content")
+
+    result = runner.invoke(cli, ["embed-tree", str(tmp_path), "--workers", "1"], input="alice-token\n", catch_exceptions=False)
+    assert result.exit_code == 0, f"CLI embed-tree failed: {result.output}"
+    assert "Embedded 2/2 files" in result.output
+    assert (tmp_path / "a.txt.metl.json").exists()
+
+def test_verify_many_statuses(tmp_path):
+    engine = MetadataEngine()
+    private_key = engine.load_private_key()
+    public_key = engine.load_public_key()
+
+    ok_file = tmp_path / "ok.txt"
+    ok_file.write_text("unchanged")
+    tampered = tmp_path / "tampered.txt"
+    tampered.write_text("original")
+    forged = tmp_path / "forged.txt"
+    forged.write_text("content")
+    missing = tmp_path / "missing.txt"
+    missing.write_text("no sidecar")
+
+    for path in (ok_file, tampered, forged):
+        engine.embed_metadata(str(path), {"test": "bulk"}, private_key)
+    tampered.write_text("modified")
+    sidecar = tmp_path / "forged.txt.metl.json"
+    sidecar.write_text(sidecar.read_text().replace('"bulk"', '"forged"'))
+
+    results = {r["path"]: r["status"] for r in engine.verify_many(
+        [str(ok_file), str(tampered), str(forged), str(missing)], public_key, workers=4)}
+    assert results == {
+        str(ok_file): "ok",
+        str(tampered): "hash-mismatch",
+        str(forged): "bad-signature",
+        str(missing): "missing-sidecar",
+    }
+
+def test_cli_verify_tree_command(tmp_path):
+    runner = CliRunner()
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "a.txt").write_text("personal data")
+    (data_dir / "b.txt").write_text("general content")
+    runner.invoke(cli, ["embed-tree", str(data_dir), "--workers", "1"], input="alice-token\n", catch_exceptions=False)
+    (data_dir / "c.txt").write_text("never embedded")
+
+    report = tmp_path / "report.jsonl"
+    result = runner.invoke(cli, ["verify-tree", str(data_dir), "--report", str(report)], input="bob-token\n", catch_exceptions=False)
+    assert result.exit_code == 0, f"CLI verify-tree failed: {result.output}"
+    assert "missing-sidecar: 1, ok: 2" in result.output
+    lines = [json.loads(line) for line in report.read_text().splitlines()]
+    assert sorted(line["status"] for line in lines) == ["missing-sidecar", "ok", "ok"]
+
+def test_hash_cache_hits_and_eviction(tmp_path):
+    from core.hashcache import HashCache
+    test_file = tmp_path / "cached.bin"
+    test_file.write_bytes(os.urandom(4096))
+    old = time.time() - 60
+    os.utime(test_file, (old, old))
+
+    cache = HashCache({"db_path": str(tmp_path / "cache.db")})
+    engine = MetadataEngine(hash_cache=cache)
+    private_key = engine.load_private_key()
+    public_key = engine.load_public_key()
+
+    engine.embed_metadata(str(test_file), {"test": "cache"}, private_key)
+    assert engine.verify_metadata(str(test_file), public_key)
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+    # Rewriting the file changes its stat key, so the stale digest is not reused.
+    test_file.write_bytes(os.urandom(4096))
+    assert not engine.verify_metadata(str(test_file), public_key)
+    assert cache.stats()["misses"] == 2
+
+    paranoid = HashCache({"db_path": str(tmp_path / "cache.db"), "paranoid": True})
+    paranoid.get_or_compute(str(test_file), engine._hash_file_contents)
+    assert paranoid.stats() == {"hits": 0, "misses": 1}
+    # scan_file goes through the same counted lookups.
+    MetadataEngine(hash_cache=paranoid).scan_file(str(test_file))
+    assert paranoid.stats() == {"hits": 0, "misses": 2}
+
+    os.utime(test_file, (old, old))
+    cache.get_or_compute(str(test_file), engine._hash_file_contents)
+    test_file.unlink()
+    assert cache.evict_missing() == 1
+
+@pytest.mark.parametrize("size", [10, 2 * 1024 * 1024, 65 * 1024 * 1024])
+def test_hashing_strategies_match_hashlib(tmp_path, size):
+    import hashlib
+    from core.hashing import compute_file_digest
+    data = os.urandom(1024) * (size // 1024) + os.urandom(size % 1024)
+    test_file = tmp_path / "data.bin"
+    test_file.write_bytes(data)
+    assert compute_file_digest(str(test_file)) == hashlib.sha256(data).hexdigest()
+    assert compute_file_digest(str(test_file), "blake2b") == hashlib.blake2b(data).hexdigest()
+
+def test_blake2b_and_legacy_sidecars_verify(tmp_path):
+    test_file = tmp_path / "doc.txt"
+    test_file.write_text("some content")
+
+    engine = MetadataEngine(hash_algorithm="blake2b")
+    private_key = engine.load_private_key()
+    public_key = engine.load_public_key()
+    signed = engine.embed_metadata(str(test_file), {"test": "algo"}, private_key)
+    assert signed["hash_algorithm"] == "blake2b"
+    assert MetadataEngine().verify_metadata(str(test_file), public_key)
+
+    # Sidecars written before hash_algorithm existed carry a bare sha256 file_hash.
+    import hashlib
+    from core.cryptography import sign_data
+    legacy = {"test": "legacy", "file_hash": hashlib.sha256(b"some content").hexdigest()}
+    legacy["signature"] = sign_data(json.dumps(legacy, sort_keys=True), private_key)
+    (tmp_path / "doc.txt.metl.json").write_text(json.dumps(legacy))
+    assert engine.verify_metadata(str(test_file), public_key)
+
+def test_merkle_digest_mode_localizes_changes(tmp_path):
+    chunk_size = 64 * 1024
+    test_file = tmp_path / "image.bin"
+    test_file.write_bytes(os.urandom(chunk_size * 5 + 100))
+
+    engine = MetadataEngine(digest_mode="merkle", merkle_chunk_size=chunk_size, hash_workers=4)
+    private_key = engine.load_private_key()
+    public_key = engine.load_public_key()
+    signed = engine.embed_metadata(str(test_file), {"test": "merkle"}, private_key)
+    assert "file_hash" not in signed
+    assert len(signed["file_merkle"]["leaves"]) == 6
+    assert MetadataEngine().verify_metadata(str(test_file), public_key)
+
+    with open(test_file, "r+b") as f:
+        f.seek(chunk_size * 3 + 10)
+        f.write(b"tampered")
+    assert engine.locate_changes(str(test_file)) == [(chunk_size * 3, chunk_size)]
+    result = engine.check_metadata(str(test_file), public_key)
+    assert result["status"] == "hash-mismatch"
+    assert f"{chunk_size * 3}+{chunk_size}" in result["detail"]
+
+def test_ledger_record_many_and_background_writer(tmp_path):
+    from core.ledger import Ledger
+    ledger = Ledger({"db_path": str(tmp_path / "ledger.db")})
+    first = ledger.record_transaction("single entry")
+    ids = ledger.record_many(f"bulk entry {i}" for i in range(100))
+    assert ids == list(range(first + 1, first + 101))
+    ledger.close()
+
+    ledger = Ledger({"db_path": str(tmp_path / "ledger.db"), "async_writes": True,
+                     "batch_size": 64, "flush_interval_ms": 5})
+    import threading
+    threads = [threading.Thread(target=lambda: [ledger.record_transaction("queued") for _ in range(250)])
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert ledger.get_transaction_count() == 1101
+    ledger.record_transaction("written on close")
+    ledger.close()
+    assert Ledger({"db_path": str(tmp_path / "ledger.db")}).get_transaction_count() == 1102
+
+def test_ledger_writer_retries_and_reports_failed_batches(tmp_path):
+    import sqlite3
+    from core.ledger import Ledger, LedgerWriteError
+    ledger = Ledger({"db_path": str(tmp_path / "ledger.db"), "async_writes": True,
+                     "write_retries": 2, "retry_backoff_ms": 1})
+    real_record_many = Ledger.record_many
+    calls = []
+    def flaky_record_many(self, items):
+        calls.append(len(items))
+        if len(calls) <= 2:
+            raise sqlite3.OperationalError("database is locked")
+        return real_record_many(self, items)
+
+    with patch.object(Ledger, "record_many", flaky_record_many):
+        ledger.record_transaction("retried")
+        ledger.flush()
+    assert len(calls) == 3 and ledger.get_transaction_count() == 1
+
+    with patch.object(Ledger, "record_many", side_effect=sqlite3.OperationalError("disk I/O error")):
+        ledger.record_transaction("lost", action="embed")
+        with pytest.raises(LedgerWriteError) as excinfo:
+            ledger.flush()
+    assert [record["data"] for record in excinfo.value.records] == ["lost"]
+    ledger.flush()
+    ledger.record_many(excinfo.value.records)
+    assert ledger.get_transaction_count() == 2
+
+    with patch.object(Ledger, "record_many", side_effect=sqlite3.OperationalError("disk I/O error")):
+        ledger.record_transaction("lost on close")
+        with pytest.raises(LedgerWriteError):
+            ledger.close()
+    assert Ledger({"db_path": str(tmp_path / "ledger.db")}).get_transaction_count() == 2
+
+def test_ledger_hash_chain_checkpoints_and_proofs(tmp_path):
+    import sqlite3
+    from core.ledger import Ledger, verify_inclusion_proof
+    private_key, public_key = generate_key_pair()
+    db_path = str(tmp_path / "ledger.db")
+    ledger = Ledger({"db_path": db_path, "checkpoint_interval": 10}, signing_key=private_key)
+    ledger.record_many(f"entry {i}" for i in range(35))
+
+    result = ledger.verify_ledger(public_key)
+    assert result["valid"] and result["rows_checked"] == 35 and result["checkpoints_checked"] == 3
+
+    # Starting from a trusted checkpoint only reads the rows after it.
+    ledger.record_transaction("entry 35")
+    result = ledger.verify_ledger(public_key, trusted_checkpoint=result["last_checkpoint"])
+    assert result["valid"] and result["rows_checked"] == 6
+
+    proof = ledger.get_inclusion_proof(17)
+    assert len(proof["proof"]) <= 4
+    assert verify_inclusion_proof(json.loads(json.dumps(proof)), public_key)
+    assert ledger.get_inclusion_proof(33) is None
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE transactions SET data = 'forged' WHERE id = 12")
+    assert not ledger.verify_ledger(public_key)["valid"]
+    assert not verify_inclusion_proof(ledger.get_inclusion_proof(12), public_key)
+    # The tampered row precedes the trusted checkpoint, so an incremental audit skips it.
+    assert ledger.verify_ledger(public_key, trusted_checkpoint=3)["valid"]
+
+def test_ledger_structured_queries_and_migration(tmp_path):
+    import sqlite3
+    from core.ledger import Ledger
+    db_path = str(tmp_path / "ledger.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, "
+                     "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+        conn.executemany("INSERT INTO transactions (data) VALUES (?)", [
+            ("Embedded metadata into /data/a.txt",),
+            ("CMS 'wordpress' embedded metadata into /data/b.txt",),
+            ("Something else",),
+        ])
+
+    private_key, public_key = generate_key_pair()
+    ledger = Ledger({"db_path": db_path, "checkpoint_interval": 4}, signing_key=private_key)
+    assert [(e["action"], e["file_path"], e["cms_name"]) for e in ledger.fetch_page()] == [
+        ("embed", "/data/a.txt", None), ("embed", "/data/b.txt", "wordpress"), (None, None, None)]
+
+    ledger.record_many({"data": f"Embedded metadata into /data/a.txt ({i})", "action": "embed",
+                        "file_path": "/data/a.txt", "file_hash": f"h{i}", "actor_role": "admin"} for i in range(5))
+    ledger.record_transaction("unrelated")
+    history = list(ledger.iter_transactions(page_size=2, file_path="/data/a.txt"))
+    assert [e["id"] for e in history] == [1, 4, 5, 6, 7, 8]
+    assert ledger.get_transaction_count() == 9
+    result = ledger.verify_ledger(public_key)
+    # The two parsed legacy rows' columns are outside their entry hashes.
+    assert result["valid"] and result["unhashed_rows"] == 2
+
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("UPDATE transactions SET actor_role = 'guest' WHERE id = 5")
+    assert not ledger.verify_ledger(public_key)["valid"]
+
+def test_ledger_entries_record_the_actor_role(tmp_path):
+    from core.ledger import Ledger
+    from interfaces.plugins import CMSPlugin
+    test_file = tmp_path / "record.txt"
+    test_file.write_text("patient record")
+    ledger = Ledger({"db_path": str(tmp_path / "ledger.db")})
+    private_key, _ = generate_key_pair()
+
+    engine = MetadataEngine(ledger=ledger, actor_role="metadata-embedder")
+    engine.embed_file(str(test_file), private_key)
+    with engine.acting_as("admin"):
+        engine.embed_file(str(test_file), private_key)
+    engine.embed_file(str(test_file), private_key)
+    CMSPlugin("wordpress", engine=engine, role="cms").process_file(str(test_file))
+
+    roles = [entry["actor_role"] for entry in ledger.fetch_page()]
+    assert roles[:3] == ["metadata-embedder", "admin", "metadata-embedder"]
+    assert roles[-1] == "cms"
+
+def test_gui_ledger_model_fetches_pages_on_demand(qapp, tmp_path):
+    from core.ledger import Ledger
+    from interfaces.gui import LedgerTableModel
+    ledger = Ledger({"db_path": str(tmp_path / "ledger.db")})
+    ledger.record_many({"data": f"Embedded metadata into /data/file{i}.txt", "action": "embed",
+                        "file_path": f"/data/file{i}.txt"} for i in range(25))
+    ledger.record_transaction("Quarterly financial export", action="export")
+
+    model = LedgerTableModel(ledger, page_size=10)
+    assert model.rowCount() == 0 and model.canFetchMore()
+    model.fetchMore()
+    assert model.rowCount() == 10
+    while model.canFetchMore():
+        model.fetchMore()
+    assert model.rowCount() == 26
+    assert model.data(model.index(25, 4)) == "Quarterly financial export"
+
+    model.set_filters(text="financial")
+    model.fetchMore()
+    assert model.rowCount() == 1 and not model.canFetchMore()
+    model.set_filters(text="file1")
+    while model.canFetchMore():
+        model.fetchMore()
+    assert model.rowCount() == 11
+    model.set_filters(since="2999-01-01")
+    model.fetchMore()
+    assert model.rowCount() == 0
+
+def test_gui_queue_files_runs_in_background(qapp, tmp_path):
+    files = []
+    for i in range(4):
+        test_file = tmp_path / f"batch{i}.txt"
+        test_file.write_text(f"patient record {i}")
+        files.append(str(test_file))
+
+    gui = METLGUI()
+    gui.queue_files(files, "embed")
+    gui.thread_pool.waitForDone()
+    qapp.processEvents()
+    assert [gui.results_table.item(row, 2).text() for row in range(4)] == ["OK"] * 4
+    assert gui.progress.value() == 4
+
+    gui.thread_pool.setMaxThreadCount(1)
+    gui.queue_files(files * 10, "verify")
+    gui.cancel_tasks()
+    gui.thread_pool.waitForDone()
+    qapp.processEvents()
+    statuses = [gui.results_table.item(row, 3).text() for row in range(4, 44)]
+    assert "Cancelled" in statuses
+    assert all(status in ("Metadata verified.", "Cancelled") for status in statuses)
+
+def test_gui_queue_folder_scans_off_the_gui_thread(qapp, tmp_path):
+    folder = tmp_path / "dropped"
+    (folder / "nested").mkdir(parents=True)
+    for i in range(5):
+        (folder / "nested" / f"scan{i}.txt").write_text(f"patient record {i}")
+
+    import threading
+    from interfaces import gui as gui_module
+    gui = METLGUI()
+    scan_threads = []
+    real_iter_files = gui_module.iter_files
+    def recording_iter_files(directory):
+        scan_threads.append(threading.current_thread())
+        return real_iter_files(directory)
+
+    with patch.object(gui_module, "iter_files", recording_iter_files):
+        gui.queue_folder(str(folder), "embed")
+        assert gui.results_table.rowCount() == 0
+        while gui._scanning or gui._pending:
+            gui.thread_pool.waitForDone()
+            qapp.processEvents()
+    assert scan_threads and threading.main_thread() not in scan_threads
+    assert gui.results_table.rowCount() == 5
+    assert [gui.results_table.item(row, 2).text() for row in range(5)] == ["OK"] * 5
+    assert not gui.btn_cancel.isEnabled()
+
+def test_streaming_classifier_matches_across_chunks():
+    from core.classifier import DEFAULT_RULES, StreamingClassifier
+    classifier = StreamingClassifier(DEFAULT_RULES)
+    chunks = [b"x" * 100 + b"PERSON", b"AL DA", b"TA and a pat", b"ient"]
+    assert set(classifier.classify_chunks(chunks)) == {"GDPR", "HIPAA"}
+    assert classifier.classify_chunks([b"nothing relevant"]) == {}
+
+    # Non-ASCII patterns fold case like str.casefold, even when a chunk
+    # boundary splits a multi-byte character.
+    rules = DEFAULT_RULES + [{"pattern": "Données personnelles", "tag": "RGPD", "priority": 40, "weight": 1.0},
+                             {"pattern": "Straße", "tag": "ADDRESS", "priority": 5, "weight": 1.0}]
+    classifier = StreamingClassifier(rules)
+    text = "DONNÉES PERSONNELLES du PATIENT, HAUPTSTRASSE 1".encode("utf-8")
+    split = text.index("É".encode("utf-8")) + 1
+    chunks = [memoryview(text[:split]), text[split:split + 3], text[split + 3:]]
+    assert set(classifier.classify_chunks(chunks)) == {"RGPD", "HIPAA", "ADDRESS"}
+    assert set(classifier.classify_chunks([b"donnees personnelles"])) == set()
+
+def test_policy_rules_drive_suggestions(tmp_path):
+    from core.ai import AIPolicyRecommender
+    (tmp_path / "export.yml").write_text(
+        "classification:\n  tag: EXPORT\n  priority: 50\n  rules:\n"
+        "    - pattern: \"dual-use\"\n      weight: 2.0\n"
+        "    - pattern: \"patient\"\n      tag: HIPAA\n      priority: 10\n")
+    recommender = AIPolicyRecommender({"policy_dir": str(tmp_path)})
+    assert recommender.suggest_metadata("Patient list") == {"compliance_tag": "HIPAA"}
+    assert recommender.suggest_metadata("patient and DUAL-USE goods") == {"compliance_tag": "EXPORT"}
+
+    big_file = tmp_path / "big.bin"
+    with open(big_file, "wb") as f:
+        f.write(os.urandom(3 * 1024 * 1024).replace(b"d", b"_"))
+        f.write(b"dual-use")
+    assert recommender.suggest_metadata_for_file(str(big_file)) == {"compliance_tag": "EXPORT"}
+
+    # The shipped policies reproduce the original keyword precedence.
+    default = AIPolicyRecommender({"policy_dir": "configs/policies"})
+    assert default.suggest_metadata("financial personal data of a patient") == {"compliance_tag": "GDPR"}
+    assert default.suggest_metadata("financial patient") == {"compliance_tag": "SOX"}
+    assert default.suggest_metadata("hello") == {"compliance_tag": "GENERAL"}
+
+def test_embed_file_reads_content_once(tmp_path, monkeypatch):
+    import hashlib
+    import core.pipeline as pipeline
+    from core.pipeline import DigestConsumer, MimeConsumer, SizeConsumer, read_once, sniff_mime
+    data = os.urandom(2 * 1024 * 1024) + b"patient records"
+    sample = tmp_path / "scan.bin"
+    sample.write_bytes(data)
+    results = read_once(str(sample), {"digest": DigestConsumer(), "size": SizeConsumer(), "mime": MimeConsumer()},
+                        buffer_size=4096)
+    assert results["digest"] == hashlib.sha256(data).hexdigest()
+    assert results["size"] == len(data)
+    assert sniff_mime(b"%PDF-1.7\n") == "application/pdf"
+    assert sniff_mime(b"plain text") == "text/plain"
+
+    opened = []
+    real_open = open
+    def counting_open(path, *args, **kwargs):
+        opened.append(str(path))
+        return real_open(path, *args, **kwargs)
+    monkeypatch.setattr(pipeline, "open", counting_open, raising=False)
+
+    engine = MetadataEngine()
+    signed = engine.embed_file(str(sample), engine.load_private_key())
+    assert opened == [str(sample)]
+    assert signed["file_hash"] == hashlib.sha256(data).hexdigest()
+    assert signed["compliance_tag"] == "HIPAA"
+    assert signed["file_size"] == len(data)
+    assert engine.verify_metadata(str(sample), engine.load_public_key())
+
+def test_cli_uses_running_daemon(tmp_path):
+    import tempfile
+    import threading
+    from core.ledger import Ledger
+    from interfaces.cli import _engine_options
+    from interfaces.daemon import DaemonClient, MetlDaemon
+    engine = MetadataEngine(ledger=Ledger({"db_path": str(tmp_path / "ledger.db")}))
+    socket_path = os.path.join(tempfile.gettempdir(), f"metl-test-{os.getpid()}.sock")
+    daemon = MetlDaemon(engine, engine.load_private_key(), engine.load_public_key(), socket_path,
+                        options=_engine_options())
+    daemon.bind()
+    assert os.stat(socket_path).st_mode & 0o777 == 0o600
+    server = threading.Thread(target=daemon.serve_forever, daemon=True)
+    server.start()
+    try:
+        test_file = tmp_path / "doc.txt"
+        test_file.write_text("patient notes")
+        runner = CliRunner()
+        with patch("core.metadata.MetadataEngine.load_private_key", side_effect=AssertionError("loaded key")):
+            result = runner.invoke(cli, ["--socket", socket_path, "embed", str(test_file)],
+                                   input="alice-token\n", catch_exceptions=False)
+            assert "Metadata embedded successfully." in result.output
+            assert engine.ledger.fetch_page()[-1]["actor_role"] == "admin"
+            result = runner.invoke(cli, ["--socket", socket_path, "verify", str(test_file)],
+                                   input="bob-token\n", catch_exceptions=False)
+            assert "Metadata verified successfully." in result.output
+            report = tmp_path / "report.jsonl"
+            runner.invoke(cli, ["--socket", socket_path, "verify-tree", str(tmp_path), "--report", str(report)],
+                          input="bob-token\n", catch_exceptions=False)
+        statuses = {json.loads(line)["path"]: json.loads(line)["status"] for line in report.read_text().splitlines()}
+        assert statuses[str(test_file)] == "ok"
+
+        # Options the daemon's engine does not share make the CLI run locally.
+        other = tmp_path / "other.txt"
+        other.write_text("more notes")
+        store = tmp_path / "sc.db"
+        result = runner.invoke(cli, ["--socket", socket_path, "--sidecar-store", str(store), "embed", str(other)],
+                               input="alice-token\n", catch_exceptions=False)
+        assert "Metadata embedded successfully." in result.output
+        assert store.exists() and not (tmp_path / "other.txt.metl.json").exists()
+        result = runner.invoke(cli, ["--no-daemon", "--sidecar-store", str(store), "verify", str(other)],
+                               input="bob-token\n", catch_exceptions=False)
+        assert "Metadata verified successfully." in result.output
+        assert DaemonClient.connect(socket_path, options=_engine_options(storage="embedded")) is None
+
+        # Worker pools started from the threaded daemon do not fork it.
+        tree = tmp_path / "tree"
+        tree.mkdir()
+        for i in range(4):
+            (tree / f"t{i}.txt").write_text(f"record {i}")
+        import concurrent.futures
+        real_pool = concurrent.futures.ProcessPoolExecutor
+        start_methods = []
+        def recording_pool(*args, **kwargs):
+            start_methods.append(kwargs["mp_context"].get_start_method())
+            return real_pool(*args, **kwargs)
+        client = DaemonClient.connect(socket_path, token="alice-token")
+        with patch("core.batch.ProcessPoolExecutor", recording_pool):
+            summary = client.embed_tree(str(tree), workers=2, chunk_size=1)
+        client.close()
+        assert start_methods == ["forkserver"] and summary["succeeded"] == 4
+
+        # The daemon applies RBAC to every request.
+        client = DaemonClient.connect(socket_path, token="bob-token")
+        with pytest.raises(Exception, match="Permission denied"):
+            client.embed(str(test_file))
+        with pytest.raises(Exception, match="Permission denied"):
+            client.cache_evict()
+        assert client.ping()["ok"]
+        client.close()
+        result = runner.invoke(cli, ["--socket", socket_path, "cache-evict"], input="bob-token\n",
+                               catch_exceptions=False)
+        assert "Permission denied" in result.output
+    finally:
+        daemon.shutdown()
+        server.join()
+    assert not os.path.exists(socket_path)
+
+    # A daemon that accepts nothing is treated as absent after the timeout.
+    import socket
+    hung = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    hung.bind(socket_path)
+    hung.listen(1)
+    try:
+        started = time.monotonic()
+        assert DaemonClient.connect(socket_path, timeout=0.2) is None
+        assert time.monotonic() - started < 2
+    finally:
+        hung.close()
+        os.unlink(socket_path)
+
+def test_cli_import_is_lazy(tmp_path):
+    import subprocess
+    # Heavy modules must only load once a subcommand needs them.
+    code = ("import sys, interfaces.cli; "
+            "print(','.join(m for m in ('cryptography', 'yaml', 'multiprocessing', 'core.metadata', 'PyQt5') "
+            "if m in sys.modules))")
+    src_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            env=dict(os.environ, PYTHONPATH=src_dir))
+    assert result.stdout.strip() == ""
+
+    # verify reads only the public key.
+    test_file = tmp_path / "test.txt"
+    test_file.write_text("content")
+    runner = CliRunner()
+    runner.invoke(cli, ["--no-daemon", "embed", str(test_file)], input="alice-token\n", catch_exceptions=False)
+    with patch("core.metadata.MetadataEngine.load_private_key", side_effect=AssertionError("loaded key")):
+        result = runner.invoke(cli, ["--no-daemon", "verify", str(test_file)], input="bob-token\n",
+                               catch_exceptions=False)
+    assert "Metadata verified successfully." in result.output
+
+    # Commands the daemon cannot serve never connect to it.
+    with patch("interfaces.cli.DaemonClient.connect", side_effect=AssertionError("connected")):
+        for args in (["verify-manifest", str(tmp_path)], ["sidecars-export", str(tmp_path)],
+                     ["manifest-proof", str(tmp_path), str(test_file)]):
+            result = runner.invoke(cli, args, input="alice-token\n", catch_exceptions=False)
+            assert result.exit_code == 0, result.output
+
+def test_directory_manifest_signs_and_proves_entries(tmp_path):
+    data_dir = tmp_path / "dataset"
+    (data_dir / "sub").mkdir(parents=True)
+    for i in range(5):
+        (data_dir / f"file{i}.txt").write_text(f"record {i}")
+    (data_dir / "sub" / "notes.txt").write_text("patient notes")
+
+    engine = MetadataEngine()
+    private_key, public_key = engine.load_private_key(), engine.load_public_key()
+    manifest, errors = engine.embed_manifest(str(data_dir), private_key, workers=2)
+    assert manifest["header"]["entry_count"] == 6 and errors == []
+    assert not list(data_dir.glob("*.txt.metl.json"))
+    notes = next(entry for entry in manifest["entries"] if entry["path"] == "sub/notes.txt")
+    assert notes["compliance_tag"] == "HIPAA"
+    assert {r["status"] for r in engine.verify_manifest(str(data_dir), public_key)} == {"ok"}
+
+    # A single entry verifies from its proof alone.
+    proof = engine.manifest_proof(str(data_dir), str(data_dir / "file3.txt"))
+    assert len(proof["proof"]) == 3
+    assert engine.check_manifest_proof(str(data_dir), str(data_dir / "file3.txt"), proof, public_key)["status"] == "ok"
+    forged = dict(proof, entry=dict(proof["entry"], file_hash="0" * 64))
+    assert engine.check_manifest_proof(str(data_dir), str(data_dir / "file3.txt"), forged,
+                                       public_key)["status"] == "bad-signature"
+    # A valid proof for one file does not vouch for another.
+    (data_dir / "copy.txt").write_text("record 3")
+    result = engine.check_manifest_proof(str(data_dir), str(data_dir / "copy.txt"), proof, public_key)
+    assert result["status"] == "bad-signature" and "file3.txt" in result["detail"]
+    (data_dir / "copy.txt").unlink()
+
+    # A saved proof verifies the file without reading the manifest.
+    runner = CliRunner()
+    proof_path = tmp_path / "file3.proof.json"
+    runner.invoke(cli, ["--no-daemon", "manifest-proof", str(data_dir), str(data_dir / "file3.txt"),
+                        "--output", str(proof_path)], input="bob-token\n", catch_exceptions=False)
+    with patch.object(MetadataEngine, "load_manifest", side_effect=AssertionError("read manifest")):
+        result = runner.invoke(cli, ["--no-daemon", "verify-manifest", str(data_dir), "--file",
+                                     str(data_dir / "file3.txt"), "--proof", str(proof_path)],
+                               input="bob-token\n", catch_exceptions=False)
+    assert '"status": "ok"' in result.output
+
+    (data_dir / "file1.txt").write_text("tampered")
+    (data_dir / "file2.txt").unlink()
+    (data_dir / "new.txt").write_text("unlisted")
+    statuses = {os.path.basename(r["path"]): r["status"] for r in engine.verify_manifest(str(data_dir), public_key)}
+    assert statuses["file1.txt"] == "hash-mismatch"
+    assert statuses["file2.txt"] == "error"
+    assert statuses["new.txt"] == "missing-sidecar"
+    assert statuses["notes.txt"] == "ok"
+
+    # An unreadable file is reported and left out instead of aborting.
+    real_scan_file = MetadataEngine.scan_file
+    def scan_file(self, path, *args, **kwargs):
+        if path.endswith("file0.txt"):
+            raise PermissionError(13, "Permission denied", path)
+        return real_scan_file(self, path, *args, **kwargs)
+    with patch.object(MetadataEngine, "scan_file", scan_file):
+        result = CliRunner().invoke(cli, ["--no-daemon", "embed-manifest", str(data_dir)], input="alice-token\n",
+                                    catch_exceptions=False)
+    assert f"Error: {data_dir / 'file0.txt'}: [Errno 13] Permission denied" in result.output
+    assert "Signed manifest of 5 files" in result.output
+
+def test_sqlite_sidecar_store_and_migration(tmp_path):
+    from core.sidecars import SqliteSidecarStore
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for i in range(3):
+        (data_dir / f"f{i}.txt").write_text(f"content {i}")
+    runner = CliRunner()
+    runner.invoke(cli, ["--no-daemon", "embed-tree", str(data_dir), "--workers", "1"], input="alice-token\n",
+                  catch_exceptions=False)
+    assert len(list(data_dir.glob("*.metl.json"))) == 3
+
+    db_path = str(tmp_path / "sidecars.db")
+    result = runner.invoke(cli, ["--no-daemon", "--sidecar-store", db_path, "sidecars-import", str(data_dir),
+                                 "--remove"], input="alice-token\n", catch_exceptions=False)
+    assert "Imported 3 sidecars." in result.output
+    assert not list(data_dir.glob("*.metl.json"))
+
+    store = SqliteSidecarStore({"db_path": db_path})
+    engine = MetadataEngine(sidecar_store=store)
+    public_key = engine.load_public_key()
+    paths = [str(data_dir / f"f{i}.txt") for i in range(3)]
+    assert {r["status"] for r in engine.verify_many(paths, public_key, workers=2)} == {"ok"}
+    assert store.find_by_hash(store.load(paths[0])["file_hash"]) == [os.path.abspath(paths[0])]
+
+    # New embeds land in the store, and multiprocess embeds use it too.
+    (data_dir / "f3.txt").write_text("content 3")
+    engine.embed_many([str(data_dir / "f3.txt"), paths[1]], engine.load_private_key(), workers=2)
+    assert not list(data_dir.glob("*.metl.json"))
+    assert engine.check_metadata(str(data_dir / "f3.txt"), public_key)["status"] == "ok"
+    (data_dir / "f0.txt").write_text("tampered")
+    statuses = {os.path.basename(r["path"]): r["status"] for r in engine.verify_many(paths, public_key)}
+    assert statuses == {"f0.txt": "hash-mismatch", "f1.txt": "ok", "f2.txt": "ok"}
+
+    result = runner.invoke(cli, ["--no-daemon", "--sidecar-store", db_path, "sidecars-export", str(data_dir)],
+                           input="alice-token\n", catch_exceptions=False)
+    assert "Exported 4 sidecars." in result.output
+    assert len(list(data_dir.glob("*.metl.json"))) == 4
+
+def test_streaming_encryption_round_trip_and_tamper_detection():
+    import io
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from utils.encryption import EncryptionManager
+    key = os.urandom(32)
+    manager = EncryptionManager(key)
+
+    # Blobs written by the previous per-call Cipher implementation still decrypt.
+    iv = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(iv)).encryptor()
+    ciphertext = encryptor.update(b'{"tag": "GDPR"}') + encryptor.finalize()
+    assert manager.decrypt_metadata(memoryview(iv + encryptor.tag + ciphertext)) == {"tag": "GDPR"}
+    batch = [{"id": i} for i in range(5)]
+    assert manager.decrypt_many(manager.encrypt_many(batch)) == batch
+
+    # Large blobs are decrypted with the tag passed to GCM separately.
+    large = {"notes": "x" * (1024 * 1024)}
+    blob = manager.encrypt_metadata(large)
+    assert manager.decrypt_metadata(blob) == large
+    tampered = bytearray(blob)
+    tampered[-1] ^= 1
+    with pytest.raises(InvalidTag):
+        manager.decrypt_metadata(tampered)
+
+    for size in (0, 1, 4096, 3 * 4096 + 7):
+        payload = os.urandom(size)
+        sealed = io.BytesIO()
+        assert manager.encrypt_stream(io.BytesIO(payload), sealed, chunk_size=4096) == size
+        opened = io.BytesIO()
+        assert manager.decrypt_stream(io.BytesIO(sealed.getvalue()), opened) == size
+        assert opened.getvalue() == payload
+
+    sealed = sealed.getvalue()
+    frame = 4096 + 16
+    flipped = bytearray(sealed)
+    flipped[-1] ^= 1
+    header = len(sealed) - 3 * frame - (7 + 16)
+    reordered = sealed[:header] + sealed[header + frame:header + 2 * frame] + sealed[header:header + frame] \
+        + sealed[header + 2 * frame:]
+    for tampered in (bytes(flipped), sealed[:header + 3 * frame], reordered):
+        with pytest.raises(InvalidTag):
+            manager.decrypt_stream(io.BytesIO(tampered), io.BytesIO())
+
+def test_kms_envelope_encryption_caches_data_keys():
+    import io
+    from urllib.error import HTTPError
+    from utils.kms import DataKeyCache, KMSClient
+    from utils.kms_emulator import KMSEmulator
+    emulator = KMSEmulator().start()
+    try:
+        client = KMSClient(provider="http", key_id="alias/metl", endpoint=emulator.url,
+                           cache=DataKeyCache(ttl=60, max_uses=3))
+        blobs = [client.encrypt_metadata({"id": i}) for i in range(6)]
+        # One data key serves three encryptions before a new one is fetched.
+        assert emulator.calls == {"GenerateDataKey": 2}
+
+        reader = KMSClient(provider="http", endpoint=emulator.url)
+        assert [reader.decrypt_metadata(blob) for blob in blobs] == [{"id": i} for i in range(6)]
+        assert emulator.calls["Decrypt"] == 2
+
+        sealed = io.BytesIO()
+        client.encrypt_stream(io.BytesIO(b"attachment" * 1000), sealed, chunk_size=1024)
+        opened = io.BytesIO()
+        reader.decrypt_stream(io.BytesIO(sealed.getvalue()), opened)
+        assert opened.getvalue() == b"attachment" * 1000
+
+        forged = bytearray(blobs[0])
+        forged[10] ^= 1
+        with pytest.raises(HTTPError):
+            KMSClient(provider="http", endpoint=emulator.url).decrypt_metadata(bytes(forged))
+    finally:
+        emulator.stop()
+
+    cache = DataKeyCache(ttl=60, max_uses=100, max_entries=2)
+    for name in ("a", "b", "c"):
+        cache.put(name, name)
+    assert cache.get("a") is None and cache.get("c") == "c"
+    mock = KMSClient()
+    assert mock.decrypt_metadata(mock.encrypt_metadata({"x": 1})) == {"x": 1}
+
+def test_pdf_incremental_embed_appends_update(tmp_path):
+    import pikepdf
+    from adapters.pdf import PDFAdapter
+    adapter = PDFAdapter()
+    for name, object_streams in (("plain.pdf", pikepdf.ObjectStreamMode.disable),
+                                 ("xref_stream.pdf", pikepdf.ObjectStreamMode.generate)):
+        path = tmp_path / name
+        pdf = pikepdf.new()
+        pdf.add_blank_page()
+        pdf.save(path, object_stream_mode=object_streams)
+        pdf.close()
+        original = path.read_bytes()
+
+        assert adapter.embed_metadata(str(path), {"round": 1})
+        assert adapter.embed_metadata(str(path), {"round": 2})
+        # The original bytes are untouched; only updates were appended.
+        assert path.read_bytes().startswith(original)
+        assert adapter.extract_metadata(str(path)) == {"round": 2}
+        with pikepdf.Pdf.open(path) as reopened:
+            assert reopened.get_warnings() == []
+            assert len(reopened.pages) == 1
+
+    rewrite = tmp_path / "rewrite.pdf"
+    pikepdf.new().save(rewrite)
+    assert PDFAdapter(incremental=False).embed_metadata(str(rewrite), {"round": 3})
+    assert adapter.extract_metadata(str(rewrite)) == {"round": 3}
+
+def test_image_metadata_is_written_without_reencoding(tmp_path):
+    import struct
+    from PIL import Image
+    from adapters.image import ImageAdapter
+    adapter = ImageAdapter()
+    img = Image.frombytes("RGB", (64, 48), os.urandom(64 * 48 * 3))
+    exif = Image.Exif()
+    exif[0x010f] = "Camera"
+    jpeg, png = tmp_path / "photo.jpg", tmp_path / "photo.png"
+    img.save(jpeg, quality=90, exif=exif.tobytes())
+    img.save(png)
+    for path in (jpeg, png):
+        original = path.read_bytes()
+        assert adapter.embed_metadata(str(path), {"round": 1})
+        assert adapter.embed_metadata(str(path), {"round": 2, "note": "✓"})
+        assert adapter.extract_metadata(str(path)) == {"round": 2, "note": "✓"}
+        updated = path.read_bytes()
+        # Replacing the metadata keeps a single copy and leaves the
+        # compressed image data byte-identical.
+        assert updated.count(b"METL_METADATA" if path == png else b"METL\x00") == 1
+        tail = original[original.index(b"\xff\xda"):] if path == jpeg else original[original.index(b"IDAT") - 4:]
+        assert updated.endswith(tail)
+    assert Image.open(jpeg).getexif()[0x010f] == "Camera"
+
+    # A JSON comment from another tool is kept; a bare signed comment from
+    # an older release is read and then replaced.
+    def add_comment(path, payload):
+        data = path.read_bytes()
+        path.write_bytes(data[:2] + b"\xff\xfe" + struct.pack("!H", len(payload) + 2) + payload + data[2:])
+    other = b'{"editor": "darkroom"}'
+    legacy = json.dumps({"round": 0, "signature": "c2ln"}).encode()
+    Image.frombytes("RGB", (16, 16), os.urandom(16 * 16 * 3)).save(jpeg)
+    add_comment(jpeg, other)
+    assert adapter.extract_metadata(str(jpeg)) == {}
+    add_comment(jpeg, legacy)
+    assert adapter.extract_metadata(str(jpeg)) == {"round": 0, "signature": "c2ln"}
+    assert adapter.embed_metadata(str(jpeg), {"round": 4})
+    updated = jpeg.read_bytes()
+    assert other in updated and legacy not in updated
+    assert adapter.extract_metadata(str(jpeg)) == {"round": 4}
+
+    text = tmp_path / "notes.txt"
+    text.write_text("not an image")
+    assert not adapter.embed_metadata(str(text), {"round": 1})
+
+def test_docx_direct_patch_copies_other_members_raw(tmp_path):
+    import zipfile
+    from docx import Document
+    from adapters.docx import CORE_PROPERTIES_PART, DOCXAdapter
+    path = tmp_path / "report.docx"
+    doc = Document()
+    doc.add_paragraph("quarterly figures")
+    doc.save(path)
+    with zipfile.ZipFile(path, "a") as archive:
+        archive.writestr("word/media/blob.bin", os.urandom(4096), compress_type=zipfile.ZIP_STORED)
+    before = {info.filename: (info.CRC, info.compress_size) for info in zipfile.ZipFile(path).infolist()}
+
+    adapter = DOCXAdapter()
+    assert adapter.embed_metadata(str(path), {"round": 1})
+    assert adapter.embed_metadata(str(path), {"round": 2})
+    assert adapter.extract_metadata(str(path)) == {"round": 2}
+    with zipfile.ZipFile(path) as archive:
+        assert archive.testzip() is None
+        after = {info.filename: (info.CRC, info.compress_size) for info in archive.infolist()}
+    assert list(after) == list(before)
+    assert {name for name in before if before[name] != after[name]} == {CORE_PROPERTIES_PART}
+    reopened = Document(path)
+    assert reopened.paragraphs[0].text == "quarterly figures"
+    assert json.loads(reopened.core_properties.comments) == {"round": 2}
+
+    assert DOCXAdapter(direct=False).embed_metadata(str(path), {"round": 3})
+    assert adapter.extract_metadata(str(path)) == {"round": 3}
+
+def test_adapter_registry_and_embedded_storage(tmp_path):
+    import pikepdf
+    from PIL import Image
+    from adapters.registry import AdapterRegistry, default_registry
+    from adapters.image import ImageAdapter
+    from core.cryptography import generate_key_pair
+
+    jpeg, pdf_path, text = tmp_path / "photo.jpg", tmp_path / "report.pdf", tmp_path / "notes.txt"
+    Image.frombytes("RGB", (32, 24), os.urandom(32 * 24 * 3)).save(jpeg)
+    pdf = pikepdf.new()
+    pdf.add_blank_page()
+    pdf.save(pdf_path)
+    text.write_text("plain text")
+
+    registry = default_registry()
+    assert registry.adapter_for(str(jpeg)) is registry.adapter_for(str(jpeg), "image/jpeg")
+    assert isinstance(registry.adapter_for(str(jpeg)), ImageAdapter)
+    assert registry.adapter_for(str(text)) is None
+    custom = AdapterRegistry(adapters={}, load_entry_points=False)
+    custom.register("text/x-metl", ImageAdapter, magic=(b"plain",))
+    assert custom.detect(str(text)) == "text/x-metl"
+
+    private_key, public_key = generate_key_pair()
+    engine = MetadataEngine(storage="embedded", ai_config={"enabled": False})
+    for path in (jpeg, pdf_path):
+        engine.embed_file(str(path), private_key)
+        assert not os.path.exists(f"{path}.metl.json")
+        assert engine.check_metadata(str(path), public_key)["status"] == "ok"
+    with pytest.raises(ValueError):
+        engine.embed_file(str(text), private_key)
+
+    # The signed digest covers the content around the embedded metadata.
+    data = bytearray(jpeg.read_bytes())
+    data[-10] ^= 0xFF
+    jpeg.write_bytes(bytes(data))
+    assert engine.check_metadata(str(jpeg), public_key)["status"] == "hash-mismatch"
+
+    both = MetadataEngine(storage="both", ai_config={"enabled": False})
+    both.embed_file(str(pdf_path), private_key)
+    both.embed_file(str(text), private_key)
+    os.remove(f"{pdf_path}.metl.json")
+    results = {result["path"]: result["status"] for result in both.verify_many([str(pdf_path), str(text)], public_key)}
+    assert results == {str(pdf_path): "ok", str(text): "ok"}
+
+def test_metadata_index_query_and_rebuild(tmp_path):
+    from core.index import MetadataIndex
+    db_path = str(tmp_path / "index.db")
+    data = tmp_path / "data"
+    data.mkdir()
+    engine = MetadataEngine(metadata_index=MetadataIndex({"db_path": db_path}), ai_config={"enabled": False})
+    private_key = engine.load_private_key()
+    paths = []
+    for name, tag in (("a.txt", "HIPAA"), ("b.txt", "GDPR"), ("c.txt", "HIPAA")):
+        path = str(data / name)
+        with open(path, "w") as f:
+            f.write(name)
+        metadata = {"compliance_tag": tag, "keywords": ["alpha", "beta"]}
+        if name != "c.txt":
+            metadata["consent_status"] = "given"
+        engine.embed_metadata(path, metadata, private_key)
+        paths.append(path)
+
+    index = engine.metadata_index
+    assert index.query([("compliance_tag", "HIPAA")]) == [paths[0], paths[2]]
+    assert index.query([("compliance_tag", "HIPAA")], missing=["consent_status"]) == [paths[2]]
+    assert index.query([("keywords", "beta")], limit=1) == [paths[0]]
+    assert index.count(present=["consent_status"], root=str(data)) == 2
+    assert index.count(root=str(tmp_path / "dat")) == 0
+
+    # A rebuild re-indexes nothing that is unchanged and drops entries
+    # whose file is gone.
+    os.remove(paths[0])
+    os.remove(f"{paths[0]}.metl.json")
+    summary = engine.rebuild_index(str(data), workers=2)
+    assert (summary["scanned"], summary["reindexed"], summary["dropped"]) == (2, 0, 1)
+    assert index.get(paths[0]) is None
+    assert index.get(paths[2])["compliance_tag"] == "HIPAA"
+
+    result = CliRunner().invoke(cli, ["--index", db_path, "query", "--tag", "compliance_tag=HIPAA"],
+                                input="bob-token\n", catch_exceptions=False)
+    assert paths[2] in result.output and paths[0] not in result.output
+    result = CliRunner().invoke(cli, ["--index", db_path, "query", "--missing", "consent_status", "--count"],
+                                input="bob-token\n", catch_exceptions=False)
+    assert result.output.strip().endswith("1")
+
+@pytest.mark.parametrize("backend", ["polling", "auto"])
+def test_folder_watcher_debounces_and_resumes_from_checkpoints(tmp_path, backend):
+    import collections
+    import time
+    from interfaces.plugins import CMSPlugin
+    drop = tmp_path / "drop"
+    drop.mkdir()
+    (drop / "existing.txt").write_text("already here")
+    config = {"backend": backend, "settle_seconds": 0.2, "poll_interval": 0.05, "workers": 2,
+              "checkpoint_db": str(tmp_path / "watch.db")}
+
+    plugin = CMSPlugin("TestCMS")
+    calls = collections.Counter()
+    process_file = plugin.process_file
+    plugin.process_file = lambda path: calls.update([path]) or process_file(path)
+    watcher = plugin.watch([str(drop)], config)
+    try:
+        assert watcher.wait_idle(10)
+        # A file written in several bursts is processed once, after it settles.
+        with open(drop / "upload.txt", "w") as f:
+            for _ in range(4):
+                f.write("partial " * 100)
+                f.flush()
+                time.sleep(0.03)
+        (drop / "nested").mkdir()
+        (drop / "nested" / "deep.txt").write_text("nested upload")
+        deadline = time.monotonic() + 10
+        while len(calls) < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert watcher.wait_idle(10)
+    finally:
+        watcher.stop()
+    assert sorted(calls) == sorted(str(path) for path in (drop / "existing.txt", drop / "upload.txt",
+                                                          drop / "nested" / "deep.txt"))
+    assert set(calls.values()) == {1}
+    assert os.path.exists(f"{drop / 'upload.txt'}.metl.json")
+
+    # After a restart only files changed in between are processed again.
+    (drop / "existing.txt").write_text("edited while stopped")
+    restarted = CMSPlugin("TestCMS").watch([str(drop)], config)
+    try:
+        assert restarted.wait_idle(10)
+    finally:
+        restarted.stop()
+    assert restarted.stats == {"processed": 1, "failed": 0, "skipped": 2}
+
+def test_async_engine_api_applies_backpressure(tmp_path):
+    import asyncio
+    import threading
+    from core.aio import AsyncExecutor, EngineBusyError
+    from core.ledger import Ledger
+    from interfaces.plugins import CMSPlugin
+
+    executor = AsyncExecutor({"max_workers": 2, "max_concurrency": 2, "max_waiting": 1})
+    release = threading.Event()
+
+    async def saturate():
+        running = [asyncio.create_task(executor.run(release.wait)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+        # Two calls hold the slots and one waits; the next is turned away.
+        assert executor.waiting == 1
+        with pytest.raises(EngineBusyError):
+            await executor.run(release.wait)
+        release.set()
+        return await asyncio.gather(*running)
+
+    assert asyncio.run(saturate()) == [True, True, True]
+
+    ledger = Ledger({"db_path": str(tmp_path / "ledger.db")})
+    engine = MetadataEngine(ledger=ledger, ai_config={"enabled": False},
+                            async_executor=AsyncExecutor({"max_workers": 2}))
+    plugin = CMSPlugin("AsyncCMS", engine=engine)
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"upload{i}.txt"
+        path.write_text(f"upload {i}")
+        paths.append(str(path))
+
+    async def ingest():
+        results = await asyncio.gather(*(plugin.process_file_async(path) for path in paths))
+        direct = await engine.aembed_metadata(paths[0], {"compliance_tag": "GDPR"}, engine._private_key)
+        verified = await asyncio.gather(*(engine.averify_metadata(path, engine._public_key) for path in paths))
+        await engine.aflush()
+        return results, direct, verified
+
+    results, direct, verified = asyncio.run(ingest())
+    assert results == [True] * 4 and verified == [True] * 4
+    assert direct["compliance_tag"] == "GDPR"
+    # Entries went through the engine's writer and are all committed.
+    assert engine._ledger_writer is not None
+    assert ledger.get_transaction_count() == 9
+    # The shared ledger was not switched: synchronous embeds still commit
+    # before they return.
+    assert ledger._writer is None
+    engine.embed_metadata(paths[1], {"compliance_tag": "HIPAA"}, engine._private_key)
+    assert ledger.fetch_page()[-1]["file_path"] == paths[1]
+    engine.close_ledger_writer()
+    assert engine._ledger_writer is None
+    ledger.close()
+
+def test_pdf_content_digest_rejects_forged_metadata_update(tmp_path):
+    import re
+    import pikepdf
+    from adapters.pdf import _metl_update
+    pdf_path = tmp_path / "report.pdf"
+    pdf = pikepdf.new()
+    pdf.add_blank_page()
+    pdf.docinfo["/Title"] = "Quarterly report"
+    pdf.save(pdf_path)
+
+    engine = MetadataEngine(storage="embedded", ai_config={"enabled": False})
+    private_key = engine.load_private_key()
+    public_key = engine.load_public_key()
+    engine.embed_file(str(pdf_path), private_key)
+    assert engine.check_metadata(str(pdf_path), public_key)["status"] == "ok"
+    signed = pdf_path.read_bytes()
+    start = _metl_update(str(pdf_path))[0]
+    trailer = re.search(rb"trailer\n<< (.*) >>", signed[start:]).group(1)
+
+    def forge(objgen, obj):
+        # Replace METL's update with one that redefines objgen, keeping
+        # the signed metadata and the update's exact layout.
+        num, gen = objgen
+        body = signed[:start] + b"\n"
+        obj_offset = len(body)
+        body += f"{num} {gen} obj\n".encode() + obj.unparse(resolved=True) + b"\nendobj\n"
+        xref_offset = len(body)
+        fields = re.sub(rb"/Info \d+ \d+ R", f"/Info {num} {gen} R".encode(), trailer)
+        body += (f"xref\n{num} 1\n{obj_offset:010d} {gen:05d} n \ntrailer\n<< ".encode() + fields
+                 + f" >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+        pdf_path.write_bytes(body)
+
+    # Redefine the page as the "Info" object, carrying the signed JSON.
+    with pikepdf.open(str(tmp_path / "report.pdf")) as doc:
+        metadata = doc.docinfo["/METADATA_JSON"]
+        page = doc.pages[0].obj
+        forged_page = pikepdf.Dictionary({key: page[key] for key in page.keys()})
+        forged_page.MediaBox = pikepdf.Array([0, 0, 100, 100])
+        forged_page["/METADATA_JSON"] = metadata
+        page_objgen = page.objgen
+        forged_info = pikepdf.Dictionary({key: doc.docinfo[key] for key in doc.docinfo.keys()})
+        info_objgen = doc.docinfo.objgen
+    forge(page_objgen, forged_page)
+    assert _metl_update(str(pdf_path)) is None
+    assert engine.check_metadata(str(pdf_path), public_key)["status"] == "hash-mismatch"
+
+    # Changing another Info entry next to the metadata is detected too.
+    forged_info.Title = "Rewritten report"
+    forge(info_objgen, forged_info)
+    assert engine.check_metadata(str(pdf_path), public_key)["status"] == "hash-mismatch"
+
+    pdf_path.write_bytes(signed)
+    assert engine.check_metadata(str(pdf_path), public_key)["status"] == "ok"
+
+def test_ledger_checkpoints_legacy_rows_with_id_gaps(tmp_path):
+    import sqlite3
+    from core.ledger import Ledger, verify_inclusion_proof
+    private_key, public_key = generate_key_pair()
+    db_path = str(tmp_path / "legacy.db")
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, data TEXT NOT NULL, "
+                     "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)")
+        conn.executemany("INSERT INTO transactions (data) VALUES (?)", [(f"legacy {i}",) for i in range(12)])
+        conn.execute("DELETE FROM transactions WHERE id IN (3, 4, 9)")
+
+    ledger = Ledger({"db_path": db_path, "checkpoint_interval": 5}, signing_key=private_key)
+    ledger.record_many(f"entry {i}" for i in range(6))
+    result = ledger.verify_ledger(public_key)
+    assert result["valid"] and result["rows_checked"] == 15 and result["checkpoints_checked"] == 3
+    first = ledger.get_checkpoint(1)
+    assert (first["first_id"], first["last_id"]) == (1, 7)
+    assert verify_inclusion_proof(ledger.get_inclusion_proof(5), public_key)
+    assert ledger.get_inclusion_proof(4) is None
+    ledger.close()
+
+    # The chain backfill ran once; reopening does not scan for unchained rows.
+    with patch("core.ledger.Ledger._backfill_chain", side_effect=AssertionError("backfill rescanned")):
+        Ledger({"db_path": db_path}).close()